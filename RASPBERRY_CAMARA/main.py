@@ -1,8 +1,10 @@
-# optimized_pico_stream.py (doble buffer seguro con velocidad mejorada + optimizaciones extra)
+# optimized_pico_stream.py (triple buffer entre captura y envío + optimizaciones extra)
 
 import machine
+import micropython
 import time
-import urequests as requests
+import socket
+import struct
 import sys
 import ujson
 from machine import Pin, I2C, PWM, Timer
@@ -25,34 +27,50 @@ stats = {
     'total_frames': 0,
     'network_errors': 0,
     'successful_sends': 0,
-    'memory_errors': 0
+    'memory_errors': 0,
+    'capture_errors': 0,
+    'encode_time': 0,
+    'bytes_sent': 0,
+    'latency': 0
 }
 
-frame_ready = False
-current_frame_data = None
-send_in_progress = False
+codec_enabled = False   # El servidor anunció Config.FRAME_ENCODING en X-Frame-Encodings
+last_ok_seq = 0         # Último frame aceptado por el servidor (base para xor-rle)
 
-frame_buffer_a = None
-frame_buffer_b = None
-active_buffer = None
-send_buffer = None
+frame_buffers = None
+capture_started_us = 0  # time.ticks_us() al arrancar la captura en curso
 
 class Config:
     SSID = "USUBENI"
     PASSWORD = "Usubeni26"
     FLASH_SERVER_URL = "http://192.168.1.141:8000" #AJUSTAR SEGÚN SEA LA IP DEL SERVIDOR
     UPLOAD_ENDPOINT = "/upload_raw_image_flash/"
+    UPLINK_PORT = 8001  # Subidas por conexión persistente: UPLOAD_KEEPALIVE_PORT de SERVERUNIDO.py (8000 con async_server.py)
+    FRAME_TRANSPORT = "udp"  # "udp"/"tcp": fragmentos a TRANSPORT_PORT (frame_transport.py); "http": solo POST
+    TRANSPORT_PORT = 8002
+    FRAGMENT_BYTES = 1400    # Cuerpo por datagrama UDP: con las cabeceras entra en un paquete WiFi
+    TRANSPORT_FALLBACK_FRAMES = 20  # Frames seguidos sin ACK antes de volver a HTTP
+    TELEMETRY_ENDPOINT = "/telemetry"
+    TELEMETRY_INTERVAL = 10000  # ms entre reportes de telemetría (0 = no enviar)
     WIFI_TIMEOUT = 8
     WIFI_MAX_RETRIES = 2
     WIFI_RETRY_DELAY = 1
     TARGET_FPS = 20 # VALOR NO MAYOR A 20 RECOMENDADO
     FRAME_INTERVAL = 1.0 / TARGET_FPS
+    FRAME_SIZE = OV7670_WRAPPER_SIZE_DIV4  # Resolución inicial (fija con ADAPTIVE_MODE = False)
+    ADAPTIVE_MODE = True  # ModeController ajusta resolución e intervalo entre frames
+    ADAPTIVE_SIZES = (OV7670_WRAPPER_SIZE_DIV2, OV7670_WRAPPER_SIZE_DIV4, OV7670_WRAPPER_SIZE_DIV8)
+    TARGET_LATENCY_MS = 120  # De la captura hasta que el frame terminó de salir
+    MIN_FPS = 4
+    CONTROL_FRAMES = 10      # Frames entre decisiones de ModeController
+    INTERVAL_STEP_MS = 5
     CAPTURE_TIMEOUT = 10
     SEND_TIMEOUT = 120
     ENABLE_AGGRESSIVE_GC = True
     GC_THRESHOLD = 512
     MIN_FREE_MEMORY = 8192
     JPEG_QUALITY = 50
+    FRAME_ENCODING = "xor-rle"  # None = enviar siempre RGB565 crudo
     LED_PIN = "LED"
     MCLK_PIN = 9
     PCLK_PIN = 8
@@ -72,7 +90,77 @@ led_pin.value(0)
 # CPU a 250 MHz
 machine.freq(250_000_000)
 
-temp_send_buffer = None
+temp_send_buffer = None  # Salida de codificar_xor_rle; el frame crudo va directo al socket
+frame_interval = Config.FRAME_INTERVAL  # Intervalo actual entre capturas (lo ajusta ModeController)
+
+# --- Triple buffer entre captura (núcleo 0) y envío (núcleo 1) ---
+# back es donde captura la cámara, ready el último frame completo y front el
+# que está enviando el hilo de envío. La captura nunca espera al envío: al
+# terminar un frame lo cambia por ready. El envío siempre toma el más nuevo:
+# cambia front por ready. Si la captura publica antes de que el envío tome
+# el frame anterior, ese frame se cuenta como perdido (una sola vez, bajo el
+# lock). Así cada secuencia termina en successful_sends, network_errors o
+# dropped_frames, salvo las que están en ready o en front.
+#
+# Al tomar un frame, el front anterior (el último enviado) queda en ready
+# marcado como viejo. Es la base de xor-rle. take() solo cambia los buffers
+# bajo el lock y lo suelta: la codificación corre sin frenar a la captura. Si
+# mientras tanto la captura publica, esa base vuelve a ser su back y se marca
+# como perdida (base_kept() da False); el envío codifica de nuevo sin base.
+#
+# Los buffers tienen el tamaño de la mayor resolución que se va a usar. Cada
+# frame lleva su ancho y alto (ready_dims/front_dims) y take() devuelve solo
+# la parte que ocupa, así un cambio de resolución no reserva memoria.
+class TripleBuffer:
+    def __init__(self, size):
+        self.back = bytearray(size)
+        self.ready = bytearray(size)
+        self.front = bytearray(size)
+        self.ready_seq = 0
+        self.ready_ms = 0
+        self.ready_dims = (0, 0)
+        self.front_seq = 0
+        self.front_ms = 0
+        self.front_dims = (0, 0)
+        self.fresh = False
+        self.base_intact = False   # ready sigue siendo el front anterior desde el último take()
+        self.lock = _thread.allocate_lock()
+        self.available = _thread.allocate_lock()   # Libre mientras haya un frame nuevo en ready
+        self.available.acquire()
+
+    def publish(self, seq, capture_ms, dims):
+        with self.lock:
+            if self.fresh:
+                stats['dropped_frames'] += 1
+            self.back, self.ready = self.ready, self.back
+            self.ready_seq = seq
+            self.ready_ms = capture_ms
+            self.ready_dims = dims
+            self.base_intact = False
+            if not self.fresh:
+                self.fresh = True
+                self.available.release()
+
+    def take(self):
+        # Devuelve (frame, seq, capture_ms, base, base_seq); base_seq es 0 si
+        # la base no tiene la misma resolución que el frame.
+        self.available.acquire()
+        with self.lock:
+            self.front, self.ready = self.ready, self.front
+            self.front_seq, self.ready_seq = self.ready_seq, self.front_seq
+            self.front_ms, self.ready_ms = self.ready_ms, self.front_ms
+            self.front_dims, self.ready_dims = self.ready_dims, self.front_dims
+            self.fresh = False
+            self.base_intact = True
+            width, height = self.front_dims
+            base_seq = self.ready_seq if self.ready_dims == self.front_dims else 0
+            return (memoryview(self.front)[:width * height * 2], self.front_seq, self.front_ms, self.ready,
+                    base_seq)
+
+    def base_kept(self):
+        # True si la base de take() no se tocó desde entonces.
+        with self.lock:
+            return self.base_intact
 
 def setup_memory_optimizations():
     if Config.ENABLE_AGGRESSIVE_GC:
@@ -80,24 +168,27 @@ def setup_memory_optimizations():
     gc.collect()
     print(f"\uD83D\uDCBE Memoria libre inicial: {gc.mem_free()} bytes")
 
-def create_double_buffer(width, height):
-    global frame_buffer_a, frame_buffer_b, active_buffer, send_buffer, temp_send_buffer
-    buffer_size = width * height * 2
-    send_buffer_size = buffer_size + 4
-    gc.collect()
-    if gc.mem_free() < 2 * buffer_size + send_buffer_size + 10000:
-        print("❌ Memoria insuficiente para doble buffer")
-        return False
-    frame_buffer_a = bytearray(buffer_size)
-    frame_buffer_b = bytearray(buffer_size)
-    active_buffer = frame_buffer_a
-    send_buffer = frame_buffer_b
-    temp_send_buffer = bytearray(send_buffer_size)
-    return True
+def frame_dimensions(size):
+    return 640 >> size, 480 >> size
 
-def swap_buffers():
-    global active_buffer, send_buffer
-    active_buffer, send_buffer = send_buffer, active_buffer
+def create_frame_buffers(sizes):
+    # Reserva los buffers para la mayor resolución de sizes que entra en
+    # memoria. Devuelve las resoluciones utilizables, de mayor a menor (vacío
+    # si no entra ninguna).
+    global frame_buffers, temp_send_buffer
+    gc.collect()
+    for i, size in enumerate(sizes):
+        width, height = frame_dimensions(size)
+        buffer_size = width * height * 2
+        # Además del frame: margen para que codificar_xor_rle se pase un token
+        # antes de abandonar y espacio para sus controles.
+        send_buffer_size = buffer_size + 8 + 132 + buffer_size // 8 if Config.FRAME_ENCODING else 0
+        if gc.mem_free() >= 3 * buffer_size + send_buffer_size + 10000:
+            frame_buffers = TripleBuffer(buffer_size)
+            temp_send_buffer = bytearray(send_buffer_size) if send_buffer_size else None
+            return sizes[i:]
+    print("❌ Memoria insuficiente para triple buffer")
+    return ()
 
 def conectar_wifi_pico(ssid, password, timeout=8, max_retries=2):
     global wifi_connection_attempts, connection_status
@@ -141,10 +232,15 @@ def initialize_camera_pico():
         )
         ov7670.wrapper_configure_rgb()
         ov7670.wrapper_configure_base()
-        width, height = ov7670.wrapper_configure_size(OV7670_WRAPPER_SIZE_DIV4)
-        if not create_double_buffer(width, height):
+        sizes = [Config.FRAME_SIZE]
+        if Config.ADAPTIVE_MODE:
+            sizes = sorted(set(Config.ADAPTIVE_SIZES + (Config.FRAME_SIZE,)))
+        sizes = create_frame_buffers(sizes)
+        if not sizes:
             return None, None, None
-        return ov7670, width, height
+        size = Config.FRAME_SIZE if Config.FRAME_SIZE in sizes else sizes[0]
+        ov7670.wrapper_configure_size(size)
+        return ov7670, sizes, size
     except Exception as e:
         print(f"❌ Error cámara: {e}")
         return None, None, None
@@ -152,72 +248,631 @@ def initialize_camera_pico():
 def check_memory_health():
     if gc.mem_free() < Config.MIN_FREE_MEMORY:
         stats['memory_errors'] += 1
-        gc.collect()
+        collect_garbage()
         return False
     return True
 
-def capture_frame_pico(ov7670):
-    global active_buffer, stats
-    start = time.time()
+# --- Telemetría (telemetry.py en el servidor) ---
+# Tiempos medidos con ticks_us en histogramas de tamaño fijo, sin reservar
+# memoria al observar: buckets en potencias de dos, el 0 para menos de 64 µs
+# y el último para lo que no entra. Cada Config.TELEMETRY_INTERVAL ms el hilo
+# de envío los empaqueta junto con los contadores de stats en un cuerpo
+# binario fijo, los manda por el Uplink y los reinicia.
+TELEMETRY_BUCKETS = 16
+TELEMETRY_HEADER = ">2sBBII"     # "VT", versión, histogramas, secuencia del reporte, ms cubiertos
+TELEMETRY_COUNTERS = ">IIIIII"   # frames, enviados, errores de red, perdidos, errores de captura, memoria libre
+TELEMETRY_HISTOGRAM = ">III16H"  # cuenta, suma µs, máximo µs, buckets
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * TELEMETRY_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.peak = 0
+
+    def observe(self, us):
+        if us < 0:
+            us = 0
+        i = 0
+        v = us >> 6
+        while v and i < TELEMETRY_BUCKETS - 1:
+            v >>= 1
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += us
+        if us > self.peak:
+            self.peak = us
+
+    def reset(self):
+        for i in range(TELEMETRY_BUCKETS):
+            self.buckets[i] = 0
+        self.count = 0
+        self.total = 0
+        self.peak = 0
+
+class Telemetry:
+    def __init__(self):
+        self.capture = Histogram()
+        self.send = Histogram()
+        self.gc = Histogram()       # Pausas de gc.collect() en el bucle de captura
+        self.jitter = Histogram()   # Atraso del inicio de cada frame sobre frame_interval
+        self.histograms = (self.capture, self.send, self.gc, self.jitter)   # Orden de telemetry.HISTOGRAMS
+        self.lock = _thread.allocate_lock()   # Captura y envío observan desde núcleos distintos
+        self.body = bytearray(struct.calcsize(TELEMETRY_HEADER) + struct.calcsize(TELEMETRY_COUNTERS)
+                              + len(self.histograms) * struct.calcsize(TELEMETRY_HISTOGRAM))
+        self.seq = 0
+        self.since = time.ticks_ms()
+
+    def observe(self, histogram, us):
+        with self.lock:
+            histogram.observe(us)
+
+    def due(self):
+        return Config.TELEMETRY_INTERVAL and time.ticks_diff(time.ticks_ms(), self.since) >= Config.TELEMETRY_INTERVAL
+
+    def pack(self):
+        now = time.ticks_ms()
+        self.seq += 1
+        struct.pack_into(TELEMETRY_HEADER, self.body, 0, b"VT", 1, len(self.histograms), self.seq,
+                         time.ticks_diff(now, self.since))
+        offset = struct.calcsize(TELEMETRY_HEADER)
+        struct.pack_into(TELEMETRY_COUNTERS, self.body, offset, stats['total_frames'], stats['successful_sends'],
+                         stats['network_errors'], stats['dropped_frames'], stats['capture_errors'], gc.mem_free())
+        offset += struct.calcsize(TELEMETRY_COUNTERS)
+        with self.lock:
+            for histogram in self.histograms:
+                struct.pack_into(TELEMETRY_HISTOGRAM, self.body, offset, histogram.count, histogram.total,
+                                 histogram.peak, *histogram.buckets)
+                offset += struct.calcsize(TELEMETRY_HISTOGRAM)
+                histogram.reset()
+        self.since = now
+        return self.body
+
+telemetry = Telemetry()
+
+def collect_garbage():
+    start = time.ticks_us()
+    gc.collect()
+    telemetry.observe(telemetry.gc, time.ticks_diff(time.ticks_us(), start))
+
+def send_telemetry(uplink):
+    # Un reporte que no llega se pierde; no cuenta en network_errors para no
+    # confundir a ModeController.
+    try:
+        status, _ = uplink.post_telemetry(telemetry.pack())
+        if status != 200:
+            print(f"⚠️  Telemetría rechazada: {status}")
+    except Exception as e:
+        print(f"⚠️  Telemetría: {e}")
+        uplink.close()
+
+# --- Modo adaptativo: resolución e intervalo entre frames ---
+# Cada Config.CONTROL_FRAMES frames compara la latencia (record_latency) con
+# Config.TARGET_LATENCY_MS y mira si en ese tramo hubo frames perdidos o
+# errores de red. Si se pasa, alarga el intervalo un 25%; si ya está en el de
+# MIN_FPS, baja un escalón de resolución. Si sobra margen, lo acorta de a
+# INTERVAL_STEP_MS hasta el de TARGET_FPS y, ya ahí, sube de resolución solo
+# si con cuatro veces más píxeles la latencia seguiría debajo del objetivo.
+class ModeController:
+    def __init__(self, sizes, size):
+        self.sizes = sizes   # De mayor a menor resolución
+        self.index = sizes.index(size)
+        self.frames = 0
+        self.drops = stats['dropped_frames']
+        self.errors = stats['network_errors']
+
+    def update(self):
+        # Devuelve la nueva resolución (OV7670_WRAPPER_SIZE_*) o None.
+        global frame_interval
+        self.frames += 1
+        if self.frames < Config.CONTROL_FRAMES:
+            return None
+        self.frames = 0
+        congested = stats['dropped_frames'] > self.drops or stats['network_errors'] > self.errors
+        self.drops = stats['dropped_frames']
+        self.errors = stats['network_errors']
+        latency = stats['latency'] * 1000
+        slowest = 1.0 / Config.MIN_FPS
+        if congested or latency > Config.TARGET_LATENCY_MS:
+            if frame_interval < slowest:
+                frame_interval = min(slowest, frame_interval * 1.25)
+            elif self.index + 1 < len(self.sizes):
+                # Un cuarto de los píxeles: se puede volver a ir más rápido.
+                frame_interval = max(Config.FRAME_INTERVAL, frame_interval / 2)
+                return self._switch(self.index + 1)
+        elif 0 < latency < Config.TARGET_LATENCY_MS / 2:   # 0: ningún envío desde el último cambio
+            if frame_interval > Config.FRAME_INTERVAL:
+                frame_interval = max(Config.FRAME_INTERVAL, frame_interval - Config.INTERVAL_STEP_MS / 1000)
+            elif self.index > 0 and latency * 4 < Config.TARGET_LATENCY_MS:
+                return self._switch(self.index - 1)
+        return None
+
+    def _switch(self, index):
+        self.index = index
+        stats['latency'] = 0   # La media de la resolución anterior ya no sirve
+        return self.sizes[index]
+
+def record_latency(capture_ms):
+    # Desde la captura hasta que el frame terminó de salir (con HTTP y TCP
+    # incluye la respuesta del servidor). Media móvil que lee ModeController.
+    if capture_ms is None:
+        return
+    sample = time.ticks_diff(time.ticks_ms(), capture_ms) / 1000
+    stats['latency'] = 0.8 * stats['latency'] + 0.2 * sample if stats['latency'] else sample
+
+def capture_frame_pico(ov7670, buffer):
+    # Arranca la captura en buffer y devuelve time.ticks_ms() del inicio, o
+    # None si no hay memoria suficiente. El DMA llena el buffer mientras el
+    # bucle sigue; finish_capture_pico espera el final.
+    global capture_started_us
     if not check_memory_health():
         return None
-    ov7670.capture(active_buffer)
-    stats['capture_time'] = time.time() - start
-    return active_buffer
+    start = time.ticks_ms()
+    capture_started_us = time.ticks_us()
+    ov7670.capture_start(buffer)
+    return start
+
+def finish_capture_pico(ov7670):
+    # False si la cámara no completó el frame en Config.CAPTURE_TIMEOUT.
+    global stats
+    done = ov7670.capture_wait(Config.CAPTURE_TIMEOUT * 1000)
+    elapsed = time.ticks_diff(time.ticks_us(), capture_started_us)
+    stats['capture_time'] = elapsed / 1000000
+    if done:
+        telemetry.observe(telemetry.capture, elapsed)
+    return done
 
-def send_frame_pico(frame_data, width, height, seq_num, device_info):
+# --- Compresión xor-rle (ver frame_codec.py en el servidor) ---
+# XOR byte a byte con el frame anterior y RLE de los ceros. El frame anterior
+# es el ready que deja TripleBuffer.take(), así que no usa RAM extra. Los
+# literales se escriben desde salida[8] y los controles en los últimos
+# max_controles bytes de salida; al terminar, los controles se copian detrás
+# de los literales.
+@micropython.viper
+def codificar_xor_rle(actual, previo, salida, n: int, con_previo: int, max_controles: int) -> int:
+    # Deja el cuerpo (sin ancho y alto) en salida[4:] y devuelve su largo
+    # total contando esos 4 bytes, o -1 si no sale más chico que el frame
+    # crudo o no alcanzan los controles.
+    a = ptr8(actual)
+    p = ptr8(previo)
+    o = ptr8(salida)
+    limite = n + 4
+    base_controles = int(len(salida)) - max_controles
+    c = base_controles
+    k = 8
+    i = 0
+    while i < n:
+        if k + c - base_controles >= limite or c - base_controles >= max_controles:
+            return -1
+        d = a[i]
+        if con_previo:
+            d ^= p[i]
+        if d == 0:
+            run = 1
+            i += 1
+            while i < n and run < 128:
+                d = a[i]
+                if con_previo:
+                    d ^= p[i]
+                if d != 0:
+                    break
+                run += 1
+                i += 1
+            o[c] = 0x80 | (run - 1)
+            c += 1
+        else:
+            control = c
+            c += 1
+            run = 0
+            while i < n and run < 128:
+                d = a[i]
+                if con_previo:
+                    d ^= p[i]
+                if d == 0:
+                    # Un cero suelto sigue en el literal; dos seguidos lo cortan.
+                    if i + 1 >= n:
+                        break
+                    e = a[i + 1]
+                    if con_previo:
+                        e ^= p[i + 1]
+                    if e == 0:
+                        break
+                o[k] = d
+                k += 1
+                run += 1
+                i += 1
+            o[control] = run - 1
+    tokens = c - base_controles
+    if k + tokens >= limite:
+        return -1
+    j = 0
+    while j < tokens:
+        o[k + j] = o[base_controles + j]
+        j += 1
+    o[4] = (tokens >> 24) & 0xFF
+    o[5] = (tokens >> 16) & 0xFF
+    o[6] = (tokens >> 8) & 0xFF
+    o[7] = tokens & 0xFF
+    return k + tokens
+
+def encode_frame_pico(frame_data, previous, previous_seq):
+    # Devuelve (cuerpo sin ancho y alto, frame base): el frame comprimido en
+    # temp_send_buffer o, si no conviene, el propio frame_data sin copiarlo.
+    # previous es el último frame enviado (previous_seq); solo sirve de base
+    # si el servidor lo aceptó.
     global temp_send_buffer, stats
-    send_start = time.time()
+    base = 0
+    if codec_enabled:
+        if previous_seq and last_ok_seq == previous_seq:
+            base = last_ok_seq
+        start = time.ticks_us()
+        size = codificar_xor_rle(frame_data, previous, temp_send_buffer, len(frame_data), 1 if base else 0,
+                                 len(frame_data) // 8)
+        stats['encode_time'] = time.ticks_diff(time.ticks_us(), start) / 1000000
+        if size > 0:
+            return memoryview(temp_send_buffer)[4:size], base
+    return frame_data, 0
+
+# --- Enlace persistente con el servidor ---
+# Una sola conexión HTTP/1.1 keep-alive para todos los frames: sin handshake
+# TCP por frame y sin armar la URL ni un dict de cabeceras en cada envío. La
+# parte fija de la petición se arma una vez; el ancho/alto y el cuerpo se
+# escriben directo en el socket. Si la conexión reutilizada se cayó (el
+# servidor la cerró por inactividad o se reinició) se reintenta una vez con
+# una nueva. Con SERVERUNIDO.py el puerto es UPLOAD_KEEPALIVE_PORT: el
+# servidor de desarrollo de Flask cierra la conexión en cada respuesta. Los
+# reportes de telemetría (post_telemetry) van por la misma conexión.
+class Uplink:
+    def __init__(self, host, port, device_id):
+        self.host = host
+        self.port = port
+        self.address = None
+        self.sock = None
+        self.connections = 0
+        self.prefix = (f"POST {Config.UPLOAD_ENDPOINT} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                       f"Content-Type: application/octet-stream\r\nX-Device-ID: {device_id}\r\n"
+                       f"X-JPEG-Quality: {Config.JPEG_QUALITY}\r\n").encode()
+        self.telemetry_prefix = (f"POST {Config.TELEMETRY_ENDPOINT} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                                 f"Content-Type: application/octet-stream\r\nX-Device-ID: {device_id}\r\n").encode()
+        self.size_header = bytearray(4)
+        self.scratch = bytearray(128)   # Cuerpo de la respuesta (JSON corto), se descarta
+
+    def connect(self):
+        if self.address is None:
+            self.address = socket.getaddrinfo(self.host, self.port)[0][-1]
+        sock = socket.socket()
+        try:
+            sock.settimeout(Config.SEND_TIMEOUT)
+            sock.connect(self.address)
+            try:
+                # Cabeceras, ancho/alto y cuerpo van en escrituras separadas:
+                # con Nagle la última espera el ACK retardado del servidor.
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except (AttributeError, OSError):
+                pass
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self.connections += 1
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def post(self, width, height, body, headers):
+        # headers son las líneas "Nombre: valor\r\n" propias de este frame.
+        # Devuelve (código HTTP, X-Frame-Encodings).
+        self.size_header[0] = width >> 8
+        self.size_header[1] = width & 0xFF
+        self.size_header[2] = height >> 8
+        self.size_header[3] = height & 0xFF
+        request = f"Content-Length: {4 + len(body)}\r\n{headers}\r\n".encode()
+        return self._exchange((self.prefix, request, self.size_header, body))
+
+    def post_telemetry(self, body):
+        return self._exchange((self.telemetry_prefix, f"Content-Length: {len(body)}\r\n\r\n".encode(), body))
+
+    def _exchange(self, parts):
+        for attempt in range(2):
+            reused = self.sock is not None
+            if not reused:
+                self.connect()
+            try:
+                for part in parts:
+                    self._write(part)
+                return self._read_response()
+            except OSError:
+                self.close()
+                if not reused:
+                    raise
+
+    def _write(self, data):
+        data = memoryview(data)
+        sent = 0
+        while sent < len(data):
+            n = self.sock.write(data[sent:])
+            if not n:
+                raise OSError("conexión cerrada")
+            sent += n
+
+    def _read_response(self):
+        line = self.sock.readline()
+        if not line:
+            raise OSError("conexión cerrada por el servidor")
+        parts = line.split()
+        status = int(parts[1])
+        keep_alive = parts[0] == b"HTTP/1.1"
+        length = 0
+        encodings = ""
+        while True:
+            line = self.sock.readline()
+            if not line:
+                raise OSError("respuesta incompleta")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode().partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "x-frame-encodings":
+                encodings = value.strip()
+            elif name == "connection":
+                keep_alive = value.strip().lower() != "close"
+        while length > 0:
+            n = self.sock.readinto(self.scratch, min(length, len(self.scratch)))
+            if not n:
+                raise OSError("respuesta incompleta")
+            length -= n
+        if not keep_alive:
+            self.close()
+        return status, encodings
+
+def server_host():
+    return Config.FLASH_SERVER_URL.split("://", 1)[-1].split("/", 1)[0].split(":", 1)[0]
+
+# --- Transporte por fragmentos (frame_transport.py en el servidor) ---
+# Sin HTTP: cada frame sale como un fragmento con los metadatos (lo que en
+# HTTP son las cabeceras) y fragmentos con el cuerpo, todos con la secuencia,
+# el índice y la cantidad. Por UDP el cuerpo se corta en FRAGMENT_BYTES; por
+# TCP va en un solo fragmento escrito directo desde el frame. El servidor
+# responde cada frame con un ACK: por UDP se leen sin bloquear antes de
+# codificar el siguiente (un frame sin ACK todavía no sirve de base); por TCP
+# se espera como la respuesta HTTP. Un frame cuyo ACK no llegó antes del
+# siguiente envío se cuenta en network_errors.
+FRAGMENT_HEADER = ">2sBBIHH"   # "VF", versión, flags, secuencia, índice, cantidad
+FRAME_META = ">HHIIIIIBH"      # ancho, alto, bytes del cuerpo, base, memoria, captura/envío ms, calidad, intervalo ms
+ACK_FORMAT = ">2sIBB"          # "VA", secuencia, estado (0 = aceptado), códecs (bit 0 = xor-rle)
+FRAGMENT_HEADER_SIZE = struct.calcsize(FRAGMENT_HEADER)
+FRAME_META_SIZE = struct.calcsize(FRAME_META)
+ACK_SIZE = struct.calcsize(ACK_FORMAT)
+
+class FragmentLink:
+    def __init__(self, host, port, device_id, tcp):
+        self.host = host
+        self.port = port
+        self.tcp = tcp
+        self.address = None
+        self.sock = None
+        self.poller = None
+        device_id = device_id.encode()
+        self.meta = bytearray(FRAGMENT_HEADER_SIZE + FRAME_META_SIZE + len(device_id))
+        self.meta[FRAGMENT_HEADER_SIZE + FRAME_META_SIZE:] = device_id
+        self.header = bytearray(FRAGMENT_HEADER_SIZE)
+        self.length = bytearray(4)
+        self.datagram = None if tcp else bytearray(FRAGMENT_HEADER_SIZE + Config.FRAGMENT_BYTES)
+        self.ack = bytearray(ACK_SIZE)
+        self.pending = 0    # Secuencia enviada que espera su ACK
+        self.unacked = 0    # Frames seguidos sin ACK
+        self.connections = 0
+
+    def connect(self):
+        if self.address is None:
+            self.address = socket.getaddrinfo(self.host, self.port)[0][-1]
+        if self.tcp:
+            sock = socket.socket()
+            try:
+                sock.settimeout(Config.SEND_TIMEOUT)
+                sock.connect(self.address)
+            except OSError:
+                sock.close()
+                raise
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except (AttributeError, OSError):
+                pass
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.poller = uselect.poll()
+            self.poller.register(sock, uselect.POLLIN)
+        self.sock = sock
+        self.connections += 1
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+            self.poller = None
+
+    def send(self, body, width, height, base, seq_num, capture_ms, encoded):
+        if self.pending:
+            stats['network_errors'] += 1
+            self.unacked += 1
+        self.pending = seq_num
+        if self.sock is None:
+            self.connect()
+        body = memoryview(body)
+        flags = 1 if encoded else 0
+        chunk = len(body) if self.tcp else Config.FRAGMENT_BYTES
+        count = 1 + (len(body) + chunk - 1) // chunk
+        struct.pack_into(FRAGMENT_HEADER, self.meta, 0, b"VF", 2, flags, seq_num, 0, count)
+        struct.pack_into(FRAME_META, self.meta, FRAGMENT_HEADER_SIZE, width, height, len(body), base,
+                         gc.mem_free(), capture_ms or 0, time.ticks_ms(), Config.JPEG_QUALITY,
+                         int(frame_interval * 1000))
+        self._send_fragment(self.meta)
+        index = 1
+        offset = 0
+        while offset < len(body):
+            struct.pack_into(FRAGMENT_HEADER, self.header, 0, b"VF", 2, flags, seq_num, index, count)
+            self._send_fragment(self.header, body[offset:offset + chunk])
+            offset += chunk
+            index += 1
+        if self.tcp:
+            got = 0
+            while got < ACK_SIZE:
+                n = self.sock.readinto(memoryview(self.ack)[got:])
+                if not n:
+                    raise OSError("conexión cerrada por el servidor")
+                got += n
+            self.on_ack(self.ack)
+
+    def _send_fragment(self, header, payload=None):
+        size = len(header) + (len(payload) if payload is not None else 0)
+        if self.tcp:
+            struct.pack_into(">I", self.length, 0, size)
+            self._write(self.length)
+            self._write(header)
+            if payload is not None:
+                self._write(payload)
+            return
+        if payload is None:
+            datagram = header
+        else:
+            self.datagram[:len(header)] = header
+            self.datagram[len(header):size] = payload
+            datagram = memoryview(self.datagram)[:size]
+        try:
+            self.sock.sendto(datagram, self.address)
+        except OSError:
+            # Sin buffers libres en la pila de red: se reintenta una vez.
+            time.sleep_ms(2)
+            self.sock.sendto(datagram, self.address)
+
+    def _write(self, data):
+        data = memoryview(data)
+        sent = 0
+        while sent < len(data):
+            n = self.sock.write(data[sent:])
+            if not n:
+                raise OSError("conexión cerrada")
+            sent += n
+
+    def poll_acks(self):
+        # UDP: procesa los ACK que ya llegaron, sin esperar.
+        while self.poller and self.poller.poll(0):
+            self.on_ack(self.sock.recv(ACK_SIZE))
+
+    def on_ack(self, data):
+        global codec_enabled, last_ok_seq
+        if len(data) != ACK_SIZE:
+            return
+        magic, seq_num, status, encodings = struct.unpack(ACK_FORMAT, data)
+        if magic != b"VA" or seq_num != self.pending:
+            return
+        self.pending = 0
+        self.unacked = 0
+        if Config.FRAME_ENCODING and encodings & 1:
+            codec_enabled = True
+        ok = status == 0
+        last_ok_seq = seq_num if ok else 0
+        stats['successful_sends' if ok else 'network_errors'] += 1
+
+def send_frame_fragments(link, body, width, height, base, seq_num, capture_ms=None):
+    send_start = time.ticks_us()
     try:
-        temp_send_buffer[0:2] = width.to_bytes(2, 'big')
-        temp_send_buffer[2:4] = height.to_bytes(2, 'big')
-        temp_send_buffer[4:] = frame_data
-        headers = {
-            "Content-Type": "application/octet-stream",
-            "X-Device-ID": device_info['device_id'],
-            "X-Sequence": str(seq_num),
-            "X-Memory": str(gc.mem_free())
-        }
-        url = f"{Config.FLASH_SERVER_URL}{Config.UPLOAD_ENDPOINT}"
-        resp = requests.post(url, data=temp_send_buffer, headers=headers, timeout=Config.SEND_TIMEOUT)
-        ok = resp.status_code in [200, 201]
-        resp.close()
-        stats['send_time'] = time.time() - send_start
+        link.send(body, width, height, base, seq_num, capture_ms, len(body) < width * height * 2)
+        elapsed = time.ticks_diff(time.ticks_us(), send_start)
+        stats['send_time'] = elapsed / 1000000
+        telemetry.observe(telemetry.send, elapsed)
+        record_latency(capture_ms)
+        stats['bytes_sent'] = 4 + len(body)
+        return True
+    except Exception as e:
+        # Sin ACK: el frame se cuenta como error en el próximo envío.
+        print(f"❌ Error envío: {e}")
+        link.close()
+        return False
+
+def send_frame_pico(uplink, body, width, height, base, seq_num, capture_ms=None):
+    global stats, codec_enabled, last_ok_seq
+    send_start = time.ticks_us()
+    try:
+        headers = (f"X-Sequence: {seq_num}\r\nX-Memory: {gc.mem_free()}\r\n"
+                   f"X-Frame-Interval-Ms: {int(frame_interval * 1000)}\r\n")
+        if capture_ms is not None:
+            # El servidor resta ambos ticks para saber cuánto esperó el frame
+            # en la cámara antes de salir.
+            headers += f"X-Capture-Ms: {capture_ms}\r\nX-Send-Ms: {time.ticks_ms()}\r\n"
+        if len(body) < width * height * 2:
+            headers += f"X-Encoding: {Config.FRAME_ENCODING}\r\nX-Base-Sequence: {base}\r\n"
+        status, encodings = uplink.post(width, height, body, headers)
+        ok = status in (200, 201)
+        if Config.FRAME_ENCODING and not codec_enabled:
+            codec_enabled = Config.FRAME_ENCODING in encodings.split(",")
+        # Un rechazo (409: el servidor perdió la base) hace que el próximo
+        # frame salga sin base.
+        last_ok_seq = seq_num if ok else 0
+        elapsed = time.ticks_diff(time.ticks_us(), send_start)
+        stats['send_time'] = elapsed / 1000000
+        stats['bytes_sent'] = 4 + len(body)
         stats['successful_sends' if ok else 'network_errors'] += 1
+        if ok:
+            telemetry.observe(telemetry.send, elapsed)
+            record_latency(capture_ms)
         return ok
     except Exception as e:
         print(f"❌ Error envío: {e}")
+        uplink.close()
         stats['network_errors'] += 1
+        last_ok_seq = 0
         return False
 
-def sender_thread_pico(width, height, device_info):
-    global frame_ready, current_frame_data, send_in_progress, send_buffer
+def sender_thread_pico(frames, link, uplink):
+    # link es FragmentLink o, con FRAME_TRANSPORT = "http", el mismo uplink.
     print("📤 Hilo de envío iniciado")
     while True:
         try:
-            if frame_ready and not send_in_progress:
-                send_in_progress = True
-                try:
-                    if current_frame_data and send_buffer:
-                        send_frame_pico(send_buffer, width, height, current_frame_data, device_info)
-                    else:
-                        stats['dropped_frames'] += 1
-                finally:
-                    frame_ready = False
-                    send_in_progress = False
-            time.sleep(0.002)  # reducido de 0.005 a 0.002
+            if link is not uplink and link.unacked >= Config.TRANSPORT_FALLBACK_FRAMES:
+                print("⚠️  El servidor no confirma los fragmentos, se vuelve a HTTP")
+                link.close()
+                link = uplink
+            # Bloquea en el lock hasta que la captura publique un frame.
+            frame, seq_num, capture_ms, previous, previous_seq = frames.take()
+            if link is not uplink:
+                link.poll_acks()
+            width, height = frames.front_dims
+            body, base = encode_frame_pico(frame, previous, previous_seq)
+            if base and not frames.base_kept():
+                # La captura reutilizó la base mientras se codificaba.
+                body, base = encode_frame_pico(frame, previous, 0)
+            # Sin copia: frame (front) es solo del hilo de envío hasta el
+            # próximo take().
+            if link is uplink:
+                send_frame_pico(uplink, body, width, height, base, seq_num, capture_ms)
+            else:
+                send_frame_fragments(link, body, width, height, base, seq_num, capture_ms)
+            if telemetry.due():
+                send_telemetry(uplink)
         except Exception as e:
             print(f"❌ Error hilo envío: {e}")
-            send_in_progress = False
+            stats['network_errors'] += 1
             time.sleep(0.05)
 
 def print_pico_stats():
     free_mem = gc.mem_free()
     efficiency = (stats['successful_sends'] / max(1, stats['total_frames'])) * 100
-    print(f"\n📊 FPS: {stats['fps']:.1f} | Mem: {free_mem//1024}KB | Cap: {stats['capture_time']*1000:.0f}ms | Send: {stats['send_time']*1000:.0f}ms | Drops: {stats['dropped_frames']} | Eff: {efficiency:.0f}%")
+    print(f"\n📊 FPS: {stats['fps']:.1f} | Mem: {free_mem//1024}KB | Cap: {stats['capture_time']*1000:.0f}ms | Send: {stats['send_time']*1000:.0f}ms | Lat: {stats['latency']*1000:.0f}ms | Drops: {stats['dropped_frames']} | Errs: {stats['network_errors']} | Eff: {efficiency:.0f}% | Enc: {stats['encode_time']*1000:.1f}ms | {stats['bytes_sent']//1024}KB/frame")
 
 def main_pico_stream():
-    global image_sequence_number, stats, frame_ready, current_frame_data, send_in_progress
+    global image_sequence_number, stats
     print("🚀 Iniciando streaming...")
     setup_memory_optimizations()
     wlan = conectar_wifi_pico(Config.SSID, Config.PASSWORD)
@@ -228,57 +883,78 @@ def main_pico_stream():
         'ip': wlan.ifconfig()[0],
         'mac': ubinascii.hexlify(wlan.config('mac')).decode()
     }
-    ov7670, width, height = initialize_camera_pico()
+    ov7670, sizes, size = initialize_camera_pico()
     if not ov7670:
         return
-    _thread.start_new_thread(sender_thread_pico, (width, height, device_info))
-    last_frame_time = time.time()
+    width, height = frame_dimensions(size)
+    controller = ModeController(sizes, size) if Config.ADAPTIVE_MODE else None
+    uplink = Uplink(server_host(), Config.UPLINK_PORT, device_info['device_id'])
+    link = uplink
+    if Config.FRAME_TRANSPORT in ("udp", "tcp"):
+        link = FragmentLink(server_host(), Config.TRANSPORT_PORT, device_info['device_id'],
+                            Config.FRAME_TRANSPORT == "tcp")
+    _thread.start_new_thread(sender_thread_pico, (frame_buffers, link, uplink))
+    last_frame_us = time.ticks_us()
     while True:
         try:
-            current_time = time.time()
-            elapsed_time = current_time - last_frame_time
-            if elapsed_time < Config.FRAME_INTERVAL:
-                time.sleep(Config.FRAME_INTERVAL - elapsed_time)
-                current_time = time.time()
-                elapsed_time = current_time - last_frame_time
-            stats['fps'] = 1.0 / elapsed_time if elapsed_time > 0 else float('inf')
-            last_frame_time = current_time
+            interval_us = int(frame_interval * 1000000)
+            elapsed_us = time.ticks_diff(time.ticks_us(), last_frame_us)
+            if elapsed_us < interval_us:
+                time.sleep_us(interval_us - elapsed_us)
+            now_us = time.ticks_us()
+            elapsed_us = time.ticks_diff(now_us, last_frame_us)
+            # Atraso sobre el intervalo: sleep_us que se pasa o una vuelta más
+            # larga que el intervalo.
+            telemetry.observe(telemetry.jitter, elapsed_us - interval_us)
+            stats['fps'] = 1000000 / elapsed_us if elapsed_us > 0 else 0
+            last_frame_us = now_us
+            if not check_memory_health():
+                collect_garbage()
+                time.sleep(0.05)
+                continue
+            # back es solo de la captura: no hace falta el lock hasta publicar.
+            # Mientras el DMA lo llena, este núcleo imprime estadísticas, junta
+            # basura y revisa el WiFi en vez de esperar.
+            capture_ms = capture_frame_pico(ov7670, memoryview(frame_buffers.back)[:width * height * 2])
+            if image_sequence_number > 0 and image_sequence_number % Config.STATS_INTERVAL == 0:
+                print_pico_stats()
+            if image_sequence_number > 0 and image_sequence_number % Config.GC_INTERVAL == 0:
+                collect_garbage()
+            led_pin.value(1 if image_sequence_number % 8 < 4 else 0)
             if not wlan.isconnected():
+                # La reconexión tarda segundos: el frame en curso ya no sirve.
+                ov7670.capture_stop()
                 print("⚠️  WiFi perdido, reconectando...")
                 wlan = conectar_wifi_pico(Config.SSID, Config.PASSWORD)
                 if not wlan:
                     time.sleep(1)
                     continue
                 device_info['ip'] = wlan.ifconfig()[0]
-            if not check_memory_health():
-                gc.collect()
-                time.sleep(0.05)
                 continue
-            if not frame_ready:
-                frame_data = capture_frame_pico(ov7670)
-                if frame_data:
-                    swap_buffers()
-                    image_sequence_number += 1
-                    stats['total_frames'] += 1
-                    current_frame_data = image_sequence_number
-                    frame_ready = True
-                else:
-                    stats['dropped_frames'] += 1
-            if image_sequence_number > 0 and image_sequence_number % Config.STATS_INTERVAL == 0:
-                print_pico_stats()
-            if image_sequence_number > 0 and image_sequence_number % Config.GC_INTERVAL == 0:
-                gc.collect()
-            led_pin.value(1 if image_sequence_number % 8 < 4 else 0)
+            if capture_ms is not None and finish_capture_pico(ov7670):
+                image_sequence_number += 1
+                stats['total_frames'] += 1
+                frame_buffers.publish(image_sequence_number, capture_ms, (width, height))
+            else:
+                stats['capture_errors'] += 1
+            # Entre capturas: el DMA está parado y se puede reconfigurar el sensor.
+            size = controller.update() if controller else None
+            if size is not None:
+                width, height = ov7670.wrapper_configure_size(size)
+                print(f"🎚️  Modo: {width}x{height}, {1 / frame_interval:.1f} FPS")
         except KeyboardInterrupt:
             break
         except Exception as e:
             print(f"❌ Error en bucle: {e}")
-            stats['dropped_frames'] += 1
+            stats['capture_errors'] += 1
             time.sleep(0.1)
+    ov7670.capture_stop()
     led_pin.value(0)
     print("✅ Streaming detenido")
     print(f"📊 Frames totales: {stats['total_frames']}")
     print(f"📤 Enviados: {stats['successful_sends']}")
+    print(f"❌ Errores de envío: {stats['network_errors']}")
+    print(f"🔌 Conexiones al servidor: {uplink.connections}")
     print(f"📉 Perdidos: {stats['dropped_frames']}")
 
 if __name__ == "__main__":
@@ -187,7 +187,12 @@ class OV7670:
             wrap()
         self.sm = rp2.StateMachine(0, pio_capture, in_base=machine.Pin(data_pin_base))
         self.dma = rp2.DMA()
-        self.dma_ctrl = self.dma.pack_ctrl(inc_read=False, treq_sel=4)
+        self.dma_ctrl_irq = self.dma.pack_ctrl(inc_read=False, treq_sel=4, irq_quiet=False)
+        self.dma_pong = None  # Second channel for capture_stream(), allocated on first use.
+        self.capture_buffers = ()
+        self.capture_callback = None
+        self.capturing = False
+        self.streaming = False
 
     def write_register(self, reg: int, value: int):
         self.i2c.writeto(self.i2c_id, bytearray([reg, value]))
@@ -197,17 +202,97 @@ class OV7670:
         return self.i2c.readfrom(self.i2c_id, 1)[0]
 
     def capture(self, buf: bytearray):
+        self.capture_start(buf)
+        self.capture_wait()
+
+    def capture_start(self, buf: bytearray, callback=None):
+        # Start capturing one frame into buf and return right away. Poll
+        # capture_done() or block in capture_wait(); if given, callback(buf)
+        # is scheduled from the DMA completion IRQ.
+        self.capture_stop()
+        self.capture_buffers = (buf,)
+        self.capture_callback = callback
         self.dma.config(
             read=self.sm,
             write=buf,
             count=len(buf)//4,
             trigger=False,
-            ctrl=self.dma_ctrl,
+            ctrl=self.dma_ctrl_irq,
         )
-        self.sm.active(0)
+        # The completion IRQ is raised even without a callback: it is what
+        # wakes capture_wait() from machine.idle().
+        self.dma.irq(self._capture_irq)
         self.sm.restart()
         self.sm.active(1)
+        self.capturing = True
         self.dma.active(1)
-        while self.dma.active():
-            pass
-        self.sm.active(0)
\ No newline at end of file
+
+    def capture_done(self) -> bool:
+        # Completion flag for capture_start(). Stops the state machine once
+        # the DMA has written the whole frame.
+        if self.capturing and not self.dma.active():
+            self.sm.active(0)
+            self.capturing = False
+        return not self.capturing and not self.streaming
+
+    def capture_wait(self, timeout_ms: Optional[int] = None) -> bool:
+        # Block until the frame from capture_start() is complete. The core
+        # sleeps in machine.idle() between checks and wakes on the DMA
+        # completion IRQ (or the next tick). If the sensor stops clocking (no
+        # VSYNC/PCLK) the capture is aborted after timeout_ms and False is
+        # returned.
+        start = time.ticks_ms()
+        while not self.capture_done():
+            if timeout_ms is not None and time.ticks_diff(time.ticks_ms(), start) > timeout_ms:
+                self.capture_stop()
+                return False
+            machine.idle()
+        return True
+
+    def capture_stream(self, buf_a: bytearray, buf_b: bytearray, callback):
+        # Capture continuously into buf_a, buf_b, buf_a, ... with two DMA
+        # channels chained to each other, so no pixels are lost between
+        # frames. callback(buf) is scheduled each time a buffer is full and
+        # must be done with it before the other one fills (one frame time).
+        # Frames stay aligned because every frame is exactly len(buf) bytes.
+        self.capture_stop()
+        if self.dma_pong is None:
+            self.dma_pong = rp2.DMA()
+        self.capture_buffers = (buf_a, buf_b)
+        self.capture_callback = callback
+        for dma, other, buf in ((self.dma, self.dma_pong, buf_a), (self.dma_pong, self.dma, buf_b)):
+            dma.config(
+                read=self.sm,
+                write=buf,
+                count=len(buf)//4,
+                trigger=False,
+                ctrl=dma.pack_ctrl(inc_read=False, treq_sel=4, irq_quiet=False, chain_to=other.channel),
+            )
+            dma.irq(self._capture_irq)
+        self.sm.restart()
+        self.sm.active(1)
+        self.streaming = True
+        self.dma.active(1)
+
+    def capture_stop(self):
+        # Abort whatever capture_start()/capture_stream() left running.
+        self.streaming = False
+        self.capturing = False
+        self.dma.active(0)
+        if self.dma_pong is not None:
+            self.dma_pong.active(0)
+        self.sm.active(0)
+
+    def _capture_irq(self, dma):
+        if self.streaming:
+            # The finished channel's write address has run past the end of
+            # its buffer: rewind it so the next chain trigger starts over.
+            buf = self.capture_buffers[0 if dma is self.dma else 1]
+            dma.write = buf
+            dma.count = len(buf)//4
+        elif self.capturing and self.capture_done():
+            buf = self.capture_buffers[0]
+        else:
+            return  # Stopped before the scheduled handler ran.
+        if self.capture_callback is not None:
+            self.capture_callback(buf)
@@ -3,6 +3,9 @@ import machine
 import time
 import uasyncio as asyncio
 import _thread
+import socket
+import struct
+import uselect
 from motor_controller import MotorController
 from robot_arm_controller import BrazoRobotico
 from my_oled_lib import MyOLED
@@ -64,60 +67,176 @@ def parse_query_string(query):
             params[key] = value
     return params
 
+# --- Ejecución de comandos ---
+def mover_carro(direction):
+    mostrar_mensaje_oled("Motor:", direction)
+
+    if direction == "forward":
+        carro.avanzar_continuo()
+    elif direction == "backward":
+        carro.retroceder_continuo()
+    elif direction == "left":
+        carro.girar_izquierda_continuo()
+    elif direction == "right":
+        carro.girar_derecha_continuo()
+    elif direction == "stop":
+        carro.detener()
+    else:
+        print("Dirección inválida:", direction)
+
+def mover_brazo_posicion(angulos):
+    try:
+        brazo.mover_brazo(angulos, tiempo_segundos=2.2)
+    except Exception as e:
+        print("Error al mover brazo:", e)
+
+def accion_brazo(accion):
+    mostrar_mensaje_oled("Brazo:", accion)
+
+    if accion == "alzar":
+        _thread.start_new_thread(mover_brazo_posicion, ([15, 90, 90],))
+    elif accion == "recoger":
+        _thread.start_new_thread(mover_brazo_posicion, ([15, 0, 90],))
+    else:
+        print("Acción de brazo no válida:", accion)
+
+def procesar_comando(path):
+    if path.startswith("/motor"):
+        if "?" in path:
+            _, query = path.split("?", 1)
+            params = parse_query_string(query)
+            mover_carro(params.get("dir", ""))
+
+    elif path.startswith("/brazo"):
+        if "?" in path:
+            _, query = path.split("?", 1)
+            params = parse_query_string(query)
+            accion_brazo(params.get("accion", ""))
+
+# --- Teleoperación por UDP ---
+# Paquete de 12 bytes (big-endian): "CT", versión, sesión (u16), secuencia
+# (u32), dirección (0 = sin cambio), velocidad (% de la calibrada, 0 = sin
+# cambio) y acción del brazo (0 = ninguna). Se aplica solo si la secuencia es mayor que la última de la
+# sesión: los duplicados y los paquetes atrasados se descartan y siempre gana
+# el comando más reciente. Cada paquete válido (aceptado o repetido) se
+# confirma con "CA" + sesión + secuencia. Una sesión reemplazada queda en
+# udp_sesiones_viejas: sus paquetes atrasados no la reactivan, salvo uno con
+# secuencia 1 (un servidor reiniciado que sorteó el mismo número).
+UDP_PORT = 8081
+UDP_MAGIC = b"CT"
+UDP_ACK_MAGIC = b"CA"
+UDP_VERSION = 1
+UDP_FORMAT = ">2sBHIBBB"
+UDP_ACK_FORMAT = ">2sHI"
+UDP_DIRECCIONES = (None, "stop", "forward", "backward", "left", "right")
+UDP_ACCIONES = (None, "alzar", "recoger")
+UDP_SESIONES_VIEJAS = 4
+UDP_ESPERA_MS = 10   # Pausa entre consultas al socket cuando no llegó nada
+
+udp_sesion = None
+udp_ultima_seq = 0
+udp_sesiones_viejas = []
+udp_stats = {'aceptados': 0, 'duplicados': 0, 'invalidos': 0, 'atrasados': 0}
+
+def procesar_paquete_udp(data, confirmar):
+    # confirmar(sesion, seq) envía el ACK; se llama antes de ejecutar el
+    # comando para que la pantalla OLED no retrase la confirmación.
+    global udp_sesion, udp_ultima_seq
+    if len(data) != struct.calcsize(UDP_FORMAT):
+        udp_stats['invalidos'] += 1
+        return
+    magic, version, sesion, seq, direccion, velocidad, accion = struct.unpack(UDP_FORMAT, data)
+    if magic != UDP_MAGIC or version != UDP_VERSION or direccion >= len(UDP_DIRECCIONES) or accion >= len(UDP_ACCIONES):
+        udp_stats['invalidos'] += 1
+        return
+    if sesion != udp_sesion:
+        if sesion in udp_sesiones_viejas:
+            if seq != 1:
+                udp_stats['atrasados'] += 1
+                return
+            udp_sesiones_viejas.remove(sesion)
+        if udp_sesion is not None:
+            udp_sesiones_viejas.append(udp_sesion)
+            if len(udp_sesiones_viejas) > UDP_SESIONES_VIEJAS:
+                udp_sesiones_viejas.pop(0)
+        udp_sesion = sesion
+        udp_ultima_seq = 0
+    confirmar(sesion, seq)
+    if seq <= udp_ultima_seq:
+        udp_stats['duplicados'] += 1
+        return
+    udp_ultima_seq = seq
+    udp_stats['aceptados'] += 1
+
+    if velocidad:
+        carro.set_velocidad(velocidad)
+    if UDP_DIRECCIONES[direccion]:
+        mover_carro(UDP_DIRECCIONES[direccion])
+    if UDP_ACCIONES[accion]:
+        accion_brazo(UDP_ACCIONES[accion])
+
+async def servidor_udp():
+    # Se consulta el socket con uselect.poll sin bloquear; si no hay nada la
+    # tarea duerme UDP_ESPERA_MS y el bucle atiende al servidor HTTP. Los
+    # paquetes que llegaron juntos se procesan seguidos, sin pausa.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("0.0.0.0", UDP_PORT))
+    sock.setblocking(False)
+    poller = uselect.poll()
+    poller.register(sock, uselect.POLLIN)
+    print("Teleoperación UDP en puerto", UDP_PORT)
+    while True:
+        if not poller.poll(0):
+            await asyncio.sleep_ms(UDP_ESPERA_MS)
+            continue
+        try:
+            data, addr = sock.recvfrom(32)
+        except OSError:
+            continue
+        try:
+            procesar_paquete_udp(data, lambda sesion, seq: sock.sendto(
+                struct.pack(UDP_ACK_FORMAT, UDP_ACK_MAGIC, sesion, seq), addr))
+        except Exception as e:
+            print("Error en servidor_udp:", e)
+
 # --- Manejo del cliente web (comandos) ---
+# HTTP/1.1 con keep-alive: el servidor mantiene la conexión abierta y envía
+# varios comandos por ella sin repetir el handshake TCP sobre WiFi.
+KEEPALIVE_TIMEOUT = 30
+
+async def leer_cabeceras(reader):
+    # Consume las cabeceras y devuelve True/False según "Connection", o None
+    # si no viene.
+    connection = None
+    while True:
+        line = await reader.readline()
+        if not line or line == b"\r\n":
+            return connection
+        nombre, _, valor = line.decode().partition(":")
+        if nombre.strip().lower() == "connection":
+            connection = valor.strip().lower() == "keep-alive"
+
 async def handle_client(reader, writer):
     try:
-        request_line = await reader.readline()
-        if not request_line:
-            await writer.aclose()
-            return
-
-        method, path, _ = request_line.decode().split()
-        print("Solicitud recibida:", path)
-
-        if path.startswith("/motor"):
-            if "?" in path:
-                _, query = path.split("?", 1)
-                params = parse_query_string(query)
-                direction = params.get("dir", "")
-
-                mostrar_mensaje_oled("Motor:", direction)
-
-                if direction == "forward":
-                    carro.avanzar_continuo()
-                elif direction == "backward":
-                    carro.retroceder_continuo()
-                elif direction == "left":
-                    carro.girar_izquierda_continuo()
-                elif direction == "right":
-                    carro.girar_derecha_continuo()
-                elif direction == "stop":
-                    carro.detener()
-                else:
-                    print("Dirección inválida:", direction)
-
-        elif path.startswith("/brazo"):
-            if "?" in path:
-                _, query = path.split("?", 1)
-                params = parse_query_string(query)
-                accion = params.get("accion", "")
-
-                mostrar_mensaje_oled("Brazo:", accion)
-
-                def mover_brazo_posicion(angulos):
-                    try:
-                        brazo.mover_brazo(angulos, tiempo_segundos=2.2)
-                    except Exception as e:
-                        print("Error al mover brazo:", e)
-
-                if accion == "alzar":
-                    _thread.start_new_thread(mover_brazo_posicion, ([15, 90, 90],))
-                elif accion == "recoger":
-                    _thread.start_new_thread(mover_brazo_posicion, ([15, 0, 90],))
-                else:
-                    print("Acción de brazo no válida:", accion)
-
-        await writer.awrite("HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\n\r\nOK")
+        while True:
+            try:
+                request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+            except asyncio.TimeoutError:
+                break
+            if not request_line:
+                break
+
+            method, path, version = request_line.decode().split()
+            connection = await leer_cabeceras(reader)
+            keep_alive = connection if connection is not None else version == "HTTP/1.1"
+            print("Solicitud recibida:", path)
+
+            procesar_comando(path)
+
+            await writer.awrite("HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\n"
+                                "Connection: " + ("keep-alive" if keep_alive else "close") + "\r\n\r\nOK")
+            if not keep_alive:
+                break
 
     except Exception as e:
         print("Error en handle_client:", e)
@@ -129,6 +248,7 @@ async def iniciar_servidor_web():
     mostrar_mensaje_oled("Servidor:", "Escuchando en", "puerto 8080")
     print("Iniciando servidor en puerto 8080...")
     server = await asyncio.start_server(handle_client, "0.0.0.0", 8080)
+    asyncio.create_task(servidor_udp())
     while True:
         await asyncio.sleep(1)
 
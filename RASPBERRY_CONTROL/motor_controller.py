@@ -54,8 +54,13 @@ class MotorController:
             self.in4.value(0)
     
     def _ajustar_velocidad(self, ajuste_temp_a=1.0, ajuste_temp_b=1.0):
-        self.ena.duty_u16(int(self.velocidad_a * ajuste_temp_a))
-        self.enb.duty_u16(int(self.velocidad_b * ajuste_temp_b))
+        self.ena.duty_u16(min(65535, int(self.velocidad_a * ajuste_temp_a)))
+        self.enb.duty_u16(min(65535, int(self.velocidad_b * ajuste_temp_b)))
+
+    def set_velocidad(self, porcentaje):
+        # Porcentaje de la velocidad calibrada; se aplica en el siguiente movimiento.
+        self.velocidad_a = int(VELOCIDAD_BASE * AJUSTE_MOTOR_A * porcentaje / 100)
+        self.velocidad_b = int(VELOCIDAD_BASE * AJUSTE_MOTOR_B * porcentaje / 100)
 
     # --- Métodos internos de movimiento ---
     def avanzar_continuo(self):
@@ -1,56 +1,137 @@
+import asyncio
+import hashlib
+import json
 import os
+import random
+import re
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, request, send_from_directory, jsonify, make_response, render_template_string
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from flask import Flask, Response, abort, request, send_from_directory, jsonify, make_response, render_template_string
 import requests
+from requests.adapters import HTTPAdapter
+from image_utils import (rgb565_to_bgr888_buffer, encode_bmp, encode_image, available_formats, negotiate_format,
+                         downscale_rgb565, rgb565_difference, BmpStreamEncoder, IMAGE_MIMETYPES)
+from frame_store import Frame, FrameRing, DeviceRegistry, DiskWriter, RetentionManager, LRUCache
+from frame_archive import FrameArchive
+from frame_codec import ENCODINGS as FRAME_ENCODINGS, decode_xor_rle
+import frame_transport
+import telemetry
+from metrics import MetricsRegistry, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 app = Flask(__name__)
+MAX_UPLOAD_BYTES = 4 * 1024 * 1024   # 640x480 RGB565 ocupa 600 KB
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
 
 # --- Configuración ---
 IMAGE_DIR = "imagenes"
 os.makedirs(IMAGE_DIR, exist_ok=True)
 last_saved_image = None
+RING_SIZE = 60            # Frames que se conservan en memoria
+PERSIST_TO_DISK = True    # Guardar además cada frame en disco
+PERSIST_FORMAT = "archive"  # "archive": segmentos en ARCHIVE_DIR; "bmp": un BMP por frame en IMAGE_DIR
+PERSIST_QUEUE_SIZE = 64
+ARCHIVE_DIR = "archivo"
+ARCHIVE_SEGMENT_BYTES = 64 * 1024 * 1024
+ARCHIVE_SEGMENT_SECONDS = 600
+RETENTION_MAX_BYTES = 2 * 1024 ** 3   # Cuota en disco (None = sin límite)
+RETENTION_MAX_AGE = 24 * 3600         # Segundos (None = sin límite)
+RETENTION_INTERVAL = 30
+DEDUP_ENABLED = False     # Frames casi idénticos al anterior reutilizan sus píxeles (descarta cambios chicos)
+DEDUP_THRESHOLD = 0.001   # Diferencia media por canal (0..1) por debajo de la cual se deduplica
+DEDUP_SAMPLE_STEP = 1     # Se compara uno de cada N píxeles (1 = todos)
+UPLOAD_CHUNK_BYTES = 16 * 1024   # Bloque de lectura/conversión de las subidas sin comprimir
+UPLOAD_KEEPALIVE_PORT = 8001     # Subidas por conexión persistente (None = desactivado)
+UPLOAD_KEEPALIVE_TIMEOUT = 30    # Segundos sin frames antes de cerrar la conexión
+FRAME_TRANSPORT_PORT = 8002      # Fragmentos por UDP y TCP (frame_transport.py); None = desactivado
+TELEMETRY_HISTORY = 360          # Reportes de telemetría por cámara (una hora a uno cada 10 s)
+STREAM_JPEG_QUALITY = 70
+DEFAULT_JPEG_QUALITY = 75  # Si la cámara no envía X-JPEG-Quality ni se pide ?quality=
+QUALITY_LEVELS = (30, 50, 70, 75, 85, 95)   # Las calidades pedidas se redondean a estas (acota las versiones por frame)
+ENCODER_WORKERS = 2       # Hilos para comprimir JPEG/PNG/WebP
+ARCHIVE_CACHE_BYTES = 64 * 1024 * 1024  # Frames del archivo ya decodificados
+PYRAMID_SCALES = (2, 4, 8)   # Divisores admitidos en /image/...?scale=
+THUMBNAIL_CACHE_BYTES = 32 * 1024 * 1024  # Niveles reducidos de la pirámide
+STREAM_BOUNDARY = "frame"
+LONG_POLL_TIMEOUT = 25    # Segundos que espera /last_image_name?since=
+SSE_KEEPALIVE = 15
 PICO_IP = "192.168.1.101"  # Cambia si es necesario
 PICO_PORT = 8080
+PICO_TIMEOUT = 1
+TELEOP_UDP = True          # Enviar /move y /brazo por UDP; HTTP queda de respaldo
+TELEOP_UDP_PORT = 8081
+TELEOP_ACK_TIMEOUT = 0.15    # La Pico tarda ~100 ms en refrescar la OLED
+TELEOP_RETRIES = 3
+CAMERA_TICKS_PERIOD = 1 << 30   # time.ticks_ms() de MicroPython da la vuelta en 2**30
 
-# --- Utilidades de imagen ---
-def rgb565_to_rgb888(rgb565_bytes):
-    result = bytearray()
-    for i in range(0, len(rgb565_bytes), 2):
-        pixel = (rgb565_bytes[i] << 8) | rgb565_bytes[i + 1]
-        r = (pixel >> 11) & 0x1F
-        g = (pixel >> 5) & 0x3F
-        b = pixel & 0x1F
-        r = (r << 3) | (r >> 2)
-        g = (g << 2) | (g >> 4)
-        b = (b << 3) | (b >> 2)
-        result.extend([b, g, r])
-    return bytes(result)
-
-def save_bmp(width, height, rgb888_data, filename):
-    row_size = (width * 3 + 3) & ~3
-    padding = row_size - width * 3
-    bmp_data = bytearray()
-    for row in range(height):
-        start = row * width * 3
-        end = start + width * 3
-        bmp_data.extend(rgb888_data[start:end])
-        bmp_data.extend(b'\x00' * padding)
-    file_size = 54 + len(bmp_data)
-    bmp_header = bytearray([
-        0x42, 0x4D,
-        *file_size.to_bytes(4, 'little'), 0, 0, 0, 0, 54, 0, 0, 0,
-        40, 0, 0, 0,
-        *width.to_bytes(4, 'little'),
-        *height.to_bytes(4, 'little'),
-        1, 0, 24, 0,
-        0, 0, 0, 0,
-        *len(bmp_data).to_bytes(4, 'little'),
-        0x13, 0x0B, 0, 0, 0x13, 0x0B, 0, 0,
-        0, 0, 0, 0, 0, 0, 0, 0
-    ])
-    with open(filename, "wb") as f:
-        f.write(bmp_header)
-        f.write(bmp_data)
+frame_ring = FrameRing(RING_SIZE)          # Todas las cámaras
+devices = DeviceRegistry(RING_SIZE)        # Un anillo y estadísticas por X-Device-ID
+frame_assembler = frame_transport.FrameAssembler(MAX_UPLOAD_BYTES)
+telemetry_store = telemetry.TelemetryStore(TELEMETRY_HISTORY)
+archive = None
+disk_writer = None
+if PERSIST_TO_DISK:
+    if PERSIST_FORMAT == "archive":
+        archive = FrameArchive(ARCHIVE_DIR, ARCHIVE_SEGMENT_BYTES, ARCHIVE_SEGMENT_SECONDS)
+        # Las secuencias continúan tras un reinicio para no repetirse en el archivo.
+        frame_ring.next_seq = archive.last_seq + 1
+    disk_writer = DiskWriter(IMAGE_DIR, PERSIST_QUEUE_SIZE, archive)
+encoder_pool = ThreadPoolExecutor(max_workers=ENCODER_WORKERS, thread_name_prefix="encoder")
+archive_cache = LRUCache(ARCHIVE_CACHE_BYTES, sizeof=Frame.nbytes)
+thumbnail_cache = LRUCache(THUMBNAIL_CACHE_BYTES, sizeof=Frame.nbytes)
+IMAGE_FORMATS = available_formats()
+dedup_stats = {"frames": 0, "deduplicated": 0, "identical": 0}
+dedup_lock = threading.Lock()   # Las subidas llegan desde varios hilos
+retention = RetentionManager(IMAGE_DIR, archive, RETENTION_MAX_BYTES, RETENTION_MAX_AGE,
+                             RETENTION_INTERVAL) if PERSIST_TO_DISK else None
+
+# --- Métricas (/metrics) ---
+# Cada frame lleva en frame.timeline los momentos de sus etapas:
+#   capture      captura en la cámara, estimada como received menos el tiempo
+#                que el frame pasó en la cámara (X-Send-Ms - X-Capture-Ms);
+#                no incluye el viaje por la red
+#   received     el servidor empieza a atender la subida
+#   converted    BMP listo y frame publicado en el anillo
+#   persisted    guardado en disco por DiskWriter
+#   first_served primera vez que se entrega a un cliente (/image o MJPEG)
+metrics = MetricsRegistry()
+FRAMES_RECEIVED = metrics.counter("camera_frames_received_total", "Frames aceptados por cámara", ("device",))
+FRAMES_DEDUPLICATED = metrics.counter("camera_frames_deduplicated_total",
+                                      "Frames guardados como referencia al anterior", ("device",))
+UPLOAD_ERRORS = metrics.counter("camera_upload_errors_total", "Subidas rechazadas")
+UPLOAD_BYTES = metrics.counter("camera_upload_bytes_total", "Bytes de cuerpo recibidos", ("device", "encoding"))
+FRAMES_SERVED = metrics.counter("frames_served_total", "Frames entregados a clientes", ("route",))
+FRAME_STAGE_SECONDS = metrics.histogram("frame_stage_seconds",
+                                        "Latencia de cada etapa de un frame desde que llega al servidor "
+                                        "(camera: captura a envío en la cámara; end_to_end: captura a "
+                                        "primera entrega)", ("stage",))
+metrics.collected("camera_fps", "FPS recibidos por cámara",
+                  lambda: [((d.device_id,), round(d.stats.fps, 3)) for d in devices.all()], ("device",))
+metrics.collected("camera_missing_frames_total", "Frames perdidos según X-Sequence",
+                  lambda: [((d.device_id,), d.stats.missing) for d in devices.all()], ("device",), "counter")
+metrics.collected("camera_free_memory_bytes", "X-Memory de la última subida",
+                  lambda: [((d.device_id,), d.stats.free_memory) for d in devices.all()], ("device",))
+metrics.collected("camera_timing_p95_seconds",
+                  "Percentil 95 de cada tiempo medido en la cámara, del último reporte de /telemetry",
+                  lambda: [((device_id, name), report[name]["p95_ms"] / 1000)
+                           for device_id, report in telemetry_store.latest().items()
+                           for name in telemetry.HISTOGRAMS if report[name]["count"]],
+                  ("device", "timing"))
+if disk_writer:
+    metrics.collected("persist_queue_frames", "Frames esperando a DiskWriter",
+                      lambda: [((), disk_writer.queue.qsize())])
+    metrics.collected("persist_dropped_total", "Frames no guardados por cola llena",
+                      lambda: [((), disk_writer.dropped)], kind="counter")
+    metrics.collected("persist_errors_total", "Errores al guardar frames",
+                      lambda: [((), disk_writer.errors)], kind="counter")
+metrics.collected("frame_transport_frames_total",
+                  "Frames por UDP/TCP: completos, incompletos descartados e inválidos",
+                  lambda: [((result,), count) for result, count in frame_assembler.stats.items()], ("result",),
+                  "counter")
 
 # --- CORS ---
 @app.after_request
@@ -59,42 +140,673 @@ def apply_cors_headers(response):
     response.headers["Connection"] = "close"
     return response
 
-# --- Rutas de imagen ---
-@app.route("/upload_raw_image_flash/", methods=["POST"])
-def upload_image():
-    global last_saved_image
-    data = request.get_data()
-    if len(data) < 4:
-        return jsonify({"status": "error", "message": "Datos insuficientes."}), 400
+# --- Recepción de frames ---
+def parse_int_header(headers, name):
+    value = headers.get(name, "")
+    return int(value) if value.isdigit() else None
+
+def camera_headers(headers):
+    # Cabeceras que envía send_frame_pico: X-Device-ID, X-Sequence, X-Memory,
+    # X-JPEG-Quality, X-Capture-Ms/X-Send-Ms (time.ticks_ms() al capturar y
+    # al enviar; su diferencia es el tiempo que el frame pasó en la cámara),
+    # X-Encoding/X-Base-Sequence si el frame viene comprimido y
+    # X-Frame-Interval-Ms (intervalo entre frames que eligió la cámara).
+    delay = camera_delay(parse_int_header(headers, "X-Capture-Ms"), parse_int_header(headers, "X-Send-Ms"))
+    return (clean_device_id(headers.get("X-Device-ID", "")), parse_int_header(headers, "X-Sequence"),
+            parse_int_header(headers, "X-Memory"), parse_int_header(headers, "X-JPEG-Quality"), delay,
+            headers.get("X-Encoding") or None, parse_int_header(headers, "X-Base-Sequence"),
+            parse_int_header(headers, "X-Frame-Interval-Ms"))
+
+def clean_device_id(value):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", value)[:64] or None
+
+def camera_delay(capture_ms, send_ms):
+    if capture_ms is None or send_ms is None:
+        return None
+    return ((send_ms - capture_ms) % CAMERA_TICKS_PERIOD) / 1000
+
+def frame_filename(device_id, device_seq, timestamp):
+    # img_<device>_<X-Sequence>_<fecha>_<hora>_<ms>.bmp. La secuencia de la
+    # cámara y los milisegundos evitan que dos frames compartan nombre. Sin
+    # X-Device-ID el nombre es img_<X-Sequence>_<fecha>_<hora>_<ms>.bmp.
+    stamp = datetime.fromtimestamp(timestamp)
+    when = stamp.strftime("%Y%m%d_%H%M%S") + f"_{stamp.microsecond // 1000:03d}"
+    if device_id:
+        return f"img_{device_id}_{device_seq or 0:06d}_{when}.bmp"
+    return f"img_{device_seq or 0:06d}_{when}.bmp"
+
+def parse_frame_filename(filename):
+    # Inverso de frame_filename: (device_id, device_seq, timestamp) o None.
+    if not (filename.startswith("img_") and filename.endswith(".bmp")):
+        return None
+    parts = filename[4:-4].rsplit("_", 4)
+    if len(parts) == 4:
+        parts.insert(0, None)
+    if len(parts) != 5 or not parts[1].isdigit():
+        return None
+    try:
+        stamp = datetime.strptime(f"{parts[2]}_{parts[3]}", "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+    return parts[0], int(parts[1]), stamp.timestamp() + int(parts[4]) / 1000
+
+def dedup_reference(ring, device_id, width, height, rgb565):
+    # Devuelve (hash, frame base o None). Se compara contra el último frame
+    # de la misma cámara; si ese ya era una referencia, contra su base, así
+    # los cambios lentos se acumulan hasta superar el umbral en lugar de
+    # perderse frame a frame.
+    digest = hashlib.blake2b(rgb565, digest_size=16).digest()
+    previous = ring.latest()
+    if (not DEDUP_ENABLED or previous is None or previous.device_id != device_id
+            or (previous.width, previous.height) != (width, height)):
+        return digest, None
+    base = previous.ref or previous
+    if base.raw is None:
+        return digest, None
+    if digest == base.digest:
+        with dedup_lock:
+            dedup_stats["identical"] += 1
+        return digest, base
+    if rgb565_difference(base.raw, rgb565, DEDUP_SAMPLE_STEP) < DEDUP_THRESHOLD:
+        return digest, base
+    return digest, None
+
+# --- Frames comprimidos en la cámara (frame_codec.py) ---
+# Las respuestas de /upload_raw_image_flash/ anuncian los códecs aceptados en
+# X-Frame-Encodings; la cámara empieza enviando RGB565 crudo y pasa a xor-rle
+# al verlo.
+UPLOAD_RESPONSE_HEADERS = {"X-Frame-Encodings": ",".join(FRAME_ENCODINGS)}
 
+class StaleBaseError(ValueError):
+    # El frame base que usó la cámara no es el último que tiene el servidor
+    # (se perdió una subida o el servidor se reinició). Se responde 409 y la
+    # cámara manda el siguiente frame sin base.
+    pass
+
+def decode_frame(device, width, height, payload, encoding, base_seq):
+    if encoding not in FRAME_ENCODINGS:
+        raise ValueError(f"Codificación no soportada: {encoding}")
+    if device is None:
+        raise ValueError("X-Encoding requiere X-Device-ID.")
+    base = None
+    if base_seq:
+        seq, base = device.codec_base or (None, None)
+        if seq != base_seq:
+            raise StaleBaseError(f"Frame base {base_seq} no disponible.")
+    return decode_xor_rle(payload, width * height * 2, base)
+
+def frame_dimensions(data):
+    # Ancho y alto de la cabecera. Se rechaza antes de reservar nada un frame
+    # vacío o uno cuyo RGB565 no entraría en una subida.
+    if len(data) < 4:
+        UPLOAD_ERRORS.inc()
+        raise ValueError("Datos insuficientes.")
     width = int.from_bytes(data[0:2], 'big')
     height = int.from_bytes(data[2:4], 'big')
-    image_data = data[4:]
+    if width <= 0 or height <= 0 or 4 + width * height * 2 > MAX_UPLOAD_BYTES:
+        UPLOAD_ERRORS.inc()
+        raise ValueError("Tamaño incorrecto de imagen.")
+    return width, height
+
+def ingest_frame(data, device_id=None, device_seq=None, free_memory=None, jpeg_quality=None, camera_delay=None,
+                 encoding=None, base_seq=None, frame_interval=None, received=None):
+    # Valida, convierte y guarda un frame recibido de la cámara con el cuerpo
+    # completo en memoria (frames comprimidos o subidas sin Content-Length).
+    # Lo usan tanto la ruta Flask como el servidor asíncrono
+    # (async_server.py). received es el momento en que empezó la petición.
+    received = time.time() if received is None else received
+    width, height = frame_dimensions(data)
+    image_data = memoryview(data)[4:]
+    device = devices.get(device_id, create=True) if device_id else None
+    UPLOAD_BYTES.inc(len(data), device=device_id or "", encoding=encoding or "raw")
+    if encoding:
+        try:
+            image_data = decode_frame(device, width, height, image_data, encoding, base_seq)
+        except ValueError:
+            UPLOAD_ERRORS.inc()
+            raise
 
     if len(image_data) != width * height * 2:
-        return jsonify({"status": "error", "message": "Tamaño incorrecto de imagen."}), 400
+        UPLOAD_ERRORS.inc()
+        raise ValueError("Tamaño incorrecto de imagen.")
+    return publish_frame(width, height, image_data, None, device, device_seq, free_memory, jpeg_quality,
+                         camera_delay, received, frame_interval)
+
+# --- Subidas leídas por bloques ---
+# Para RGB565 sin comprimir el cuerpo no se junta entero: la cabecera de 4
+# bytes se lee primero y cada bloque que llega se escribe directo en el
+# búfer del frame y se convierte a BMP mientras llega el siguiente. Fuera del
+# frame en sí, la memoria por subida es un bloque (UPLOAD_CHUNK_BYTES).
+def stream_encoder(header, length):
+    width, height = frame_dimensions(header)
+    if length != 4 + width * height * 2:
+        UPLOAD_ERRORS.inc()
+        raise ValueError("Tamaño incorrecto de imagen.")
+    return BmpStreamEncoder(width, height)
+
+def finish_stream(encoder, length, device_id=None, device_seq=None, free_memory=None, jpeg_quality=None,
+                  camera_delay=None, encoding=None, base_seq=None, frame_interval=None, received=None):
+    if not encoder.done:
+        UPLOAD_ERRORS.inc()
+        raise ValueError("Datos insuficientes.")
+    encoder.convert()
+    device = devices.get(device_id, create=True) if device_id else None
+    UPLOAD_BYTES.inc(length, device=device_id or "", encoding="raw")
+    # frame.bmp tiene que ser bytes: Werkzeug rechaza un bytearray como cuerpo.
+    return publish_frame(encoder.width, encoder.height, encoder.raw, bytes(encoder.bmp), device, device_seq,
+                         free_memory, jpeg_quality, camera_delay, received, frame_interval)
+
+def ingest_stream(stream, length, *camera, received=None):
+    # Como ingest_frame para un cuerpo RGB565 sin comprimir de length bytes
+    # que se lee de stream (readinto). camera son los valores de
+    # camera_headers.
+    received = time.time() if received is None else received
+    header = bytearray(4)
+    got = 0
+    while got < 4:
+        n = stream.readinto(memoryview(header)[got:])
+        if not n:
+            break
+        got += n
+    encoder = stream_encoder(header[:got], length)
+    while not encoder.done:
+        n = stream.readinto(encoder.buffer(UPLOAD_CHUNK_BYTES))
+        if not n:
+            break
+        encoder.advance(n)
+        encoder.convert()
+    return finish_stream(encoder, length, *camera, received=received)
 
-    rgb888 = rgb565_to_rgb888(image_data)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"img_{timestamp}.bmp"
-    path = os.path.join(IMAGE_DIR, filename)
-    save_bmp(width, height, rgb888, path)
+def publish_frame(width, height, image_data, bmp, device, device_seq, free_memory, jpeg_quality, camera_delay,
+                  received, frame_interval=None):
+    # Parte común de ingest_frame y finish_stream: deduplicación, anillos,
+    # estadísticas, métricas y disco. bmp es None si aún no se convirtió.
+    global last_saved_image
+    device_id = device.device_id if device else None
+    if device and device_seq is not None:
+        device.codec_base = (device_seq, image_data)
+    digest, ref = dedup_reference(device.ring if device else frame_ring, device_id, width, height, image_data)
+    with dedup_lock:
+        dedup_stats["frames"] += 1
+        if ref:
+            dedup_stats["deduplicated"] += 1
+    if ref:
+        # Mismos píxeles que ref: ni conversión ni BMP nuevo, pero el frame
+        # conserva su propia secuencia, nombre y hora.
+        bmp, image_data = ref.bmp, ref.raw
+    elif bmp is None:
+        bmp = encode_bmp(width, height, rgb565_to_bgr888_buffer(image_data))
+    now = time.time()
+    filename = frame_filename(device_id, device_seq, now)
+    frame = frame_ring.push(filename, width, height, bmp, device_id, device_seq, image_data, now, digest, ref)
+    frame.mark("received", received)
+    frame.mark("converted", now)
+    FRAME_STAGE_SECONDS.observe(now - received, stage="convert")
+    if camera_delay is not None:
+        frame.mark("capture", received - camera_delay)
+        FRAME_STAGE_SECONDS.observe(camera_delay, stage="camera")
+    FRAMES_RECEIVED.inc(device=device_id or "")
+    if ref:
+        FRAMES_DEDUPLICATED.inc(device=device_id or "")
+    if device:
+        device.stats.update(device_seq, free_memory, frame.timestamp)
+        device.stats.set_mode(width, height, frame_interval)
+        if ref:
+            device.stats.deduplicated += 1
+        if jpeg_quality:
+            device.jpeg_quality = jpeg_quality
+        device.ring.add(frame)
+    if disk_writer:
+        disk_writer.submit(frame)
     last_saved_image = filename
+    return frame
+
+# --- Rutas de imagen ---
+@app.route("/upload_raw_image_flash/", methods=["POST"])
+def upload_image():
+    received = time.time()
+    camera = camera_headers(request.headers)
+    try:
+        if request.headers.get("X-Encoding") or request.content_length is None:
+            frame = ingest_frame(request.get_data(), *camera, received=received)
+        else:
+            frame = ingest_stream(request.stream, request.content_length, *camera, received=received)
+    except StaleBaseError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409, UPLOAD_RESPONSE_HEADERS
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400, UPLOAD_RESPONSE_HEADERS
+    return jsonify({"status": "ok", "filename": frame.filename, "seq": frame.seq}), 200, UPLOAD_RESPONSE_HEADERS
+
+# --- Subidas por conexión persistente ---
+# El servidor de desarrollo de Flask cierra la conexión después de cada
+# respuesta. La cámara (Uplink en RASPBERRY_CAMARA/main.py) manda todos sus
+# frames por un único socket HTTP/1.1, así que SERVERUNIDO.py también acepta
+# subidas en UPLOAD_KEEPALIVE_PORT: un servidor HTTP/1.1 mínimo que solo
+# atiende esta ruta y lee el cuerpo del socket con ingest_stream.
+# async_server.py no lo necesita: aiohttp ya mantiene la conexión.
+class KeepAliveUploadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = UPLOAD_KEEPALIVE_TIMEOUT
+    disable_nagle_algorithm = True   # Cabeceras y cuerpo de la respuesta salen en escrituras separadas
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/telemetry":
+            return self.post_telemetry()
+        if path != "/upload_raw_image_flash":
+            self.close_connection = True
+            return self.reply(404, {"status": "error", "message": "Ruta no encontrada."})
+        received = time.time()
+        camera = camera_headers(self.headers)
+        length = parse_int_header(self.headers, "Content-Length")
+        if length is None or length > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            return self.reply(411 if length is None else 413,
+                              {"status": "error", "message": "Tamaño de cuerpo inválido."})
+        try:
+            if self.headers.get("X-Encoding"):
+                frame = ingest_frame(self.rfile.read(length), *camera, received=received)
+            else:
+                frame = ingest_stream(self.rfile, length, *camera, received=received)
+        except ValueError as e:
+            # Puede quedar parte del cuerpo sin leer: la cámara reconecta.
+            self.close_connection = True
+            status = 409 if isinstance(e, StaleBaseError) else 400
+            return self.reply(status, {"status": "error", "message": str(e)})
+        self.reply(200, {"status": "ok", "filename": frame.filename, "seq": frame.seq})
+
+    def post_telemetry(self):
+        length = parse_int_header(self.headers, "Content-Length")
+        if length is None or length > telemetry.REPORT_SIZE:
+            self.close_connection = True
+            return self.reply(400, {"status": "error", "message": "Tamaño de cuerpo inválido."})
+        try:
+            ingest_telemetry(self.headers.get("X-Device-ID", ""), self.rfile.read(length))
+        except ValueError as e:
+            return self.reply(400, {"status": "error", "message": str(e)})
+        self.reply(200, {"status": "ok"})
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in UPLOAD_RESPONSE_HEADERS.items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_request(self, code="-", size="-"):
+        # Sin una línea por frame; los errores siguen en log_error.
+        pass
+
+def start_upload_listener(host="0.0.0.0", port=UPLOAD_KEEPALIVE_PORT):
+    server = ThreadingHTTPServer((host, port), KeepAliveUploadHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- Frames por fragmentos (UDP/TCP) ---
+# frame_transport rearma los fragmentos y entrega cada frame completo a
+# ingest_transport_frame, el mismo camino que la subida HTTP. La ruta
+# /upload_raw_image_flash/ sigue disponible como respaldo.
+TRANSPORT_ENCODINGS = sum(1 << i for i in range(len(FRAME_ENCODINGS)))
+
+def ingest_transport_frame(frame):
+    encoding = FRAME_ENCODINGS[0] if frame.encoded else None
+    try:
+        ingest_frame(frame.data, clean_device_id(frame.device_id or ""), frame.seq, frame.free_memory,
+                     frame.jpeg_quality, camera_delay(frame.capture_ms, frame.send_ms), encoding, frame.base_seq,
+                     frame.frame_interval, received=frame.received)
+    except StaleBaseError:
+        return frame_transport.ACK_STALE_BASE
+    except ValueError:
+        return frame_transport.ACK_REJECTED
+    return frame_transport.ACK_OK
+
+def start_frame_receiver(host="0.0.0.0", port=FRAME_TRANSPORT_PORT):
+    # Con Flask el receptor asyncio corre en un bucle propio en otro hilo;
+    # async_server.py lo arranca en su bucle.
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    receiver = frame_transport.start_receivers(host, port, frame_assembler, ingest_transport_frame,
+                                               TRANSPORT_ENCODINGS)
+    return asyncio.run_coroutine_threadsafe(receiver, loop).result()
+
+def find_frame(filename):
+    frame = frame_ring.find(filename)
+    if frame is None:
+        for device in devices.all():
+            frame = device.ring.find(filename)
+            if frame:
+                break
+    return frame
+
+def frame_info(frame):
+    if frame is None:
+        return {"image_name": last_saved_image, "seq": None}
+    return {"image_name": frame.filename, "seq": frame.seq, "device_id": frame.device_id,
+            "device_seq": frame.device_seq, "ref_seq": frame.ref.seq if frame.ref else None,
+            "timeline": frame.timeline}
+
+def device_or_404(device_id):
+    device = devices.get(device_id)
+    if device is None:
+        abort(404)
+    return device
+
+def archived_frame(entry):
+    # Frame reconstruido desde el archivo; queda en archive_cache junto con
+    # sus versiones comprimidas.
+    def load():
+        raw = archive.read(entry)
+        bmp = encode_bmp(entry.width, entry.height, rgb565_to_bgr888_buffer(raw))
+        frame = Frame(entry.seq, frame_filename(entry.device_id, entry.device_seq, entry.timestamp), entry.width,
+                      entry.height, bmp, entry.timestamp, entry.device_id, entry.device_seq, raw)
+        frame.on_encoded = lambda: archive_cache.resize(entry.seq)
+        return frame
+    return archive_cache.get_or_compute(entry.seq, load)
+
+def lookup_frame(seq=None, timestamp=None, device_id=None):
+    # Frame por secuencia o por tiempo: primero en memoria y, si ya salió del
+    # anillo, desde el archivo segmentado.
+    if seq is not None:
+        frame = frame_ring.get(seq)
+        entry = archive.by_seq(seq) if archive and not frame else None
+    else:
+        frame = frame_ring.at_time(timestamp, device_id)
+        entry = archive.at_time(timestamp, device_id) if archive and not frame else None
+    if frame is None and entry is not None:
+        frame = archived_frame(entry)
+    return frame
+
+def lookup_frame_by_name(filename):
+    frame = find_frame(filename)
+    if frame or not archive:
+        return frame
+    # El nombre incluye cámara, secuencia y milisegundos: basta para ubicar
+    # el frame en el archivo.
+    parsed = parse_frame_filename(filename)
+    if parsed is None:
+        return None
+    device_id, device_seq, timestamp = parsed
+    entry = archive.at_time(timestamp + 0.001, device_id)
+    if entry is None or entry.timestamp < timestamp or entry.device_seq != device_seq:
+        return None
+    return archived_frame(entry)
+
+# --- Pirámide de resoluciones ---
+def scaled_frame(frame, scale):
+    # Versión 1/scale del frame. Cada nivel se obtiene del anterior (1/8 sale
+    # de 1/4, que sale de 1/2), así pedir varias miniaturas del mismo frame
+    # filtra cada píxel una sola vez. Los niveles quedan en thumbnail_cache
+    # junto con sus versiones comprimidas.
+    if scale == 1:
+        return frame
+    def build():
+        parent = scaled_frame(frame, scale // 2)
+        width, height, raw = downscale_rgb565(parent.raw, parent.width, parent.height, 2)
+        level = Frame(frame.seq, frame.filename, width, height, encode_bmp(width, height, rgb565_to_bgr888_buffer(raw)),
+                      frame.timestamp, frame.device_id, frame.device_seq, raw)
+        level.on_encoded = lambda: thumbnail_cache.resize(key)
+        return level
+    # Los frames deduplicados comparten los niveles de su base.
+    key = ((frame.ref or frame).seq, scale)
+    return thumbnail_cache.get_or_compute(key, build)
+
+def requested_scale(args):
+    # ?scale=1/2|1/4|1/8 (o 0.5, 2, 4, 8). Devuelve el divisor; ValueError si
+    # no es un nivel de la pirámide.
+    value = args.get("scale", "").strip()
+    if not value:
+        return 1
+    try:
+        if "/" in value:
+            numerator, _, denominator = value.partition("/")
+            value = float(numerator) / float(denominator)
+        else:
+            value = float(value)
+        scale = round(1 / value) if value < 1 else round(value)
+    except (ValueError, ZeroDivisionError):
+        scale = None
+    if scale != 1 and scale not in PYRAMID_SCALES:
+        raise ValueError(f"Escala no disponible: {args.get('scale')}")
+    return scale
+
+# --- Formatos de salida ---
+def requested_format(args, accept):
+    # ?format=jpeg|png|webp|bmp y ?quality= tienen prioridad sobre Accept.
+    # Devuelve (formato, calidad o None); ValueError si no es válido.
+    fmt = args.get("format", "").lower().replace("jpg", "jpeg")
+    if fmt and fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Formato no disponible: {fmt}")
+    quality = args.get("quality", "")
+    if quality and not quality.isdigit():
+        raise ValueError("Calidad inválida.")
+    quality = min(95, max(1, int(quality))) if quality else None
+    return fmt or negotiate_format(accept, IMAGE_FORMATS), quality
+
+def render_frame(frame, fmt, quality, scale=1):
+    frame = scaled_frame(frame, scale)
+    if fmt == "bmp":
+        return frame.bmp
+    encode = lambda f: encode_image(f.width, f.height, f.bmp, fmt, quality)
+    return frame.get_encoded((fmt, quality), encode)
+
+def submit_render(frame, fmt, quality=None, scale=1):
+    # Future con los bytes del frame en fmt, reducido 1/scale. Cada
+    # (frame, escala, formato, calidad) se calcula una sola vez en
+    # encoder_pool y queda guardado.
+    if fmt == "bmp" and scale == 1:
+        future = Future()
+        future.set_result(frame.bmp)
+        return future
+    if quality is None:
+        device = devices.get(frame.device_id) if frame.device_id else None
+        quality = (device and device.jpeg_quality) or DEFAULT_JPEG_QUALITY
+    quality = min(QUALITY_LEVELS, key=lambda level: (abs(level - quality), -level))
+    if fmt == "png":
+        quality = 0   # PNG no tiene calidad: una sola versión por frame
+    return encoder_pool.submit(render_frame, frame, fmt, quality, scale)
+
+def note_served(frame, route):
+    # Cierra la línea de tiempo del frame la primera vez que sale hacia un
+    # cliente. Los frames leídos del archivo no tienen línea de tiempo.
+    FRAMES_SERVED.inc(route=route)
+    now = time.time()
+    received = frame.timeline.get("received")
+    if received is not None and frame.mark("first_served", now):
+        FRAME_STAGE_SECONDS.observe(now - received, stage="first_serve")
+        if "capture" in frame.timeline:
+            FRAME_STAGE_SECONDS.observe(now - frame.timeline["capture"], stage="end_to_end")
+
+def on_persisted(frame):
+    received = frame.timeline.get("received")
+    if received is not None and frame.mark("persisted"):
+        FRAME_STAGE_SECONDS.observe(frame.timeline["persisted"] - received, stage="persist")
+
+if disk_writer:
+    disk_writer.add_listener(on_persisted)
 
-    return jsonify({"status": "ok", "filename": filename})
+def image_response(frame):
+    try:
+        fmt, quality = requested_format(request.args, request.headers.get("Accept"))
+        scale = requested_scale(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    response = make_response(submit_render(frame, fmt, quality, scale).result())
+    note_served(frame, "image")
+    response.mimetype = IMAGE_MIMETYPES[fmt]
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept"
+    return response
+
+@app.route("/image/seq/<int:seq>")
+def serve_image_by_seq(seq):
+    frame = lookup_frame(seq=seq)
+    if frame is None:
+        abort(404)
+    return image_response(frame)
+
+@app.route("/image/at/<timestamp>")
+def serve_image_at(timestamp):
+    # Frame más reciente guardado en o antes de <timestamp> (segundos Unix).
+    try:
+        timestamp = float(timestamp)
+    except ValueError:
+        abort(400)
+    frame = lookup_frame(timestamp=timestamp, device_id=request.args.get("device"))
+    if frame is None:
+        abort(404)
+    return image_response(frame)
 
 @app.route("/image/<path:filename>")
 def serve_image(filename):
+    frame = lookup_frame_by_name(filename)
+    if frame:
+        return image_response(frame)
     response = make_response(send_from_directory(IMAGE_DIR, filename))
     response.headers["Cache-Control"] = "no-cache"
     return response
 
+def storage_info():
+    stats = {"format": PERSIST_FORMAT if PERSIST_TO_DISK else None}
+    if disk_writer:
+        stats.update(written=disk_writer.written, dropped=disk_writer.dropped, errors=disk_writer.errors,
+                     queued=disk_writer.queue.qsize())
+    if retention:
+        stats.update(retention.as_dict())
+    with dedup_lock:
+        dedup = dict(dedup_stats)
+    stats["dedup"] = {**dedup, "ratio": round(dedup["deduplicated"] / dedup["frames"], 3) if dedup["frames"] else 0.0,
+                      "threshold": DEDUP_THRESHOLD if DEDUP_ENABLED else None}
+    if archive:
+        stats["dedup"]["archive_references"] = archive.references
+    stats["archive_cache"] = archive_cache.as_dict()
+    stats["thumbnail_cache"] = thumbnail_cache.as_dict()
+    return stats
+
+@app.route("/storage")
+def storage_stats():
+    return jsonify(storage_info())
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+def latest_frame(ring):
+    # Con ?since=<seq> la respuesta espera (long-poll) hasta que llegue un
+    # frame más nuevo o venza LONG_POLL_TIMEOUT.
+    since = request.args.get("since", type=int)
+    if since is not None:
+        return ring.wait_newer(since, timeout=LONG_POLL_TIMEOUT) or ring.latest()
+    return ring.latest()
+
 @app.route("/last_image_name")
 def last_image_name():
-    return jsonify({"image_name": last_saved_image})
+    return jsonify(frame_info(latest_frame(frame_ring)))
 
-@app.route("/view_image/<image_name>")
-def view_image(image_name):
+# --- Cámaras ---
+@app.route("/devices")
+def list_devices():
+    return jsonify({d.device_id: {**d.stats.as_dict(), "last_image": frame_info(d.ring.latest())}
+                    for d in devices.all()})
+
+@app.route("/device/<device_id>/stats")
+def device_stats(device_id):
+    return jsonify(device_or_404(device_id).stats.as_dict())
+
+@app.route("/device/<device_id>/last_image_name")
+def device_last_image_name(device_id):
+    return jsonify(frame_info(latest_frame(device_or_404(device_id).ring)))
+
+# --- Telemetría de las cámaras ---
+# Histogramas de tiempos y contadores que la cámara junta con ticks_us y manda
+# cada Config.TELEMETRY_INTERVAL (formato en telemetry.py). Se guardan los
+# últimos TELEMETRY_HISTORY reportes de cada cámara.
+def ingest_telemetry(device_id, body):
+    device_id = clean_device_id(device_id)
+    if device_id is None:
+        raise ValueError("La telemetría requiere X-Device-ID.")
+    telemetry_store.add(device_id, telemetry.decode_report(body))
+
+@app.route("/telemetry", methods=["POST"])
+def upload_telemetry():
+    try:
+        ingest_telemetry(request.headers.get("X-Device-ID", ""), request.get_data())
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "ok"})
+
+@app.route("/device/<device_id>/telemetry")
+def device_telemetry(device_id):
+    # ?since=<hora unix> devuelve solo los reportes posteriores.
+    reports = telemetry_store.get(device_id, request.args.get("since", type=float))
+    if reports is None:
+        abort(404)
+    return jsonify({"device": device_id, "reports": reports})
+
+# --- Notificaciones de frames nuevos (Server-Sent Events) ---
+def generate_events(seq):
+    while True:
+        frame = frame_ring.wait_newer(seq, timeout=SSE_KEEPALIVE)
+        if frame is None:
+            yield ": keepalive\n\n"
+            continue
+        seq = frame.seq
+        data = json.dumps(frame_info(frame))
+        yield f"id: {seq}\nevent: frame\ndata: {data}\n\n"
+
+@app.route("/events")
+def frame_events():
+    seq = request.headers.get("Last-Event-ID", type=int) or request.args.get("since", 0, type=int)
+    response = Response(generate_events(seq), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# --- Stream MJPEG (multipart/x-mixed-replace) ---
+def encode_stream_part(frame):
+    # Comparte la versión JPEG con /image/...?format=jpeg&quality=STREAM_JPEG_QUALITY.
+    if "jpeg" in IMAGE_FORMATS:
+        content_type = "image/jpeg"
+        data = frame.get_encoded(("jpeg", STREAM_JPEG_QUALITY),
+                                 lambda f: encode_image(f.width, f.height, f.bmp, "jpeg", STREAM_JPEG_QUALITY))
+    else:
+        content_type = "image/bmp"
+        data = frame.bmp
+    header = f"--{STREAM_BOUNDARY}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n\r\n"
+    return b"".join((header.encode(), data, b"\r\n"))
+
+def generate_stream(ring):
+    # Cada cliente espera al frame más nuevo; si se retrasa, se salta los
+    # intermedios en lugar de acumularlos. La parte se codifica una sola vez
+    # por frame y se comparte entre todos los clientes.
+    seq = 0
+    while True:
+        frame = ring.wait_newer(seq, timeout=10)
+        if frame is None:
+            continue
+        seq = frame.seq
+        part = frame.get_encoded("mjpeg", encode_stream_part)
+        note_served(frame, "mjpeg")
+        yield part
+
+def stream_response(ring):
+    response = Response(generate_stream(ring), mimetype=f"multipart/x-mixed-replace; boundary={STREAM_BOUNDARY}")
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/mjpeg")
+def mjpeg_stream():
+    return stream_response(frame_ring)
+
+@app.route("/device/<device_id>/mjpeg")
+def device_mjpeg_stream(device_id):
+    return stream_response(device_or_404(device_id).ring)
+
+def view_image_html(image_name):
     return f"""
     <html>
     <head><title>Imagen</title></head>
@@ -105,10 +817,12 @@ def view_image(image_name):
     </html>
     """
 
+@app.route("/view_image/<image_name>")
+def view_image(image_name):
+    return view_image_html(image_name)
+
 # --- Página principal con stream y controles ---
-@app.route("/stream")
-def stream_page():
-    return render_template_string("""
+STREAM_PAGE_HTML = """
     <html>
     <head>
         <title>Stream + Control</title>
@@ -123,19 +837,6 @@ def stream_page():
             button:hover { background-color: #666; }
         </style>
         <script>
-            async function updateImage() {
-                try {
-                    const res = await fetch("/last_image_name");
-                    const data = await res.json();
-                    if (data.image_name) {
-                        const timestamp = new Date().getTime();
-                        document.getElementById("stream").src = `/image/${data.image_name}?t=${timestamp}`;
-                    }
-                } catch (e) {
-                    console.error("Error al actualizar imagen:", e);
-                }
-            }
-
             async function enviar(direccion) {
                 const res = await fetch('/move', {
                     method: 'POST',
@@ -155,14 +856,11 @@ def stream_page():
                     alert("Error: " + err);
                 }
             }
-
-            setInterval(updateImage, 200);
-            window.onload = updateImage;
         </script>
     </head>
     <body>
         <h1>Stream + Control</h1>
-        <img id="stream" src="" alt="Esperando imagen..." />
+        <img id="stream" src="/mjpeg" alt="Esperando imagen..." />
         <div>
             <h2>Movimientos</h2>
             <button onclick="enviar('forward')">↑ Adelante</button><br/>
@@ -178,16 +876,102 @@ def stream_page():
         </div>
     </body>
     </html>
-    """)
+    """
+
+@app.route("/stream")
+def stream_page():
+    return render_template_string(STREAM_PAGE_HTML)
+
+# --- Canal de comandos a la Pico de control ---
+# Sesión con conexiones keep-alive reutilizables: cada botón ya no paga un
+# handshake TCP nuevo sobre WiFi.
+pico_session = requests.Session()
+pico_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+def pico_command(path):
+    url = f"http://{PICO_IP}:{PICO_PORT}{path}"
+    try:
+        return pico_session.get(url, timeout=PICO_TIMEOUT)
+    except requests.exceptions.ConnectTimeout:
+        raise
+    except requests.ConnectionError:
+        # La Pico cerró la conexión reutilizada (reinicio o timeout de
+        # inactividad): se reintenta una vez con una conexión nueva.
+        return pico_session.get(url, timeout=PICO_TIMEOUT)
+
+# --- Teleoperación por UDP ---
+# Mismo formato que servidor_udp en RASPBERRY_CONTROL/main.py.
+TELEOP_FORMAT = struct.Struct(">2sBHIBBB")
+TELEOP_ACK_FORMAT = struct.Struct(">2sHI")
+TELEOP_DIRECTIONS = {None: 0, "stop": 1, "forward": 2, "backward": 3, "left": 4, "right": 5}
+TELEOP_ARM_ACTIONS = {"alzar": 1, "recoger": 2}
+TELEOP_MAX_SPEED = 100   # La Pico toma la velocidad como % de la calibrada (MotorController.set_velocidad)
+
+class TeleopSender:
+    # Cada comando lleva una secuencia creciente dentro de una sesión
+    # aleatoria (la Pico reinicia su contador al ver una sesión nueva). Se
+    # reenvía hasta recibir el ACK o agotar TELEOP_RETRIES.
+    def __init__(self):
+        self.session = random.randrange(1, 0x10000)
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.settimeout(TELEOP_ACK_TIMEOUT)
+        self.stats = {"sent": 0, "acked": 0, "retries": 0, "failed": 0}
+
+    def send(self, direction=None, speed=0, arm_action=None):
+        with self.lock:
+            self.seq += 1
+            packet = TELEOP_FORMAT.pack(b"CT", 1, self.session, self.seq, TELEOP_DIRECTIONS[direction],
+                                        speed, TELEOP_ARM_ACTIONS.get(arm_action, 0))
+            for attempt in range(TELEOP_RETRIES):
+                self.sock.sendto(packet, (PICO_IP, TELEOP_UDP_PORT))
+                self.stats["sent"] += 1
+                if attempt:
+                    self.stats["retries"] += 1
+                if self._wait_ack():
+                    self.stats["acked"] += 1
+                    return True
+            self.stats["failed"] += 1
+            return False
+
+    def _wait_ack(self):
+        try:
+            while True:
+                data, _ = self.sock.recvfrom(16)
+                if len(data) != TELEOP_ACK_FORMAT.size:
+                    continue
+                magic, session, seq = TELEOP_ACK_FORMAT.unpack(data)
+                # ACKs de comandos anteriores se ignoran.
+                if magic == b"CA" and session == self.session and seq == self.seq:
+                    return True
+        except (socket.timeout, OSError):
+            return False
+
+teleop = TeleopSender() if TELEOP_UDP else None
+
+def send_teleop(direction=None, speed=0, arm_action=None):
+    # True si la Pico confirmó el comando por UDP.
+    if teleop is None:
+        return False
+    try:
+        return teleop.send(direction, speed, arm_action)
+    except OSError:
+        return False
 
 # --- Endpoint para movimiento de carro ---
 @app.route("/move", methods=["POST"])
 def move():
     data = request.json
     direction = data.get("direction", "stop")
+    speed = data.get("speed", 0)
+    if not isinstance(speed, int) or not 0 <= speed <= TELEOP_MAX_SPEED:
+        return jsonify({"status": "error", "message": f"Velocidad inválida (0-{TELEOP_MAX_SPEED})"}), 400
+    if direction in TELEOP_DIRECTIONS:
+        if send_teleop(direction, speed):
+            return jsonify({"status": "ok", "message": f"Comando '{direction}' enviado a la Pico W", "via": "udp"})
     try:
-        url = f"http://{PICO_IP}:{PICO_PORT}/motor?dir={direction}"
-        res = requests.get(url, timeout=1)
+        res = pico_command(f"/motor?dir={direction}")
         if res.status_code == 200:
             return jsonify({"status": "ok", "message": f"Comando '{direction}' enviado a la Pico W"})
         else:
@@ -201,9 +985,10 @@ def brazo():
     accion = request.args.get("accion", "")
     if accion not in ("alzar", "recoger"):
         return jsonify({"status": "error", "message": "Acción inválida"}), 400
+    if send_teleop(arm_action=accion):
+        return jsonify({"status": "ok", "accion": accion, "via": "udp"})
     try:
-        url = f"http://{PICO_IP}:{PICO_PORT}/brazo?accion={accion}"
-        res = requests.get(url, timeout=1)
+        res = pico_command(f"/brazo?accion={accion}")
         if res.status_code == 200:
             return jsonify({"status": "ok", "accion": accion})
         else:
@@ -213,4 +998,8 @@ def brazo():
 
 # --- Lanzamiento del servidor ---
 if __name__ == "__main__":
+    if UPLOAD_KEEPALIVE_PORT:
+        start_upload_listener()
+    if FRAME_TRANSPORT_PORT:
+        start_frame_receiver()
     app.run(host="0.0.0.0", port=8000)
@@ -0,0 +1,336 @@
+# Modo de servicio asíncrono (aiohttp) con las mismas rutas que SERVERUNIDO.py.
+# La recepción de frames, el envío de imágenes y los comandos a la Pico
+# corren de forma concurrente en un solo bucle de eventos; la conversión y la
+# compresión de imágenes van a un pool de hilos.
+# Uso: python async_server.py
+
+import asyncio
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web, ClientSession, ClientTimeout
+from werkzeug.security import safe_join
+
+import SERVERUNIDO as servidor
+import frame_transport
+
+CONVERT_WORKERS = 4
+COMMAND_TIMEOUT = 1
+
+executor = ThreadPoolExecutor(max_workers=CONVERT_WORKERS, thread_name_prefix="convert")
+
+# --- Notificación de frames nuevos dentro del bucle de eventos ---
+class FrameNotifier:
+    def __init__(self, ring, devices, loop):
+        self.loop = loop
+        self.condition = asyncio.Condition()
+        ring.add_listener(self._on_frame)
+        devices.add_listener(self._on_frame)
+
+    def _on_frame(self, frame):
+        # Se llama desde el hilo que hizo el push.
+        self.loop.call_soon_threadsafe(self.loop.create_task, self._notify())
+
+    async def _notify(self):
+        async with self.condition:
+            self.condition.notify_all()
+
+    @staticmethod
+    def _has_newer(ring, seq):
+        frame = ring.latest()
+        return frame is not None and frame.seq > seq
+
+    async def wait_newer(self, ring, seq, timeout):
+        async with self.condition:
+            try:
+                await asyncio.wait_for(self.condition.wait_for(lambda: self._has_newer(ring, seq)), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return ring.latest()
+
+def run_in_executor(func, *args):
+    return asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+# --- CORS ---
+@web.middleware
+async def cors_middleware(request, handler):
+    response = await handler(request)
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+# --- Rutas de imagen ---
+async def read_upload(request, camera, received):
+    # RGB565 sin comprimir: se convierte por bloques en el pool mientras
+    # aiohttp sigue recibiendo el resto del cuerpo.
+    if request.headers.get("X-Encoding") or request.content_length is None:
+        data = await request.read()
+        return await run_in_executor(functools.partial(servidor.ingest_frame, data, *camera, received=received))
+    try:
+        header = await request.content.readexactly(4)
+    except asyncio.IncompleteReadError as e:
+        header = e.partial
+    encoder = servidor.stream_encoder(header, request.content_length)
+    while not encoder.done:
+        chunk = await request.content.read(servidor.UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        encoder.write(chunk)
+        await run_in_executor(encoder.convert)
+    return await run_in_executor(functools.partial(servidor.finish_stream, encoder, request.content_length, *camera,
+                                                   received=received))
+
+async def upload_image(request):
+    received = time.time()
+    # client_max_size solo limita request.read(); la ruta por bloques lee el
+    # cuerpo directo, así que el límite se aplica acá como en KeepAliveUploadHandler.
+    if request.content_length is not None and request.content_length > servidor.MAX_UPLOAD_BYTES:
+        return web.json_response({"status": "error", "message": "Tamaño de cuerpo inválido."}, status=413,
+                                 headers=servidor.UPLOAD_RESPONSE_HEADERS)
+    try:
+        frame = await read_upload(request, servidor.camera_headers(request.headers), received)
+    except servidor.StaleBaseError as e:
+        return web.json_response({"status": "error", "message": str(e)}, status=409,
+                                 headers=servidor.UPLOAD_RESPONSE_HEADERS)
+    except ValueError as e:
+        return web.json_response({"status": "error", "message": str(e)}, status=400,
+                                 headers=servidor.UPLOAD_RESPONSE_HEADERS)
+    return web.json_response({"status": "ok", "filename": frame.filename, "seq": frame.seq},
+                             headers=servidor.UPLOAD_RESPONSE_HEADERS)
+
+async def image_response(request, frame):
+    try:
+        fmt, quality = servidor.requested_format(request.query, request.headers.get("Accept"))
+        scale = servidor.requested_scale(request.query)
+    except ValueError as e:
+        return web.json_response({"status": "error", "message": str(e)}, status=400)
+    body = await asyncio.wrap_future(servidor.submit_render(frame, fmt, quality, scale))
+    servidor.note_served(frame, "image")
+    return web.Response(body=body, content_type=servidor.IMAGE_MIMETYPES[fmt],
+                        headers={"Cache-Control": "no-cache", "Vary": "Accept"})
+
+async def serve_image(request):
+    filename = request.match_info["filename"]
+    frame = await run_in_executor(servidor.lookup_frame_by_name, filename)
+    if frame:
+        return await image_response(request, frame)
+    path = safe_join(servidor.IMAGE_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        raise web.HTTPNotFound()
+    return web.FileResponse(path, headers={"Cache-Control": "no-cache"})
+
+def device_ring(request):
+    device = servidor.devices.get(request.match_info["device_id"])
+    if device is None:
+        raise web.HTTPNotFound()
+    return device.ring
+
+async def latest_frame(request, ring):
+    since = request.query.get("since")
+    if since is not None and since.lstrip("-").isdigit():
+        notifier = request.app["notifier"]
+        return await notifier.wait_newer(ring, int(since), servidor.LONG_POLL_TIMEOUT) or ring.latest()
+    return ring.latest()
+
+async def serve_image_by_seq(request):
+    frame = await run_in_executor(servidor.lookup_frame, int(request.match_info["seq"]))
+    if frame is None:
+        raise web.HTTPNotFound()
+    return await image_response(request, frame)
+
+async def serve_image_at(request):
+    try:
+        timestamp = float(request.match_info["timestamp"])
+    except ValueError:
+        raise web.HTTPBadRequest()
+    frame = await run_in_executor(servidor.lookup_frame, None, timestamp, request.query.get("device"))
+    if frame is None:
+        raise web.HTTPNotFound()
+    return await image_response(request, frame)
+
+async def last_image_name(request):
+    return web.json_response(servidor.frame_info(await latest_frame(request, servidor.frame_ring)))
+
+async def storage_stats(request):
+    return web.json_response(servidor.storage_info())
+
+async def metrics_endpoint(request):
+    return web.Response(body=servidor.metrics.render().encode(),
+                        headers={"Content-Type": servidor.METRICS_CONTENT_TYPE})
+
+# --- Cámaras ---
+async def list_devices(request):
+    return web.json_response({d.device_id: {**d.stats.as_dict(), "last_image": servidor.frame_info(d.ring.latest())}
+                              for d in servidor.devices.all()})
+
+async def device_stats(request):
+    device = servidor.devices.get(request.match_info["device_id"])
+    if device is None:
+        raise web.HTTPNotFound()
+    return web.json_response(device.stats.as_dict())
+
+async def upload_telemetry(request):
+    try:
+        servidor.ingest_telemetry(request.headers.get("X-Device-ID", ""), await request.read())
+    except ValueError as e:
+        return web.json_response({"status": "error", "message": str(e)}, status=400)
+    return web.json_response({"status": "ok"})
+
+async def device_telemetry(request):
+    since = request.query.get("since")
+    try:
+        since = float(since) if since else None
+    except ValueError:
+        since = None
+    reports = servidor.telemetry_store.get(request.match_info["device_id"], since)
+    if reports is None:
+        raise web.HTTPNotFound()
+    return web.json_response({"device": request.match_info["device_id"], "reports": reports})
+
+async def device_last_image_name(request):
+    return web.json_response(servidor.frame_info(await latest_frame(request, device_ring(request))))
+
+async def frame_events(request):
+    last_id = request.headers.get("Last-Event-ID", request.query.get("since", "0"))
+    seq = int(last_id) if last_id.isdigit() else 0
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+    notifier = request.app["notifier"]
+    try:
+        while True:
+            frame = await notifier.wait_newer(servidor.frame_ring, seq, servidor.SSE_KEEPALIVE)
+            if frame is None:
+                await response.write(b": keepalive\n\n")
+                continue
+            seq = frame.seq
+            data = json.dumps(servidor.frame_info(frame))
+            await response.write(f"id: {seq}\nevent: frame\ndata: {data}\n\n".encode())
+    except ConnectionResetError:
+        pass
+    return response
+
+async def stream_response(request, ring):
+    response = web.StreamResponse(headers={
+        "Content-Type": f"multipart/x-mixed-replace; boundary={servidor.STREAM_BOUNDARY}",
+        "Cache-Control": "no-cache",
+    })
+    await response.prepare(request)
+    notifier = request.app["notifier"]
+    seq = 0
+    try:
+        while True:
+            frame = await notifier.wait_newer(ring, seq, 10)
+            if frame is None:
+                continue
+            seq = frame.seq
+            part = await run_in_executor(frame.get_encoded, "mjpeg", servidor.encode_stream_part)
+            servidor.note_served(frame, "mjpeg")
+            await response.write(part)
+    except ConnectionResetError:
+        pass
+    return response
+
+async def mjpeg_stream(request):
+    return await stream_response(request, servidor.frame_ring)
+
+async def device_mjpeg_stream(request):
+    return await stream_response(request, device_ring(request))
+
+async def view_image(request):
+    return web.Response(text=servidor.view_image_html(request.match_info["image_name"]), content_type="text/html")
+
+async def stream_page(request):
+    return web.Response(text=servidor.STREAM_PAGE_HTML, content_type="text/html")
+
+# --- Comandos a la Pico de control ---
+async def pico_get(request, path):
+    url = f"http://{servidor.PICO_IP}:{servidor.PICO_PORT}{path}"
+    async with request.app["session"].get(url) as res:
+        await res.read()
+        return res.status
+
+async def move(request):
+    data = await request.json()
+    direction = data.get("direction", "stop")
+    speed = data.get("speed", 0)
+    if not isinstance(speed, int) or not 0 <= speed <= servidor.TELEOP_MAX_SPEED:
+        return web.json_response({"status": "error", "message": f"Velocidad inválida (0-{servidor.TELEOP_MAX_SPEED})"},
+                                 status=400)
+    if direction in servidor.TELEOP_DIRECTIONS:
+        if await run_in_executor(servidor.send_teleop, direction, speed):
+            return web.json_response({"status": "ok", "message": f"Comando '{direction}' enviado a la Pico W", "via": "udp"})
+    try:
+        status = await pico_get(request, f"/motor?dir={direction}")
+        if status == 200:
+            return web.json_response({"status": "ok", "message": f"Comando '{direction}' enviado a la Pico W"})
+        return web.json_response({"status": "error", "message": f"Respuesta: {status}"}, status=500)
+    except Exception as e:
+        return web.json_response({"status": "error", "message": str(e) or type(e).__name__}, status=500)
+
+async def brazo(request):
+    accion = request.query.get("accion", "")
+    if accion not in ("alzar", "recoger"):
+        return web.json_response({"status": "error", "message": "Acción inválida"}, status=400)
+    if await run_in_executor(servidor.send_teleop, None, 0, accion):
+        return web.json_response({"status": "ok", "accion": accion, "via": "udp"})
+    try:
+        status = await pico_get(request, f"/brazo?accion={accion}")
+        if status == 200:
+            return web.json_response({"status": "ok", "accion": accion})
+        return web.json_response({"status": "error", "message": f"Respuesta: {status}"}, status=500)
+    except Exception as e:
+        return web.json_response({"status": "error", "message": str(e) or type(e).__name__}, status=500)
+
+# --- Aplicación ---
+async def on_startup(app):
+    app["notifier"] = FrameNotifier(servidor.frame_ring, servidor.devices, asyncio.get_running_loop())
+    app["session"] = ClientSession(timeout=ClientTimeout(total=COMMAND_TIMEOUT))
+
+async def on_cleanup(app):
+    await app["session"].close()
+
+async def start_frame_receivers(app):
+    app["frame_receivers"] = await frame_transport.start_receivers(
+        "0.0.0.0", servidor.FRAME_TRANSPORT_PORT, servidor.frame_assembler, servidor.ingest_transport_frame,
+        servidor.TRANSPORT_ENCODINGS, executor)
+
+async def stop_frame_receivers(app):
+    udp, tcp = app["frame_receivers"]
+    udp.close()
+    tcp.close()
+    await tcp.wait_closed()
+
+def create_app():
+    app = web.Application(middlewares=[cors_middleware], client_max_size=servidor.MAX_UPLOAD_BYTES)
+    app.router.add_post("/upload_raw_image_flash/", upload_image)
+    app.router.add_get(r"/image/seq/{seq:\d+}", serve_image_by_seq)
+    app.router.add_get("/image/at/{timestamp}", serve_image_at)
+    app.router.add_get("/image/{filename:.+}", serve_image)
+    app.router.add_get("/last_image_name", last_image_name)
+    app.router.add_get("/storage", storage_stats)
+    app.router.add_get("/metrics", metrics_endpoint)
+    app.router.add_get("/events", frame_events)
+    app.router.add_get("/mjpeg", mjpeg_stream)
+    app.router.add_get("/devices", list_devices)
+    app.router.add_get("/device/{device_id}/stats", device_stats)
+    app.router.add_get("/device/{device_id}/last_image_name", device_last_image_name)
+    app.router.add_get("/device/{device_id}/mjpeg", device_mjpeg_stream)
+    app.router.add_post("/telemetry", upload_telemetry)
+    app.router.add_get("/device/{device_id}/telemetry", device_telemetry)
+    app.router.add_get("/view_image/{image_name}", view_image)
+    app.router.add_get("/stream", stream_page)
+    app.router.add_post("/move", move)
+    app.router.add_post("/brazo", brazo)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+if __name__ == "__main__":
+    app = create_app()
+    if servidor.FRAME_TRANSPORT_PORT:
+        # Solo al lanzar el servidor: las pruebas crean varias aplicaciones.
+        app.on_startup.append(start_frame_receivers)
+        app.on_cleanup.append(stop_frame_receivers)
+    web.run_app(app, host="0.0.0.0", port=8000)
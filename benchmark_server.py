@@ -0,0 +1,532 @@
+# Benchmarks del pipeline de imagen del servidor (SERVERUNIDO.py).
+# Uso: python benchmark_server.py [--repeticiones N] [--carga] [--comandos]
+#      python benchmark_server.py --pipeline [--frames N] [--json salida.json] [--comparar anterior.json]
+#      python benchmark_server.py --codec [--frames N]
+#      python benchmark_server.py --enlace [--frames N] [--rtt-ms MS]
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import image_utils
+
+# Mismas resoluciones que OV7670_WRAPPER_SIZE_* en RASPBERRY_CAMARA/ov7670_wrapper.py
+RESOLUCIONES = [
+    ("DIV1", 640, 480),
+    ("DIV2", 320, 240),
+    ("DIV4", 160, 120),
+    ("DIV8", 80, 60),
+    ("DIV16", 40, 30),
+]
+
+def frame_sintetico(width, height):
+    return os.urandom(width * height * 2)
+
+def medir(func, *args, repeticiones=5):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        func(*args)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+def bench_conversion(repeticiones):
+    print("--- rgb565_to_rgb888: bucle Python vs vectorizado ---")
+    print(f"{'tamaño':<8}{'resolución':>12}{'bucle ms':>12}{'vector ms':>12}{'aceleración':>13}")
+    for nombre, width, height in RESOLUCIONES:
+        data = frame_sintetico(width, height)
+        if image_utils.np is not None:
+            assert image_utils._rgb565_to_rgb888_np(data) == image_utils._rgb565_to_rgb888_py(data)
+            t_vec = medir(image_utils._rgb565_to_rgb888_np, data, repeticiones=repeticiones)
+        else:
+            t_vec = float("nan")
+        t_loop = medir(image_utils._rgb565_to_rgb888_py, data, repeticiones=repeticiones)
+        print(f"{nombre:<8}{f'{width}x{height}':>12}{t_loop * 1000:>12.2f}{t_vec * 1000:>12.2f}{t_loop / t_vec:>12.1f}x")
+
+# --- Pipeline completo por resolución ---
+# Etapas sueltas (conversión, BMP, disco, JPEG) y el recorrido
+# /upload_raw_image_flash/ -> /image/<nombre> con el cliente de prueba de
+# Flask. Las etapas del servidor salen de frame.timeline. El resultado se
+# puede guardar en JSON y comparar con el de otro commit.
+
+def _mediana_ms(valores):
+    return round(_percentil(valores, 50) * 1000, 3) if valores else None
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def _etapas(width, height, repeticiones, directorio):
+    data = frame_sintetico(width, height)
+    bgr = image_utils.rgb565_to_bgr888_buffer(data)
+    bmp = image_utils.encode_bmp(width, height, bgr)
+    ruta = os.path.join(directorio, "bench.bmp")
+    etapas = {
+        "rgb565_to_rgb888": medir(image_utils.rgb565_to_rgb888, data, repeticiones=repeticiones),
+        "encode_bmp": medir(image_utils.encode_bmp, width, height, bgr, repeticiones=repeticiones),
+        "save_bmp": medir(image_utils.save_bmp, width, height, bgr, ruta, repeticiones=repeticiones),
+    }
+    if "jpeg" in image_utils.available_formats():
+        etapas["encode_jpeg"] = medir(image_utils.encode_image, width, height, bmp, "jpeg", 75,
+                                      repeticiones=repeticiones)
+    return {nombre: round(t * 1000, 3) for nombre, t in etapas.items()}
+
+def _recorrido(servidor, client, cuerpos, n):
+    # n subidas seguidas de la descarga del mismo frame en BMP.
+    subidas, descargas, frames = [], [], []
+    inicio = time.perf_counter()
+    for i in range(n):
+        t0 = time.perf_counter()
+        res = client.post("/upload_raw_image_flash/", data=cuerpos[i % len(cuerpos)],
+                          headers={"X-Device-ID": "bench", "X-Sequence": str(i + 1)})
+        t1 = time.perf_counter()
+        assert res.status_code == 200, res.get_data(as_text=True)
+        nombre = res.get_json()["filename"]
+        assert client.get(f"/image/{nombre}").status_code == 200
+        subidas.append(t1 - t0)
+        descargas.append(time.perf_counter() - t1)
+        frames.append(servidor.lookup_frame(res.get_json()["seq"]))
+    total = time.perf_counter() - inicio
+    return total, subidas, descargas, frames
+
+def bench_pipeline(n, repeticiones, salida=None, comparar=None):
+    # SERVERUNIDO crea sus carpetas al importarse: se trabaja en un
+    # directorio temporal para no tocar las del proyecto.
+    directorio = tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.chdir(directorio)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import SERVERUNIDO as servidor
+    client = servidor.app.test_client()
+    resultados = {}
+    print(f"--- Pipeline del servidor ({n} frames por resolución, persistencia: {servidor.PERSIST_FORMAT}) ---")
+    print(f"{'tamaño':<8}{'resolución':>12}{'frames/s':>10}{'subida ms':>11}{'imagen ms':>11}"
+          f"{'conv ms':>9}{'disco ms':>10}{'entrega ms':>12}{'pico MB':>9}")
+    for nombre, width, height in RESOLUCIONES:
+        # Frames distintos entre sí para que no se deduplique ninguno.
+        cuerpos = [width.to_bytes(2, "big") + height.to_bytes(2, "big") + frame_sintetico(width, height)
+                   for _ in range(4)]
+        etapas = _etapas(width, height, repeticiones, directorio)
+        _recorrido(servidor, client, cuerpos, 3)   # Calentamiento
+        total, subidas, descargas, frames = _recorrido(servidor, client, cuerpos, n)
+        if servidor.disk_writer:
+            servidor.disk_writer.queue.join()
+        lineas = [f.timeline for f in frames if f is not None]
+        conversion = [t["converted"] - t["received"] for t in lineas]
+        disco = [t["persisted"] - t["received"] for t in lineas if "persisted" in t]
+        entrega = [t["first_served"] - t["received"] for t in lineas if "first_served" in t]
+        # Memoria en una pasada aparte: tracemalloc frena la ejecución.
+        tracemalloc.start()
+        _recorrido(servidor, client, cuerpos, min(n, 10))
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        fila = {
+            "resolucion": f"{width}x{height}",
+            "frames_por_segundo": round(n / total, 2),
+            "subida_ms": _mediana_ms(subidas),
+            "imagen_ms": _mediana_ms(descargas),
+            "conversion_ms": _mediana_ms(conversion),
+            "persistencia_ms": _mediana_ms(disco),
+            "primera_entrega_ms": _mediana_ms(entrega),
+            "pico_memoria_bytes": pico,
+            "etapas_ms": etapas,
+        }
+        resultados[nombre] = fila
+        print(f"{nombre:<8}{fila['resolucion']:>12}{fila['frames_por_segundo']:>10.1f}{fila['subida_ms']:>11.2f}"
+              f"{fila['imagen_ms']:>11.2f}{fila['conversion_ms']:>9.2f}{fila['persistencia_ms'] or 0:>10.2f}"
+              f"{fila['primera_entrega_ms']:>12.2f}{pico / 1e6:>9.2f}")
+    columnas = list(next(iter(resultados.values()))["etapas_ms"])
+    print("etapas sueltas (ms):")
+    print(f"{'tamaño':<8}" + "".join(f"{c:>18}" for c in columnas))
+    for nombre, fila in resultados.items():
+        print(f"{nombre:<8}" + "".join(f"{fila['etapas_ms'][c]:>18.3f}" for c in columnas))
+    informe = {
+        "commit": _commit(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": getattr(image_utils.np, "__version__", None),
+        "frames": n,
+        "resultados": resultados,
+    }
+    if salida:
+        with open(salida, "w") as f:
+            json.dump(informe, f, indent=2)
+        print(f"resultados guardados en {salida}")
+    if comparar:
+        comparar_informes(comparar, informe)
+    shutil.rmtree(directorio, ignore_errors=True)
+    return informe
+
+def comparar_informes(ruta, actual):
+    with open(ruta) as f:
+        anterior = json.load(f)
+    print(f"--- Comparación con {anterior.get('commit')} ({anterior.get('fecha')}) ---")
+    print(f"{'tamaño':<8}{'frames/s':>22}{'subida ms':>22}{'pico MB':>22}")
+    for nombre, fila in actual["resultados"].items():
+        previa = anterior["resultados"].get(nombre)
+        if previa is None:
+            continue
+        celdas = []
+        for clave, escala in (("frames_por_segundo", 1), ("subida_ms", 1), ("pico_memoria_bytes", 1e-6)):
+            antes, ahora = previa[clave] * escala, fila[clave] * escala
+            cambio = (ahora - antes) / antes * 100 if antes else 0.0
+            celdas.append(f"{antes:.2f} -> {ahora:.2f} ({cambio:+.0f}%)")
+        print(f"{nombre:<8}" + "".join(f"{c:>22}" for c in celdas))
+
+# --- Códec xor-rle de la cámara ---
+# Bytes por frame en escenas sintéticas y costo de codificar/decodificar en
+# el host. La codificación en la Pico es codificar_xor_rle (viper); su costo
+# real lo imprime la cámara en sus estadísticas ("Enc: ... ms").
+
+def _escenas(width, height, n):
+    np = image_utils.np
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    fondo = (((x * 31 // max(1, width - 1)) << 11) | ((y * 63 // max(1, height - 1)) << 5) | 12).astype(">u2")
+
+    def ruido(frame, probabilidad):
+        # Ruido de sensor: el bit bajo del verde cambia en parte de los píxeles.
+        mascara = rng.random(frame.shape) < probabilidad
+        return frame ^ (mascara.astype(">u2") << 5)
+
+    def movil(i):
+        frame = fondo.copy()
+        lado = max(2, width // 8)
+        x0 = (i * max(1, width // 40)) % (width - lado)
+        frame[height // 3:height // 3 + lado, x0:x0 + lado] = 0xF800
+        return frame
+
+    return {
+        "estática": [fondo.tobytes()] * n,
+        "ruido 5%": [ruido(fondo, 0.05).tobytes() for _ in range(n)],
+        "ruido 30%": [ruido(fondo, 0.30).tobytes() for _ in range(n)],
+        "objeto móvil": [movil(i).tobytes() for i in range(n)],
+        "ruido total": [frame_sintetico(width, height) for _ in range(n)],
+    }
+
+def bench_codec(n):
+    import frame_codec
+    if image_utils.np is None:
+        print("--codec necesita NumPy para generar las escenas")
+        return
+    print(f"--- Códec xor-rle ({n} frames por escena; el primero va sin base) ---")
+    print(f"{'tamaño':<8}{'escena':<14}{'crudo B':>9}{'clave B':>9}{'delta B':>9}{'relación':>10}"
+          f"{'cod ms':>8}{'dec ms':>8}")
+    for nombre, width, height in RESOLUCIONES:
+        for escena, frames in _escenas(width, height, n).items():
+            clave = frame_codec.encode_xor_rle(frames[0])
+            if int.from_bytes(clave[:4], "big") > frame_codec.max_controls(len(frames[0])):
+                clave = frames[0]
+            deltas, t_cod, t_dec = [], [], []
+            for previo, actual in zip(frames, frames[1:]):
+                inicio = time.perf_counter()
+                cuerpo = frame_codec.encode_xor_rle(actual, previo)
+                t_cod.append(time.perf_counter() - inicio)
+                inicio = time.perf_counter()
+                assert frame_codec.decode_xor_rle(cuerpo, len(actual), previo) == actual
+                t_dec.append(time.perf_counter() - inicio)
+                # Como la cámara: si no comprime o no le alcanzan los
+                # controles, va crudo.
+                if int.from_bytes(cuerpo[:4], "big") > frame_codec.max_controls(len(actual)):
+                    cuerpo = actual
+                deltas.append(min(len(cuerpo), len(actual)))
+            crudo = width * height * 2
+            delta = sum(deltas) / len(deltas)
+            print(f"{nombre:<8}{escena:<14}{crudo:>9}{min(len(clave), crudo):>9}{delta:>9.0f}"
+                  f"{crudo / delta:>9.1f}x{_percentil(t_cod, 50) * 1000:>8.2f}{_percentil(t_dec, 50) * 1000:>8.2f}")
+
+# --- Enlace de la cámara: conexión por frame vs persistente ---
+# EnlaceSimulado arma las mismas peticiones que Uplink en
+# RASPBERRY_CAMARA/main.py. Sin keep_alive abre una conexión por frame, como
+# hacía urequests. rtt simula el viaje de ida y vuelta por WiFi: se paga al
+# abrir la conexión (handshake) y en cada frame. "envío ms" es lo que la
+# cámara reporta como send_time.
+
+class EnlaceSimulado:
+    def __init__(self, port, keep_alive, rtt):
+        self.port = port
+        self.keep_alive = keep_alive
+        self.rtt = rtt
+        self.sock = None
+        self.conexiones = 0
+
+    def post(self, width, height, cuerpo, seq):
+        if self.sock is None:
+            time.sleep(self.rtt)
+            self.sock = socket.create_connection(("127.0.0.1", self.port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.respuestas = self.sock.makefile("rb")
+            self.conexiones += 1
+        time.sleep(self.rtt)
+        cabeceras = (f"POST /upload_raw_image_flash/ HTTP/1.1\r\nHost: 127.0.0.1:{self.port}\r\n"
+                     f"Content-Type: application/octet-stream\r\nX-Device-ID: bench\r\n"
+                     f"X-Sequence: {seq}\r\nContent-Length: {4 + len(cuerpo)}\r\n"
+                     + ("" if self.keep_alive else "Connection: close\r\n") + "\r\n")
+        self.sock.sendall(cabeceras.encode())
+        self.sock.sendall(width.to_bytes(2, "big") + height.to_bytes(2, "big"))
+        self.sock.sendall(cuerpo)
+        linea = self.respuestas.readline()
+        status = int(linea.split()[1])
+        abierta = linea.startswith(b"HTTP/1.1") and self.keep_alive
+        largo = 0
+        while True:
+            linea = self.respuestas.readline()
+            if linea in (b"\r\n", b""):
+                break
+            nombre, _, valor = linea.decode().partition(":")
+            if nombre.strip().lower() == "content-length":
+                largo = int(valor)
+            elif nombre.strip().lower() == "connection" and valor.strip().lower() == "close":
+                abierta = False
+        self.respuestas.read(largo)
+        if not abierta:
+            self.cerrar()
+        return status
+
+    def cerrar(self):
+        if self.sock:
+            self.respuestas.close()
+            self.sock.close()
+            self.sock = None
+
+def bench_enlace(n, rtt_ms):
+    import logging
+    from werkzeug.serving import make_server
+    directorio = tempfile.mkdtemp(prefix="bench_enlace_")
+    os.chdir(directorio)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import SERVERUNIDO as servidor
+    import async_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    flask = make_server("127.0.0.1", 0, servidor.app, threaded=True)
+    threading.Thread(target=flask.serve_forever, daemon=True).start()
+    persistente = servidor.start_upload_listener("127.0.0.1", 0)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    runner, aio_port = asyncio.run_coroutine_threadsafe(_iniciar(async_server.create_app()), loop).result()
+    casos = [
+        ("SERVERUNIDO, conexión por frame", flask.server_port, False),
+        ("SERVERUNIDO, persistente", persistente.server_port, True),
+        ("async_server, conexión por frame", aio_port, False),
+        ("async_server, persistente", aio_port, True),
+    ]
+    print(f"--- Enlace de la cámara ({n} frames por caso, RTT simulado {rtt_ms} ms) ---")
+    print(f"{'tamaño':<8}{'modo':<34}{'envío ms':>10}{'p95 ms':>9}{'FPS':>8}{'conexiones':>12}")
+    for nombre, width, height in RESOLUCIONES:
+        cuerpos = [frame_sintetico(width, height) for _ in range(4)]
+        for caso, port, keep_alive in casos:
+            enlace = EnlaceSimulado(port, keep_alive, rtt_ms / 1000)
+            tiempos = []
+            inicio = time.perf_counter()
+            for i in range(n):
+                t0 = time.perf_counter()
+                assert enlace.post(width, height, cuerpos[i % len(cuerpos)], i + 1) == 200
+                tiempos.append(time.perf_counter() - t0)
+            total = time.perf_counter() - inicio
+            enlace.cerrar()
+            print(f"{nombre:<8}{caso:<34}{_percentil(tiempos, 50) * 1000:>10.2f}{_percentil(tiempos, 95) * 1000:>9.2f}"
+                  f"{n / total:>8.1f}{enlace.conexiones:>12}")
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    flask.shutdown()
+    persistente.shutdown()
+    shutil.rmtree(directorio, ignore_errors=True)
+
+# --- Prueba de carga del servidor asíncrono ---
+async def _iniciar(app, host="127.0.0.1"):
+    from aiohttp import web
+    runner = web.AppRunner(app, shutdown_timeout=1)
+    await runner.setup()
+    site = web.TCPSite(runner, host, 0)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+async def _pico_lenta(request):
+    # Simula una Pico que no responde dentro del timeout de los comandos.
+    await asyncio.sleep(5)
+    from aiohttp import web
+    return web.Response(text="OK")
+
+async def _subir_frames(session, base, cuerpo, fin, fps):
+    # Una cámara que intenta mantener fps frames por segundo.
+    loop = asyncio.get_running_loop()
+    intervalo = 1.0 / fps
+    siguiente = loop.time()
+    enviados = 0
+    while loop.time() < fin:
+        async with session.post(f"{base}/upload_raw_image_flash/", data=cuerpo) as res:
+            await res.read()
+            enviados += res.status == 200
+        siguiente += intervalo
+        await asyncio.sleep(max(0, siguiente - loop.time()))
+    return enviados
+
+async def _ver_mjpeg(session, base):
+    async with session.get(f"{base}/mjpeg") as res:
+        while True:
+            await res.content.read(64 * 1024)
+
+async def _controlar(session, base):
+    while True:
+        async with session.post(f"{base}/move", json={"direction": "forward"}) as res:
+            await res.read()
+
+async def _fase(base, cuerpo, segundos, uploaders, fps, viewers, controles):
+    from aiohttp import ClientSession
+    async with ClientSession() as session:
+        fin = asyncio.get_running_loop().time() + segundos
+        extra = [asyncio.create_task(_ver_mjpeg(session, base)) for _ in range(viewers)]
+        extra += [asyncio.create_task(_controlar(session, base)) for _ in range(controles)]
+        enviados = await asyncio.gather(*[_subir_frames(session, base, cuerpo, fin, fps) for _ in range(uploaders)])
+        for tarea in extra:
+            tarea.cancel()
+        await asyncio.gather(*extra, return_exceptions=True)
+    return sum(enviados) / segundos
+
+async def _carga(segundos, uploaders, fps, viewers, controles):
+    from aiohttp import web
+    import async_server
+    import SERVERUNIDO
+
+    pico = web.Application()
+    pico.router.add_get("/motor", _pico_lenta)
+    pico_runner, pico_port = await _iniciar(pico)
+    SERVERUNIDO.PICO_IP, SERVERUNIDO.PICO_PORT = "127.0.0.1", pico_port
+    # Todas las cámaras suben el mismo cuerpo: sin esto casi todos los frames
+    # se deduplicarían y no se mediría la conversión.
+    SERVERUNIDO.DEDUP_ENABLED = False
+    runner, port = await _iniciar(async_server.create_app())
+    base = f"http://127.0.0.1:{port}"
+
+    width, height = 160, 120
+    cuerpo = width.to_bytes(2, "big") + height.to_bytes(2, "big") + frame_sintetico(width, height)
+    print(f"--- Carga del servidor asíncrono ({width}x{height}, {uploaders} cámaras a {fps} FPS, {segundos}s por fase) ---")
+    print(f"objetivo:                             {uploaders * fps:8.1f} frames/s")
+    solo = await _fase(base, cuerpo, segundos, uploaders, fps, 0, 0)
+    print(f"solo recepción:                       {solo:8.1f} frames/s")
+    con_carga = await _fase(base, cuerpo, segundos, uploaders, fps, viewers, controles)
+    print(f"con {viewers} visores MJPEG y {controles} clientes /move: {con_carga:8.1f} frames/s ({con_carga / solo * 100:.0f}%)")
+    await runner.cleanup()
+    await pico_runner.cleanup()
+
+# --- Latencia de comandos a la Pico de control ---
+class PicoSimulada:
+    # Servidor local que imita handle_client de RASPBERRY_CONTROL/main.py.
+    # rtt simula el viaje de ida y vuelta por WiFi: se paga una vez al abrir
+    # la conexión (handshake) y otra por cada comando.
+    def __init__(self, keep_alive, rtt):
+        self.keep_alive = keep_alive
+        self.rtt = rtt
+        self.conexiones = 0
+        self.loop = asyncio.new_event_loop()
+        listo = threading.Event()
+        threading.Thread(target=self._run, args=(listo,), daemon=True).start()
+        listo.wait()
+
+    def _run(self, listo):
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._cliente, "127.0.0.1", 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        listo.set()
+        self.loop.run_forever()
+
+    async def _cliente(self, reader, writer):
+        self.conexiones += 1
+        await asyncio.sleep(self.rtt)
+        try:
+            while True:
+                linea = await reader.readline()
+                if not linea:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b""):
+                    pass
+                await asyncio.sleep(self.rtt)
+                if self.keep_alive:
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\n"
+                                 b"Connection: keep-alive\r\n\r\nOK")
+                    await writer.drain()
+                else:
+                    writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\n\r\nOK")
+                    await writer.drain()
+                    break
+        finally:
+            writer.close()
+
+    def cerrar(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+def bench_comandos(n, rtt_ms):
+    import requests
+    import SERVERUNIDO
+
+    rtt = rtt_ms / 1000
+    print(f"--- Comandos a la Pico ({n} comandos, RTT simulado {rtt_ms} ms) ---")
+    print(f"{'modo':<32}{'p50 ms':>10}{'p95 ms':>10}{'conexiones':>12}")
+    casos = [
+        ("requests.get + HTTP/1.0 close", False, lambda url: requests.get(url, timeout=1)),
+        ("pico_command + keep-alive", True, None),
+    ]
+    for nombre, keep_alive, enviar in casos:
+        pico = PicoSimulada(keep_alive, rtt)
+        SERVERUNIDO.PICO_IP, SERVERUNIDO.PICO_PORT = "127.0.0.1", pico.port
+        tiempos = []
+        for i in range(n):
+            direccion = "forward" if i % 2 else "stop"
+            inicio = time.perf_counter()
+            if enviar:
+                res = enviar(f"http://127.0.0.1:{pico.port}/motor?dir={direccion}")
+            else:
+                res = SERVERUNIDO.pico_command(f"/motor?dir={direccion}")
+            tiempos.append(time.perf_counter() - inicio)
+            assert res.status_code == 200
+        print(f"{nombre:<32}{_percentil(tiempos, 50) * 1000:>10.2f}{_percentil(tiempos, 95) * 1000:>10.2f}{pico.conexiones:>12}")
+        pico.cerrar()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del servidor de imagen")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--carga", action="store_true", help="prueba de carga de async_server.py")
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--uploaders", type=int, default=4)
+    parser.add_argument("--fps", type=float, default=20)
+    parser.add_argument("--viewers", type=int, default=4)
+    parser.add_argument("--controles", type=int, default=2)
+    parser.add_argument("--comandos", action="store_true", help="latencia de /move contra una Pico simulada")
+    parser.add_argument("--n", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=5)
+    parser.add_argument("--pipeline", action="store_true", help="subida -> /image/ en las cinco resoluciones")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--json", help="guardar los resultados de --pipeline en este archivo")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior de --pipeline")
+    parser.add_argument("--codec", action="store_true", help="bytes por frame del códec xor-rle de la cámara")
+    parser.add_argument("--enlace", action="store_true", help="subidas por conexión nueva vs persistente")
+    args = parser.parse_args()
+    if args.codec:
+        bench_codec(max(2, args.frames))
+    elif args.enlace:
+        bench_enlace(args.frames, args.rtt_ms)
+    elif args.pipeline:
+        bench_pipeline(args.frames, args.repeticiones, args.json and os.path.abspath(args.json),
+                       args.comparar and os.path.abspath(args.comparar))
+    elif args.comandos:
+        bench_comandos(args.n, args.rtt_ms)
+    elif args.carga:
+        asyncio.run(_carga(args.segundos, args.uploaders, args.fps, args.viewers, args.controles))
+    else:
+        bench_conversion(args.repeticiones)
@@ -0,0 +1,350 @@
+# Simulador de cámaras para pruebas de carga del servidor.
+# Cada cámara virtual habla el mismo protocolo que send_frame_pico en
+# RASPBERRY_CAMARA/main.py: POST a /upload_raw_image_flash/ con ancho y alto
+# (2 bytes big-endian cada uno) seguidos del RGB565, y las cabeceras
+# X-Device-ID, X-Sequence, X-Memory, X-JPEG-Quality, X-Capture-Ms, X-Send-Ms y
+# X-Frame-Interval-Ms (1000 / --fps).
+# Con --codec comprime con xor-rle cuando el servidor lo anuncia, igual que la
+# cámara (X-Encoding y X-Base-Sequence). Con --transporte udp/tcp manda
+# fragmentos al receptor de frame_transport.py como FragmentLink; por UDP
+# --truncados descarta un fragmento del frame. Con --telemetria N cada cámara
+# manda cada N segundos un reporte a /telemetry (telemetry.py) con el
+# histograma de sus envíos.
+# Por defecto sube como la cámara: al puerto de conexiones persistentes
+# (UPLOAD_KEEPALIVE_PORT, 8001) y lee /devices del puerto principal (8000). Con
+# async_server.py todo está en 8000: --url http://127.0.0.1:8000.
+# Uso: python camera_simulator.py --url http://127.0.0.1:8001 --camaras 4 --fps 20 --resolucion DIV4
+#      [--segundos 30] [--jitter-ms 20] [--perdida 0.02] [--truncados 0.01] [--archivo archivo] [--codec]
+#      [--transporte udp|tcp] [--puerto-transporte 8002] [--telemetria 10]
+
+import argparse
+import asyncio
+import random
+import time
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+
+import frame_codec
+import frame_transport
+import telemetry
+from benchmark_server import RESOLUCIONES, frame_sintetico, _percentil
+
+TICKS_PERIOD = 1 << 30   # Como time.ticks_ms() en MicroPython
+FRAGMENT_BYTES = 1400    # Config.FRAGMENT_BYTES de la cámara
+
+def ticks_ms():
+    return int(time.monotonic() * 1000) % TICKS_PERIOD
+
+def resolucion(valor):
+    for nombre, width, height in RESOLUCIONES:
+        if valor.upper() == nombre:
+            return width, height
+    width, _, height = valor.lower().partition("x")
+    return int(width), int(height)
+
+def frames_sinteticos(width, height, cantidad=8):
+    # Ruido distinto en cada frame: ninguno se deduplica en el servidor.
+    return [frame_sintetico(width, height) for _ in range(cantidad)]
+
+def frames_grabados(directorio, limite=200):
+    # Frames RGB565 de un archivo segmentado (frame_archive.FrameArchive).
+    from frame_archive import FrameArchive
+    archive = FrameArchive(directorio)
+    frames = [(e.width, e.height, bytes(archive.read(e))) for e in archive.entries[-limite:]]
+    archive.close()
+    if not frames:
+        raise SystemExit(f"No hay frames en {directorio}")
+    return frames
+
+class _Acks(asyncio.DatagramProtocol):
+    def __init__(self, camara):
+        self.camara = camara
+
+    def datagram_received(self, data, addr):
+        self.camara._ack(data)
+
+class CamaraVirtual:
+    def __init__(self, indice, url, frames, fps, jitter, perdida, truncados, keep_alive, codec=False,
+                 transporte="http", puerto_transporte=8002, telemetria=0):
+        self.device_id = f"SimCam_{indice:03d}"
+        self.url = url.rstrip("/") + "/upload_raw_image_flash/"
+        self.url_telemetria = url.rstrip("/") + "/telemetry"
+        self.telemetria = telemetria
+        self.reportes = 0
+        self.reportadas = 0       # Latencias ya incluidas en un reporte
+        self.host = url.split("://", 1)[-1].split("/", 1)[0].split(":", 1)[0]
+        self.transporte = transporte
+        self.puerto_transporte = puerto_transporte
+        self.udp = None
+        self.tcp = None
+        self.pendiente = None     # (seq, píxeles, inicio) del frame que espera su ACK
+        self.frames = frames
+        self.intervalo = 1.0 / fps
+        self.jitter = jitter
+        self.perdida = perdida
+        self.truncados = truncados
+        self.keep_alive = keep_alive
+        self.codec = codec
+        self.codec_activo = False
+        self.previo = None        # (seq, píxeles) del último frame aceptado
+        self.bytes_enviados = 0
+        self.seq = 0
+        self.enviados = 0
+        self.aceptados = 0
+        self.rechazados = 0
+        self.errores = 0
+        self.perdidos = 0
+        self.latencias = []
+
+    async def correr(self, fin):
+        loop = asyncio.get_running_loop()
+        if self.transporte == "udp":
+            self.udp, _ = await loop.create_datagram_endpoint(lambda: _Acks(self),
+                                                              remote_addr=(self.host, self.puerto_transporte))
+        # Sin keep_alive, una conexión HTTP por frame como hacía urequests.
+        connector = TCPConnector(force_close=not self.keep_alive, limit=1)
+        async with ClientSession(connector=connector, timeout=ClientTimeout(total=10)) as session:
+            siguiente = loop.time() + random.random() * self.intervalo   # Cámaras desfasadas
+            reporte = loop.time() + self.telemetria
+            while loop.time() < fin:
+                if self.telemetria and loop.time() >= reporte:
+                    await self._reportar(session, self.telemetria)
+                    reporte += self.telemetria
+                await asyncio.sleep(max(0, siguiente - loop.time()))
+                siguiente += self.intervalo
+                self.seq += 1
+                captura = ticks_ms()
+                if random.random() < self.perdida:
+                    # Frame perdido: la secuencia avanza pero no se envía.
+                    self.perdidos += 1
+                    continue
+                if self.jitter:
+                    await asyncio.sleep(random.uniform(0, self.jitter))
+                await self._enviar(session, captura)
+                if loop.time() > siguiente:
+                    # Como sender_thread_pico: si el envío tardó más que el
+                    # intervalo, el siguiente frame sale en cuanto se pueda.
+                    siguiente = loop.time()
+        await asyncio.sleep(0.2)   # Últimos ACK por UDP
+        if self.pendiente:
+            self._sin_ack()
+        if self.udp:
+            self.udp.close()
+        if self.tcp:
+            self.tcp[1].close()
+
+    async def _reportar(self, session, segundos):
+        # Como send_telemetry: solo el histograma de envíos tiene datos.
+        latencias = [round(t * 1e6) for t in self.latencias[self.reportadas:]]
+        self.reportadas = len(self.latencias)
+        buckets = [0] * telemetry.BUCKETS
+        for us in latencias:
+            buckets[telemetry.bucket_index(us)] += 1
+        vacio = (0, 0, 0, [0] * telemetry.BUCKETS)
+        histogramas = [(len(latencias), sum(latencias), max(latencias, default=0), buckets) if nombre == "send"
+                       else vacio for nombre in telemetry.HISTOGRAMS]
+        self.reportes += 1
+        cuerpo = telemetry.encode_report(self.reportes, round(segundos * 1000),
+                                         [self.seq, self.aceptados, self.errores + self.rechazados, self.perdidos,
+                                          0, random.randint(60000, 90000)], histogramas)
+        try:
+            async with session.post(self.url_telemetria, data=cuerpo,
+                                    headers={"X-Device-ID": self.device_id,
+                                             "Content-Type": "application/octet-stream"}) as res:
+                await res.read()
+        except (OSError, asyncio.TimeoutError, ClientError):
+            pass
+
+    def _codificar(self, pixels):
+        # Devuelve (cuerpo, base, comprimido). Misma regla que
+        # encode_frame_pico: base solo si el frame anterior fue aceptado, y
+        # crudo si no comprime.
+        if not self.codec_activo:
+            return pixels, 0, False
+        base = self.previo[0] if self.previo and self.previo[0] == self.seq - 1 else 0
+        codificado = frame_codec.encode_xor_rle(pixels, self.previo[1] if base else None)
+        if (len(codificado) < len(pixels)
+                and int.from_bytes(codificado[:4], "big") <= frame_codec.max_controls(len(pixels))):
+            return codificado, base, True
+        return pixels, 0, False
+
+    async def _enviar(self, session, captura):
+        if self.transporte != "http":
+            return await self._enviar_fragmentos(captura)
+        width, height, pixels = self.frames[self.seq % len(self.frames)]
+        datos, base, comprimido = self._codificar(pixels)
+        extra = {"X-Encoding": frame_codec.XOR_RLE, "X-Base-Sequence": str(base)} if comprimido else {}
+        cuerpo = width.to_bytes(2, "big") + height.to_bytes(2, "big") + datos
+        if random.random() < self.truncados:
+            cuerpo = cuerpo[:len(cuerpo) // 2]
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "X-Device-ID": self.device_id,
+            "X-Sequence": str(self.seq),
+            "X-Memory": str(random.randint(60000, 90000)),
+            "X-JPEG-Quality": "50",
+            "X-Capture-Ms": str(captura),
+            "X-Send-Ms": str(ticks_ms()),
+            "X-Frame-Interval-Ms": str(round(self.intervalo * 1000)),
+            **extra,
+        }
+        self.enviados += 1
+        self.bytes_enviados += len(cuerpo)
+        inicio = time.perf_counter()
+        try:
+            async with session.post(self.url, data=cuerpo, headers=headers) as res:
+                await res.read()
+                if self.codec and frame_codec.XOR_RLE in res.headers.get("X-Frame-Encodings", "").split(","):
+                    self.codec_activo = True
+                if res.status in (200, 201):
+                    self.previo = (self.seq, pixels)
+                    self.aceptados += 1
+                    self.latencias.append(time.perf_counter() - inicio)
+                else:
+                    self.previo = None   # 409 u otro rechazo: el próximo va sin base
+                    self.rechazados += 1
+        except (OSError, asyncio.TimeoutError) as e:
+            self.previo = None
+            self.errores += 1
+            if self.errores <= 3:
+                print(f"{self.device_id}: {type(e).__name__} {e}")
+
+    async def _enviar_fragmentos(self, captura):
+        # Como FragmentLink.send: fragmento 0 con los metadatos y el cuerpo
+        # en FRAGMENT_BYTES (UDP) o entero (TCP). Por UDP no se espera el ACK;
+        # si no llegó antes del próximo envío, el frame cuenta como error.
+        if self.pendiente:
+            self._sin_ack()
+        width, height, pixels = self.frames[self.seq % len(self.frames)]
+        datos, base, comprimido = self._codificar(pixels)
+        tamaño = FRAGMENT_BYTES if self.udp else len(datos)
+        partes = [datos[i:i + tamaño] for i in range(0, len(datos), tamaño)]
+        cantidad = len(partes) + 1
+        flags = frame_transport.FLAG_XOR_RLE if comprimido else 0
+        fragmentos = [frame_transport.FRAGMENT_HEADER.pack(frame_transport.MAGIC, frame_transport.VERSION, flags,
+                                                           self.seq, 0, cantidad)
+                      + frame_transport.FRAME_META.pack(width, height, len(datos), base, random.randint(60000, 90000),
+                                                        captura, ticks_ms(), 50, round(self.intervalo * 1000))
+                      + self.device_id.encode()]
+        fragmentos += [frame_transport.FRAGMENT_HEADER.pack(frame_transport.MAGIC, frame_transport.VERSION, flags,
+                                                            self.seq, i + 1, cantidad) + parte
+                       for i, parte in enumerate(partes)]
+        if self.udp and random.random() < self.truncados:
+            # Por TCP no se pierden fragmentos.
+            del fragmentos[random.randrange(len(fragmentos))]
+        self.enviados += 1
+        self.bytes_enviados += sum(len(f) for f in fragmentos)
+        self.pendiente = (self.seq, pixels, time.perf_counter())
+        try:
+            if self.udp:
+                for fragmento in fragmentos:
+                    self.udp.sendto(fragmento)
+                return
+            if self.tcp is None:
+                self.tcp = await asyncio.open_connection(self.host, self.puerto_transporte)
+            reader, writer = self.tcp
+            for fragmento in fragmentos:
+                writer.write(frame_transport.TCP_LENGTH.pack(len(fragmento)) + fragmento)
+            await writer.drain()
+            self._ack(await asyncio.wait_for(reader.readexactly(frame_transport.ACK.size),
+                                             max(1.0, self.intervalo * 4)))
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            # El frame queda pendiente y se cuenta al enviar el siguiente.
+            if self.tcp:
+                self.tcp[1].close()
+                self.tcp = None
+            if self.errores <= 3:
+                print(f"{self.device_id}: {type(e).__name__} {e}")
+
+    def _ack(self, data):
+        if len(data) != frame_transport.ACK.size:
+            return
+        magic, seq, estado, codecs = frame_transport.ACK.unpack(data)
+        if magic != frame_transport.ACK_MAGIC or not self.pendiente or seq != self.pendiente[0]:
+            return
+        _, pixels, inicio = self.pendiente
+        self.pendiente = None
+        if self.codec and codecs & 1:
+            self.codec_activo = True
+        if estado == frame_transport.ACK_OK:
+            self.previo = (seq, pixels)
+            self.aceptados += 1
+            self.latencias.append(time.perf_counter() - inicio)
+        else:
+            self.previo = None
+            self.rechazados += 1
+
+    def _sin_ack(self):
+        self.pendiente = None
+        self.previo = None
+        self.errores += 1
+
+async def estado_servidor(url, camaras):
+    # Lo que el servidor contó para cada cámara simulada (/devices).
+    try:
+        async with ClientSession(timeout=ClientTimeout(total=5)) as session:
+            async with session.get(url.rstrip("/") + "/devices") as res:
+                devices = await res.json()
+    except (OSError, asyncio.TimeoutError, ValueError, ClientError):
+        return None
+    return {c.device_id: devices.get(c.device_id, {}) for c in camaras}
+
+def _ms(valores, p):
+    return _percentil(valores, p) * 1000 if valores else float("nan")
+
+async def simular(args):
+    if args.archivo:
+        frames = frames_grabados(args.archivo)
+    else:
+        width, height = resolucion(args.resolucion)
+        frames = [(width, height, f) for f in frames_sinteticos(width, height)]
+    camaras = [CamaraVirtual(i + 1, args.url, frames, args.fps, args.jitter_ms / 1000, args.perdida,
+                             args.truncados, args.keep_alive, args.codec, args.transporte, args.puerto_transporte,
+                             args.telemetria)
+               for i in range(args.camaras)]
+    width, height = frames[0][0], frames[0][1]
+    print(f"--- {args.camaras} cámaras a {args.fps} FPS, {width}x{height}, {args.segundos}s contra {args.url} "
+          f"({args.transporte}) ---")
+    fin = asyncio.get_running_loop().time() + args.segundos
+    inicio = time.perf_counter()
+    await asyncio.gather(*[c.correr(fin) for c in camaras])
+    duracion = time.perf_counter() - inicio
+    servidor = await estado_servidor(args.url_estado, camaras)
+
+    print(f"{'cámara':<14}{'enviados':>9}{'aceptados':>10}{'tasa':>7}{'perdidos':>9}{'errores':>8}"
+          f"{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'srv frames':>11}{'srv faltan':>11}")
+    for c in camaras:
+        srv = (servidor or {}).get(c.device_id, {})
+        tasa = c.aceptados / c.enviados * 100 if c.enviados else 0.0
+        print(f"{c.device_id:<14}{c.enviados:>9}{c.aceptados:>10}{tasa:>6.1f}%{c.perdidos:>9}"
+              f"{c.errores + c.rechazados:>8}{_ms(c.latencias, 50):>8.1f}{_ms(c.latencias, 95):>8.1f}"
+              f"{_ms(c.latencias, 99):>8.1f}{srv.get('frames', '-'):>11}{srv.get('missing', '-'):>11}")
+    enviados = sum(c.enviados for c in camaras)
+    aceptados = sum(c.aceptados for c in camaras)
+    latencias = [t for c in camaras for t in c.latencias]
+    print(f"total: {aceptados}/{enviados} aceptados ({aceptados / max(1, enviados) * 100:.1f}%), "
+          f"{aceptados / duracion:.1f} frames/s (objetivo {args.camaras * args.fps:.1f}), "
+          f"latencia p50 {_ms(latencias, 50):.1f} ms, p95 {_ms(latencias, 95):.1f} ms, "
+          f"p99 {_ms(latencias, 99):.1f} ms, {sum(c.bytes_enviados for c in camaras) / max(1, enviados) / 1024:.1f} KB/frame")
+    if servidor is None:
+        print("(no se pudo leer /devices del servidor)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flota de cámaras virtuales para pruebas de carga")
+    parser.add_argument("--url", default="http://127.0.0.1:8001", help="destino de las subidas")
+    parser.add_argument("--url-estado", default="http://127.0.0.1:8000", help="servidor del que se lee /devices")
+    parser.add_argument("--camaras", type=int, default=4)
+    parser.add_argument("--fps", type=float, default=20)
+    parser.add_argument("--resolucion", default="DIV4", help="DIV1..DIV16 o ANCHOxALTO")
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--jitter-ms", type=float, default=0, help="retardo aleatorio antes de cada envío")
+    parser.add_argument("--perdida", type=float, default=0, help="probabilidad de que un frame no se envíe")
+    parser.add_argument("--truncados", type=float, default=0, help="probabilidad de enviar un cuerpo cortado")
+    parser.add_argument("--keep-alive", action="store_true", help="reutilizar la conexión, como hace la cámara")
+    parser.add_argument("--archivo", help="usar frames grabados de un archivo segmentado en lugar de sintéticos")
+    parser.add_argument("--codec", action="store_true", help="comprimir con xor-rle si el servidor lo acepta")
+    parser.add_argument("--transporte", choices=("http", "udp", "tcp"), default="http",
+                        help="udp/tcp: fragmentos a frame_transport.py en lugar de POST")
+    parser.add_argument("--puerto-transporte", type=int, default=8002)
+    parser.add_argument("--telemetria", type=float, default=0, help="segundos entre reportes a /telemetry (0 = no)")
+    asyncio.run(simular(parser.parse_args()))
@@ -0,0 +1,187 @@
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+
+# --- Archivo segmentado de frames ---
+# En lugar de un BMP por frame, los frames RGB565 crudos se agregan a
+# segmentos (seg_<ms>.raw) con un índice al lado (seg_<ms>.idx). Cada
+# registro del índice ocupa 64 bytes:
+#   seq (u64), device_seq (u32), timestamp (f64), offset (u64),
+#   width (u16), height (u16), device_id (32 bytes, relleno con ceros)
+# Un segmento se cierra al superar max_bytes o max_seconds y se abre otro.
+# Un frame deduplicado solo agrega su registro al índice, con el offset de
+# los píxeles del frame al que hace referencia dentro del mismo segmento.
+# Las lecturas usan mmap, así que cualquier frame se obtiene sin leer el
+# segmento completo.
+
+INDEX_RECORD = struct.Struct("<QIdQHH32s")
+
+class ArchiveEntry:
+    __slots__ = ("seq", "device_seq", "timestamp", "segment", "offset", "width", "height", "device_id")
+
+    def __init__(self, seq, device_seq, timestamp, segment, offset, width, height, device_id):
+        self.seq = seq
+        self.device_seq = device_seq
+        self.timestamp = timestamp
+        self.segment = segment
+        self.offset = offset
+        self.width = width
+        self.height = height
+        self.device_id = device_id
+
+    @property
+    def size(self):
+        return self.width * self.height * 2
+
+class FrameArchive:
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, max_seconds=600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.lock = threading.Lock()
+        self.entries = []      # Ordenadas por seq (y por lo tanto por tiempo)
+        self.seqs = []
+        self.timestamps = []
+        self.maps = {}         # segmento -> mmap
+        self.data_file = None
+        self.index_file = None
+        self.segment = None
+        self.segment_start = 0
+        self.segment_size = 0
+        self.references = 0    # Frames guardados sin píxeles propios
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".idx"):
+                continue
+            segment = name[:-4]
+            with open(os.path.join(self.directory, name), "rb") as f:
+                raw = f.read()
+            # Un registro incompleto al final (corte de energía) se ignora.
+            for start in range(0, len(raw) - INDEX_RECORD.size + 1, INDEX_RECORD.size):
+                seq, device_seq, ts, offset, width, height, device = INDEX_RECORD.unpack_from(raw, start)
+                self.entries.append(ArchiveEntry(seq, device_seq, ts, segment, offset, width, height,
+                                                 device.rstrip(b"\0").decode() or None))
+        self.entries.sort(key=lambda e: e.seq)
+        self.seqs = [e.seq for e in self.entries]
+        self.timestamps = [e.timestamp for e in self.entries]
+
+    @property
+    def last_seq(self):
+        return self.seqs[-1] if self.seqs else 0
+
+    def _path(self, segment, ext):
+        return os.path.join(self.directory, segment + ext)
+
+    def _roll(self, now):
+        self._close_segment()
+        self.segment = f"seg_{int(now * 1000):013d}"
+        self.segment_start = now
+        self.segment_size = 0
+        self.data_file = open(self._path(self.segment, ".raw"), "ab")
+        self.index_file = open(self._path(self.segment, ".idx"), "ab")
+
+    def _close_segment(self):
+        if self.data_file:
+            self.data_file.close()
+            self.index_file.close()
+            self.data_file = self.index_file = None
+
+    def append(self, seq, width, height, rgb565, timestamp=None, device_id=None, device_seq=None, ref_seq=None):
+        # Con ref_seq los píxeles no se vuelven a escribir si el frame
+        # referenciado está en el segmento activo y tiene el mismo tamaño.
+        now = time.time() if timestamp is None else timestamp
+        with self.lock:
+            if (self.data_file is None or self.segment_size >= self.max_bytes
+                    or now - self.segment_start >= self.max_seconds):
+                self._roll(now)
+            ref = self._find(ref_seq) if ref_seq else None
+            if ref and ref.segment == self.segment and (ref.width, ref.height) == (width, height):
+                offset = ref.offset
+                self.references += 1
+            else:
+                offset = self.segment_size
+                self.data_file.write(rgb565)
+                self.data_file.flush()
+                self.segment_size += len(rgb565)
+            device = (device_id or "").encode()[:32]
+            self.index_file.write(INDEX_RECORD.pack(seq, device_seq or 0, now, offset, width, height, device))
+            self.index_file.flush()
+            entry = ArchiveEntry(seq, device_seq or 0, now, self.segment, offset, width, height, device_id)
+            index = bisect.bisect_left(self.seqs, seq)
+            self.entries.insert(index, entry)
+            self.seqs.insert(index, seq)
+            self.timestamps.insert(index, now)
+        return entry
+
+    # --- Lectura ---
+    def _find(self, seq):
+        index = bisect.bisect_left(self.seqs, seq)
+        if index < len(self.seqs) and self.seqs[index] == seq:
+            return self.entries[index]
+        return None
+
+    def by_seq(self, seq):
+        with self.lock:
+            return self._find(seq)
+
+    def at_time(self, timestamp, device_id=None):
+        # Último frame guardado en o antes de timestamp.
+        with self.lock:
+            index = bisect.bisect_right(self.timestamps, timestamp)
+            for entry in reversed(self.entries[max(0, index - 1000):index]):
+                if device_id is None or entry.device_id == device_id:
+                    return entry
+        return None
+
+    def read(self, entry):
+        # Vista de los bytes RGB565 del frame sobre el mmap del segmento.
+        with self.lock:
+            mapped = self.maps.get(entry.segment)
+            if mapped is None or len(mapped) < entry.offset + entry.size:
+                # El segmento activo crece: se vuelve a mapear. El mapeo
+                # anterior se libera cuando nadie use sus vistas.
+                with open(self._path(entry.segment, ".raw"), "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps[entry.segment] = mapped
+            return memoryview(mapped)[entry.offset:entry.offset + entry.size]
+
+    # --- Retención ---
+    def segments(self):
+        # Segmentos cerrados como (nombre, bytes, inicio), del más viejo al
+        # más nuevo. El segmento activo nunca se incluye.
+        result = []
+        with self.lock:
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith(".raw") or name[:-4] == self.segment:
+                    continue
+                segment = name[:-4]
+                size = sum(os.path.getsize(self._path(segment, ext))
+                           for ext in (".raw", ".idx") if os.path.exists(self._path(segment, ext)))
+                result.append((segment, size, int(segment[4:]) / 1000))
+        return result
+
+    def remove_segment(self, segment):
+        with self.lock:
+            if segment == self.segment:
+                return
+            for ext in (".raw", ".idx"):
+                try:
+                    os.remove(self._path(segment, ext))
+                except FileNotFoundError:
+                    pass
+            self.maps.pop(segment, None)
+            keep = [i for i, e in enumerate(self.entries) if e.segment != segment]
+            self.entries = [self.entries[i] for i in keep]
+            self.seqs = [self.seqs[i] for i in keep]
+            self.timestamps = [self.timestamps[i] for i in keep]
+
+    def close(self):
+        with self.lock:
+            self._close_segment()
+            self.maps.clear()
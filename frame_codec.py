@@ -0,0 +1,122 @@
+import struct
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy se decodifica token por token
+    np = None
+
+# --- Códec xor-rle para el enlace WiFi de la cámara ---
+# La cámara hace XOR de cada byte RGB565 con el frame anterior que el
+# servidor ya aceptó (X-Base-Sequence) y comprime el resultado con RLE: en una
+# escena quieta casi todo es cero. Sin frame base (X-Base-Sequence: 0) el
+# frame va completo por el mismo RLE.
+#
+# El cuerpo sigue empezando con ancho y alto (2 bytes big-endian cada uno);
+# después viene:
+#   cantidad de tokens (u32 big-endian)
+#   literales de todos los tokens, seguidos
+#   un byte de control por token:
+#     0x80 | (n - 1)   n bytes en cero (1..128)
+#     n - 1            n bytes tomados de los literales (1..128)
+# Un cero suelto entre bytes distintos de cero va como literal; dos o más
+# ceros seguidos cortan el literal. Separar controles y literales permite
+# decodificar con operaciones vectorizadas sobre todos los tokens a la vez.
+#
+# encode_xor_rle es la referencia de codificar_xor_rle (viper) en
+# RASPBERRY_CAMARA/main.py: ambas deben producir los mismos bytes.
+
+XOR_RLE = "xor-rle"
+ENCODINGS = (XOR_RLE,)
+
+_COUNT = struct.Struct(">I")
+
+def max_controls(size):
+    # Tokens que la cámara reserva; con más, el frame se manda crudo.
+    return size // 8
+
+def encode_xor_rle(current, previous=None):
+    n = len(current)
+    delta = current if previous is None else xor_bytes(current, previous)
+    literals = bytearray()
+    controls = bytearray()
+    i = 0
+    while i < n:
+        if delta[i] == 0:
+            run = 1
+            i += 1
+            while i < n and run < 128 and delta[i] == 0:
+                run += 1
+                i += 1
+            controls.append(0x80 | (run - 1))
+        else:
+            start = i
+            while i < n and i - start < 128:
+                if delta[i] == 0 and (i + 1 >= n or delta[i + 1] == 0):
+                    break
+                i += 1
+            controls.append(i - start - 1)
+            literals += delta[start:i]
+    return _COUNT.pack(len(controls)) + bytes(literals) + bytes(controls)
+
+def xor_bytes(a, b):
+    if np is not None:
+        return (np.frombuffer(a, dtype=np.uint8) ^ np.frombuffer(b, dtype=np.uint8)).tobytes()
+    return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big")).to_bytes(len(a), "big")
+
+def _split(payload):
+    payload = memoryview(payload)
+    if len(payload) < _COUNT.size:
+        raise ValueError("Frame comprimido truncado.")
+    count = _COUNT.unpack_from(payload)[0]
+    if count > len(payload) - _COUNT.size:
+        raise ValueError("Frame comprimido truncado.")
+    end = len(payload) - count
+    return payload[_COUNT.size:end], payload[end:]
+
+def _expand_py(literals, controls, size):
+    delta = bytearray(size)
+    pos = src = 0
+    for control in controls:
+        length = (control & 0x7F) + 1
+        if not control & 0x80:
+            if pos + length > size or src + length > len(literals):
+                raise ValueError("Frame comprimido inválido.")
+            delta[pos:pos + length] = literals[src:src + length]
+            src += length
+        pos += length
+    if pos != size or src != len(literals):
+        raise ValueError("Frame comprimido inválido.")
+    return delta
+
+def _expand_np(literals, controls, size):
+    controls = np.frombuffer(controls, dtype=np.uint8)
+    lengths = (controls & 0x7F).astype(np.int64) + 1
+    starts = np.cumsum(lengths) - lengths
+    if int(lengths.sum()) != size:
+        raise ValueError("Frame comprimido inválido.")
+    is_literal = controls < 0x80
+    literal_lengths = lengths[is_literal]
+    if int(literal_lengths.sum()) != len(literals):
+        raise ValueError("Frame comprimido inválido.")
+    delta = np.zeros(size, dtype=np.uint8)
+    if len(literals):
+        # Posición de destino de cada byte literal: inicio de su token más
+        # su desplazamiento dentro del tramo de literales.
+        sources = np.cumsum(literal_lengths) - literal_lengths
+        shift = np.repeat(starts[is_literal] - sources, literal_lengths)
+        delta[np.arange(len(literals)) + shift] = np.frombuffer(literals, dtype=np.uint8)
+    return delta
+
+def decode_xor_rle(payload, size, base=None):
+    # Devuelve los size bytes RGB565 del frame. ValueError si el cuerpo no
+    # corresponde a una imagen de ese tamaño.
+    literals, controls = _split(payload)
+    if base is not None and len(base) != size:
+        raise ValueError("El frame base tiene otro tamaño.")
+    if np is None:
+        delta = _expand_py(literals, controls, size)
+        return bytes(delta) if base is None else xor_bytes(delta, base)
+    delta = _expand_np(literals, controls, size)
+    if base is not None:
+        delta ^= np.frombuffer(base, dtype=np.uint8)
+    return delta.tobytes()
@@ -0,0 +1,437 @@
+import collections
+import os
+import queue
+import threading
+import time
+
+# --- Frames en memoria ---
+class Frame:
+    __slots__ = ("seq", "filename", "width", "height", "timestamp", "bmp", "raw", "device_id", "device_seq",
+                 "encoded", "lock", "digest", "ref", "timeline", "on_encoded")
+
+    def __init__(self, seq, filename, width, height, bmp, timestamp=None, device_id=None, device_seq=None,
+                 raw=None, digest=None, ref=None):
+        self.seq = seq
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.bmp = bmp
+        self.raw = raw          # RGB565 tal como llegó de la cámara
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.device_id = device_id
+        self.device_seq = device_seq
+        self.digest = digest    # Hash del RGB565 (deduplicación)
+        self.ref = ref          # Frame cuyos píxeles reutiliza este (casi idéntico), o None
+        self.timeline = {}      # Etapa -> momento (time.time()): capture, received, converted...
+        self.on_encoded = None  # Se llama al agregar una representación (LRUCache.resize)
+        if ref is not None:
+            # Mismos píxeles: las versiones comprimidas también se comparten.
+            self.encoded = ref.encoded
+            self.lock = ref.lock
+        else:
+            self.encoded = {}
+            self.lock = threading.RLock()   # Reentrante: una representación puede derivar de otra
+
+    def mark(self, stage, when=None):
+        # Registra el momento de una etapa la primera vez. True si esta
+        # llamada fue la que lo registró.
+        when = time.time() if when is None else when
+        return self.timeline.setdefault(stage, when) is when
+
+    def get_encoded(self, key, encoder):
+        # Cada representación del frame se calcula una sola vez y se comparte
+        # entre todos los clientes.
+        data = self.encoded.get(key)
+        if data is None:
+            with self.lock:
+                data = self.encoded.get(key)
+                if data is None:
+                    data = encoder(self)
+                    self.encoded[key] = data
+                    if self.on_encoded is not None:
+                        self.on_encoded()
+        return data
+
+    def nbytes(self):
+        # Memoria del frame contando las versiones comprimidas ya calculadas.
+        return len(self.bmp) + len(self.raw or b"") + sum(len(data) for data in list(self.encoded.values()))
+
+class FrameRing:
+    # Anillo acotado con los últimos frames recibidos. Cada frame recibe un
+    # número de secuencia creciente asignado por el servidor.
+    def __init__(self, capacity=60):
+        self.frames = collections.deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)
+        self.next_seq = 1
+        self.listeners = []
+
+    def add_listener(self, callback):
+        # callback(frame) se llama tras cada push, fuera del lock (lo usa el
+        # servidor asíncrono para despertar a sus clientes).
+        self.listeners.append(callback)
+
+    def push(self, filename, width, height, bmp, device_id=None, device_seq=None, raw=None, timestamp=None,
+             digest=None, ref=None):
+        with self.lock:
+            frame = Frame(self.next_seq, filename, width, height, bmp, timestamp, device_id, device_seq, raw,
+                          digest, ref)
+            self.next_seq += 1
+            self.frames.append(frame)
+            self.new_frame.notify_all()
+        for callback in self.listeners:
+            callback(frame)
+        return frame
+
+    def add(self, frame):
+        # Agrega un frame que ya tiene secuencia (creado por otro anillo).
+        with self.lock:
+            self.frames.append(frame)
+            self.new_frame.notify_all()
+        for callback in self.listeners:
+            callback(frame)
+
+    def wait_newer(self, seq, timeout=None):
+        # Bloquea hasta que haya un frame con secuencia mayor que seq y
+        # devuelve el más reciente (los intermedios se saltan). None si vence
+        # el timeout.
+        with self.lock:
+            if not self.new_frame.wait_for(lambda: self.frames and self.frames[-1].seq > seq, timeout):
+                return None
+            return self.frames[-1]
+
+    def latest(self):
+        with self.lock:
+            return self.frames[-1] if self.frames else None
+
+    def get(self, seq):
+        with self.lock:
+            for frame in reversed(self.frames):
+                if frame.seq == seq:
+                    return frame
+        return None
+
+    def at_time(self, timestamp, device_id=None):
+        with self.lock:
+            for frame in reversed(self.frames):
+                if frame.timestamp <= timestamp and (device_id is None or frame.device_id == device_id):
+                    return frame
+        return None
+
+    def find(self, filename):
+        with self.lock:
+            for frame in reversed(self.frames):
+                if frame.filename == filename:
+                    return frame
+        return None
+
+# --- Caché LRU con presupuesto en bytes ---
+class LRUCache:
+    # get_or_compute calcula cada clave una sola vez aunque la pidan varios
+    # hilos a la vez; los demás esperan el resultado.
+    def __init__(self, max_bytes, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.items = collections.OrderedDict()
+        self.sizes = {}         # Tamaño con el que se contó cada clave
+        self.size = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        while True:
+            with self.lock:
+                if key in self.items:
+                    self.items.move_to_end(key)
+                    self.hits += 1
+                    return self.items[key]
+                event = self.pending.get(key)
+                if event is None:
+                    event = self.pending[key] = threading.Event()
+                    self.misses += 1
+                    break
+            event.wait()
+        try:
+            value = compute()
+            if value is not None:
+                self._store(key, value)
+            return value
+        finally:
+            with self.lock:
+                del self.pending[key]
+            event.set()
+
+    def _store(self, key, value):
+        size = self.sizeof(value)
+        with self.lock:
+            if size > self.max_bytes:
+                return
+            self.items[key] = value
+            self.sizes[key] = size
+            self.size += size
+            self._evict()
+
+    def resize(self, key):
+        # Vuelve a medir un valor que creció después de guardarse (un frame
+        # al que se le agregó una versión comprimida) y libera lo que sobre.
+        with self.lock:
+            if key not in self.items:
+                return
+            size = self.sizeof(self.items[key])
+            self.size += size - self.sizes[key]
+            self.sizes[key] = size
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            old, _ = self.items.popitem(last=False)
+            self.size -= self.sizes.pop(old)
+
+    def as_dict(self):
+        return {"entries": len(self.items), "bytes": self.size, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+# --- Varias cámaras ---
+class DeviceStats:
+    # Estadísticas de recepción de una cámara, a partir de las cabeceras
+    # X-Sequence y X-Memory que envía send_frame_pico.
+    def __init__(self):
+        self.frames = 0
+        self.fps = 0.0
+        self.last_seq = None
+        self.missing = 0         # Frames perdidos según los huecos de secuencia
+        self.out_of_order = 0    # Secuencias repetidas o menores a la anterior
+        self.restarts = 0
+        self.deduplicated = 0    # Frames guardados como referencia al anterior
+        self.free_memory = None
+        self.last_seen = None
+        self.width = None
+        self.height = None
+        self.frame_interval = None   # X-Frame-Interval-Ms: intervalo que eligió la cámara, en ms
+
+    def update(self, seq, free_memory, now=None):
+        now = time.time() if now is None else now
+        if self.last_seen is not None and now > self.last_seen:
+            # Media móvil exponencial de los FPS instantáneos.
+            self.fps = 0.8 * self.fps + 0.2 / (now - self.last_seen) if self.fps else 1.0 / (now - self.last_seen)
+        self.last_seen = now
+        self.frames += 1
+        if free_memory is not None:
+            self.free_memory = free_memory
+        if seq is None:
+            return
+        if self.last_seq is not None:
+            if seq == 1 and self.last_seq > 1:
+                self.restarts += 1
+            elif seq > self.last_seq + 1:
+                self.missing += seq - self.last_seq - 1
+            elif seq <= self.last_seq:
+                self.out_of_order += 1
+                return
+        self.last_seq = seq
+
+    def set_mode(self, width, height, frame_interval):
+        # Modo actual de la cámara (resolución e intervalo entre frames).
+        self.width = width
+        self.height = height
+        if frame_interval:
+            self.frame_interval = frame_interval
+
+    def mode(self):
+        if self.width is None:
+            return None
+        return {
+            "resolution": f"{self.width}x{self.height}",
+            "frame_interval_ms": self.frame_interval,
+            "target_fps": round(1000 / self.frame_interval, 1) if self.frame_interval else None,
+        }
+
+    def as_dict(self):
+        return {
+            "frames": self.frames,
+            "fps": round(self.fps, 2),
+            "last_seq": self.last_seq,
+            "missing": self.missing,
+            "out_of_order": self.out_of_order,
+            "restarts": self.restarts,
+            "deduplicated": self.deduplicated,
+            "dedup_ratio": round(self.deduplicated / self.frames, 3) if self.frames else 0.0,
+            "free_memory": self.free_memory,
+            "last_seen": self.last_seen,
+            "mode": self.mode(),
+        }
+
+class Device:
+    def __init__(self, device_id, ring_capacity):
+        self.device_id = device_id
+        self.ring = FrameRing(ring_capacity)
+        self.stats = DeviceStats()
+        self.jpeg_quality = None    # Config.JPEG_QUALITY de la cámara (X-JPEG-Quality)
+        self.codec_base = None      # (X-Sequence, RGB565) del último frame: base de xor-rle
+
+class DeviceRegistry:
+    def __init__(self, ring_capacity=60):
+        self.ring_capacity = ring_capacity
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.listeners = []
+
+    def add_listener(self, callback):
+        # Se registra en el anillo de cada cámara, incluidas las futuras.
+        with self.lock:
+            self.listeners.append(callback)
+            for device in self.devices.values():
+                device.ring.add_listener(callback)
+
+    def get(self, device_id, create=False):
+        device = self.devices.get(device_id)
+        if device is None and create:
+            with self.lock:
+                device = self.devices.get(device_id)
+                if device is None:
+                    device = Device(device_id, self.ring_capacity)
+                    for callback in self.listeners:
+                        device.ring.add_listener(callback)
+                    self.devices[device_id] = device
+        return device
+
+    def all(self):
+        with self.lock:
+            return list(self.devices.values())
+
+# --- Persistencia en disco en segundo plano ---
+class DiskWriter:
+    # Escribe los frames en disco desde un hilo propio. Si la cola está
+    # llena el frame se descarta: un disco lento nunca frena la recepción.
+    # Con archive (frame_archive.FrameArchive) los frames se agregan al
+    # archivo segmentado en lugar de crear un BMP por frame.
+    def __init__(self, directory, max_queue=64, archive=None):
+        self.directory = directory
+        self.archive = archive
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.listeners = []
+        self.thread = threading.Thread(target=self._run, name="DiskWriter", daemon=True)
+        self.thread.start()
+
+    def add_listener(self, callback):
+        # callback(frame) se llama desde el hilo de escritura tras guardar
+        # cada frame.
+        self.listeners.append(callback)
+
+    def submit(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            frame = self.queue.get()
+            try:
+                if self.archive:
+                    self.archive.append(frame.seq, frame.width, frame.height, frame.raw, frame.timestamp,
+                                        frame.device_id, frame.device_seq, frame.ref.seq if frame.ref else None)
+                else:
+                    path = os.path.join(self.directory, frame.filename)
+                    if not (frame.ref and self._link(frame.ref.filename, path)):
+                        with open(path, "wb") as f:
+                            f.write(frame.bmp)
+                self.written += 1
+                for callback in self.listeners:
+                    callback(frame)
+            except OSError as e:
+                print(f"Error al guardar {frame.filename}: {e}")
+                self.errors += 1
+            finally:
+                self.queue.task_done()
+
+    def _link(self, filename, path):
+        # Un frame duplicado es un enlace duro al BMP original: no ocupa
+        # píxeles nuevos. False si el original no está (descartado o borrado)
+        # o el sistema de archivos no admite enlaces.
+        try:
+            os.link(os.path.join(self.directory, filename), path)
+            return True
+        except OSError:
+            return False
+
+# --- Retención en disco ---
+class RetentionManager:
+    # Cada interval segundos borra lo más viejo hasta cumplir max_bytes y
+    # max_age (None desactiva cada límite). Trabaja sobre segmentos del
+    # archivo si hay archive, o sobre los BMP sueltos de directory.
+    def __init__(self, directory, archive=None, max_bytes=None, max_age=None, interval=30):
+        self.directory = directory
+        self.archive = archive
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.bytes_stored = 0
+        self.bytes_evicted = 0
+        self.units_evicted = 0
+        self.thread = threading.Thread(target=self._run, name="RetentionManager", daemon=True)
+        self.thread.start()
+
+    def _units(self):
+        # (id, bytes, momento) del más viejo al más nuevo.
+        if self.archive:
+            return self.archive.segments()
+        units = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".bmp"):
+                    stat = entry.stat()
+                    units.append((entry.path, stat.st_size, stat.st_mtime))
+        units.sort(key=lambda unit: unit[2])
+        return units
+
+    def _remove(self, unit):
+        if self.archive:
+            self.archive.remove_segment(unit)
+        else:
+            os.remove(unit)
+
+    def enforce(self, now=None):
+        now = time.time() if now is None else now
+        units = self._units()
+        total = sum(size for _, size, _ in units)
+        if self.archive:
+            total += self.archive.segment_size   # El segmento activo cuenta pero no se borra
+        for unit, size, created in units:
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            too_old = self.max_age is not None and now - created > self.max_age
+            if not (too_big or too_old):
+                break
+            try:
+                self._remove(unit)
+            except OSError as e:
+                print(f"Error al borrar {unit}: {e}")
+                continue
+            total -= size
+            self.bytes_evicted += size
+            self.units_evicted += 1
+        self.bytes_stored = total
+
+    def _run(self):
+        while True:
+            try:
+                self.enforce()
+            except Exception as e:
+                print(f"Error en retención: {e}")
+            time.sleep(self.interval)
+
+    def as_dict(self):
+        return {
+            "bytes_stored": self.bytes_stored,
+            "bytes_evicted": self.bytes_evicted,
+            "units_evicted": self.units_evicted,
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age,
+        }
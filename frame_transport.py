@@ -0,0 +1,246 @@
+import asyncio
+import collections
+import socket
+import struct
+import time
+
+# --- Transporte de video por fragmentos (UDP o TCP) ---
+# Alternativa a POST /upload_raw_image_flash/ sin línea de petición, cabeceras
+# ni respuesta HTTP por frame. Cada frame se parte en fragmentos:
+#   cabecera (FRAGMENT_HEADER): "VF", versión, flags, secuencia (X-Sequence),
+#                               índice del fragmento, cantidad de fragmentos
+#   fragmento 0:  FRAME_META (lo que en HTTP va en las cabeceras) seguido del
+#                 device id en ASCII
+#   fragmentos 1..n-1: el cuerpo (RGB565 crudo o xor-rle) en orden
+# Por UDP cada fragmento es un datagrama. Por TCP cada fragmento va precedido
+# por su largo (TCP_LENGTH) y el cuerpo puede ir en un solo fragmento.
+# Cuando un frame se completa y se procesa, el servidor responde con un ACK
+# (estado y códecs aceptados, como X-Frame-Encodings) al mismo origen.
+#
+# Los formatos los comparte FragmentLink en RASPBERRY_CAMARA/main.py.
+
+MAGIC = b"VF"
+ACK_MAGIC = b"VA"
+VERSION = 2   # 2: FRAME_META suma el intervalo entre frames
+FLAG_XOR_RLE = 0x01
+
+FRAGMENT_HEADER = struct.Struct(">2sBBIHH")
+FRAME_META = struct.Struct(">HHIIIIIBH")  # ancho, alto, bytes del cuerpo, base, memoria, captura/envío ms, calidad,
+                                          # intervalo entre frames (ms)
+ACK = struct.Struct(">2sIBB")             # "VA", secuencia, estado, códecs (bit i = ENCODINGS[i] de frame_codec)
+TCP_LENGTH = struct.Struct(">I")
+
+ACK_OK = 0
+ACK_REJECTED = 1
+ACK_STALE_BASE = 2   # Como el 409 de HTTP: el próximo frame debe ir sin base
+
+MAX_FRAGMENTS = 1024
+LATE_WINDOW = 16   # Secuencias anteriores a la última completa que se ignoran (al reiniciar la cámara vuelve a 1)
+UDP_RECEIVE_BUFFER = 4 * 1024 * 1024   # Un frame DIV1 crudo llega como ~440 datagramas seguidos
+
+class AssembledFrame:
+    __slots__ = ("seq", "device_id", "width", "height", "data", "encoded", "base_seq", "free_memory",
+                 "jpeg_quality", "capture_ms", "send_ms", "frame_interval", "received")
+
+    def __init__(self, seq, meta, device_id, data, flags, received):
+        width, height, _, base_seq, free_memory, capture_ms, send_ms, jpeg_quality, frame_interval = meta
+        self.seq = seq
+        self.device_id = device_id
+        self.width = width
+        self.height = height
+        self.data = data              # Ancho y alto (2 bytes cada uno) + cuerpo, como el POST HTTP
+        self.encoded = bool(flags & FLAG_XOR_RLE)
+        self.base_seq = base_seq
+        self.free_memory = free_memory
+        self.jpeg_quality = jpeg_quality or None
+        self.capture_ms = capture_ms
+        self.send_ms = send_ms
+        self.frame_interval = frame_interval or None
+        self.received = received      # Llegada del primer fragmento
+
+class PartialFrame:
+    __slots__ = ("count", "pieces", "missing", "size", "meta", "device_id", "flags", "started")
+
+    def __init__(self, count, flags, started):
+        self.count = count
+        self.pieces = [None] * count
+        self.missing = count
+        self.size = 0
+        self.meta = None
+        self.device_id = None
+        self.flags = flags
+        self.started = started
+
+class FrameAssembler:
+    # Rearma frames por origen (dirección UDP o conexión TCP). Un frame
+    # incompleto se descarta cuando se completa uno más nuevo del mismo
+    # origen, cuando pasan timeout segundos o cuando hay más de max_pending
+    # a medio llegar. stats lleva frames completos, incompletos descartados
+    # y fragmentos inválidos.
+    def __init__(self, max_bytes, timeout=1.0, max_pending=4):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.sources = {}      # origen -> {secuencia: PartialFrame}
+        self.completed = {}    # origen -> última secuencia completa
+        self.stats = {"complete": 0, "incomplete": 0, "invalid": 0}
+        self.last_expire = 0.0
+
+    def add(self, source, fragment, now=None):
+        # Devuelve un AssembledFrame cuando fragment completa su frame.
+        now = time.time() if now is None else now
+        if now - self.last_expire >= self.timeout / 2:
+            self.expire(now)
+        if len(fragment) < FRAGMENT_HEADER.size:
+            self.stats["invalid"] += 1
+            return None
+        magic, version, flags, seq, index, count = FRAGMENT_HEADER.unpack_from(fragment)
+        if magic != MAGIC or version != VERSION or not 2 <= count <= MAX_FRAGMENTS or index >= count:
+            self.stats["invalid"] += 1
+            return None
+        last = self.completed.get(source)
+        if last is not None and last - LATE_WINDOW < seq <= last:
+            return None   # Duplicado o resto de un frame ya entregado o descartado
+        pending = self.sources.setdefault(source, {})
+        partial = pending.get(seq)
+        if partial is None:
+            if len(pending) >= self.max_pending:
+                self._drop(pending, min(pending, key=lambda s: pending[s].started))
+            partial = pending[seq] = PartialFrame(count, flags, now)
+        elif partial.count != count or partial.pieces[index] is not None:
+            return None
+        payload = memoryview(fragment)[FRAGMENT_HEADER.size:]
+        if index == 0:
+            if len(payload) < FRAME_META.size:
+                self._invalid(pending, seq)
+                return None
+            partial.meta = FRAME_META.unpack_from(payload)
+            partial.device_id = bytes(payload[FRAME_META.size:]).decode("ascii", "replace") or None
+            partial.pieces[0] = b""
+        else:
+            partial.size += len(payload)
+            if partial.size > self.max_bytes:
+                self._invalid(pending, seq)
+                return None
+            partial.pieces[index] = bytes(payload)
+        partial.missing -= 1
+        if partial.missing:
+            return None
+        del pending[seq]
+        width, height, size = partial.meta[0], partial.meta[1], partial.meta[2]
+        if size != partial.size:
+            self.stats["invalid"] += 1
+            return None
+        partial.pieces[0] = width.to_bytes(2, "big") + height.to_bytes(2, "big")
+        self.stats["complete"] += 1
+        self.completed[source] = seq
+        for older in [s for s in pending if s < seq]:
+            self._drop(pending, older)
+        return AssembledFrame(seq, partial.meta, partial.device_id, b"".join(partial.pieces), partial.flags,
+                              partial.started)
+
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        self.last_expire = now
+        for source, pending in list(self.sources.items()):
+            for seq in [s for s, p in pending.items() if now - p.started > self.timeout]:
+                self._drop(pending, seq)
+            if not pending:
+                del self.sources[source]
+
+    def forget(self, source):
+        # Conexión TCP cerrada: lo que quedó a medias se cuenta como incompleto.
+        for seq in list(self.sources.get(source, ())):
+            self._drop(self.sources[source], seq)
+        self.sources.pop(source, None)
+        self.completed.pop(source, None)
+
+    def _drop(self, pending, seq):
+        del pending[seq]
+        self.stats["incomplete"] += 1
+
+    def _invalid(self, pending, seq):
+        del pending[seq]
+        self.stats["invalid"] += 1
+
+# --- Receptores asyncio ---
+# ingest(AssembledFrame) -> estado ACK_* se ejecuta en executor (convierte y
+# guarda el frame); encodings es la máscara de códecs que va en cada ACK.
+# Los frames de una misma cámara se procesan de a uno y en orden: xor-rle
+# decodifica contra el frame anterior del mismo device id.
+
+class FrameDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, assembler, ingest, encodings=0, executor=None):
+        self.assembler = assembler
+        self.ingest = ingest
+        self.encodings = encodings
+        self.executor = executor
+        self.transport = None
+        self.queues = {}    # Cámara -> frames completos esperando su turno
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        frame = self.assembler.add(addr, data)
+        if frame is not None:
+            key = frame.device_id or addr
+            queue = self.queues.get(key)
+            if queue is None:
+                queue = self.queues[key] = collections.deque()
+                asyncio.ensure_future(self._ingest(key, queue))
+            queue.append((frame, addr))
+
+    async def _ingest(self, key, queue):
+        # Una tarea por cámara mientras tenga frames pendientes.
+        loop = asyncio.get_running_loop()
+        try:
+            while queue:
+                frame, addr = queue.popleft()
+                status = await loop.run_in_executor(self.executor, self.ingest, frame)
+                if self.transport is not None:
+                    self.transport.sendto(ACK.pack(ACK_MAGIC, frame.seq, status, self.encodings), addr)
+        finally:
+            del self.queues[key]
+
+async def serve_frame_stream(reader, writer, assembler, ingest, encodings=0, executor=None):
+    # Una conexión TCP: fragmentos con su largo delante. Los frames se
+    # procesan en orden y el ACK de cada uno sale antes de leer el siguiente.
+    loop = asyncio.get_running_loop()
+    source = (writer.get_extra_info("peername"), id(writer))
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        while True:
+            length = TCP_LENGTH.unpack(await reader.readexactly(TCP_LENGTH.size))[0]
+            if length > assembler.max_bytes + FRAGMENT_HEADER.size:
+                assembler.stats["invalid"] += 1
+                break
+            frame = assembler.add(source, await reader.readexactly(length))
+            if frame is not None:
+                status = await loop.run_in_executor(executor, ingest, frame)
+                writer.write(ACK.pack(ACK_MAGIC, frame.seq, status, encodings))
+                await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        assembler.forget(source)
+        writer.close()
+
+async def start_receivers(host, port, assembler, ingest, encodings=0, executor=None):
+    # Escucha UDP y TCP en el mismo puerto. Devuelve (transporte UDP,
+    # servidor TCP) para cerrarlos al terminar.
+    loop = asyncio.get_running_loop()
+    udp, _ = await loop.create_datagram_endpoint(
+        lambda: FrameDatagramProtocol(assembler, ingest, encodings, executor), local_addr=(host, port))
+    sock = udp.get_extra_info("socket")
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECEIVE_BUFFER)
+        except OSError:
+            pass
+    tcp = await asyncio.start_server(
+        lambda reader, writer: serve_frame_stream(reader, writer, assembler, ingest, encodings, executor),
+        host, port)
+    return udp, tcp
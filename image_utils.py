@@ -0,0 +1,292 @@
+import functools
+import io
+import struct
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy se usa el bucle en Python puro
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:  # Sin Pillow solo se sirven BMP
+    Image = None
+
+# --- Conversión RGB565 -> BGR888 ---
+# La cámara envía cada píxel como RGB565 big-endian. El BMP guarda los
+# canales en orden B, G, R, por eso la salida es BGR888.
+
+_lut_bgr888 = None
+
+def _get_lut_bgr888():
+    # Tabla de 65536 entradas (una por valor RGB565) con los 3 bytes BGR.
+    global _lut_bgr888
+    if _lut_bgr888 is None:
+        pixel = np.arange(0x10000, dtype=np.uint16)
+        r = ((pixel >> 11) & 0x1F).astype(np.uint8)
+        g = ((pixel >> 5) & 0x3F).astype(np.uint8)
+        b = (pixel & 0x1F).astype(np.uint8)
+        lut = np.empty((0x10000, 3), dtype=np.uint8)
+        lut[:, 0] = (b << 3) | (b >> 2)
+        lut[:, 1] = (g << 2) | (g >> 4)
+        lut[:, 2] = (r << 3) | (r >> 2)
+        _lut_bgr888 = lut
+    return _lut_bgr888
+
+def _rgb565_to_rgb888_py(rgb565_bytes):
+    result = bytearray()
+    for i in range(0, len(rgb565_bytes), 2):
+        pixel = (rgb565_bytes[i] << 8) | rgb565_bytes[i + 1]
+        r = (pixel >> 11) & 0x1F
+        g = (pixel >> 5) & 0x3F
+        b = pixel & 0x1F
+        r = (r << 3) | (r >> 2)
+        g = (g << 2) | (g >> 4)
+        b = (b << 3) | (b >> 2)
+        result.extend([b, g, r])
+    return bytes(result)
+
+def _rgb565_to_rgb888_np(rgb565_bytes):
+    pixels = np.frombuffer(rgb565_bytes, dtype=">u2")
+    return _get_lut_bgr888()[pixels].tobytes()
+
+def rgb565_to_rgb888(rgb565_bytes):
+    if np is None:
+        return _rgb565_to_rgb888_py(rgb565_bytes)
+    return _rgb565_to_rgb888_np(rgb565_bytes)
+
+def rgb565_to_bgr888_buffer(rgb565_bytes):
+    # Igual que rgb565_to_rgb888 pero sin la copia final a bytes: con NumPy
+    # devuelve una memoryview sobre el arreglo convertido.
+    if np is None:
+        return _rgb565_to_rgb888_py(rgb565_bytes)
+    return memoryview(_get_lut_bgr888()[np.frombuffer(rgb565_bytes, dtype=">u2")]).cast("B")
+
+# --- Reducción de resolución sobre RGB565 ---
+# Filtro de caja: cada píxel de salida es el promedio de un bloque
+# factor x factor, calculado por canal (5, 6 y 5 bits) sin pasar por RGB888.
+# Si el ancho o el alto no son múltiplos de factor se recortan los bordes.
+
+def _downscale_rgb565_py(rgb565_bytes, width, height, factor):
+    out_width, out_height = width // factor, height // factor
+    count = factor * factor
+    result = bytearray(out_width * out_height * 2)
+    pos = 0
+    for y in range(out_height):
+        for x in range(out_width):
+            r = g = b = 0
+            for row in range(y * factor, y * factor + factor):
+                start = (row * width + x * factor) * 2
+                for i in range(start, start + factor * 2, 2):
+                    pixel = (rgb565_bytes[i] << 8) | rgb565_bytes[i + 1]
+                    r += pixel >> 11
+                    g += (pixel >> 5) & 0x3F
+                    b += pixel & 0x1F
+            pixel = ((r + count // 2) // count << 11) | ((g + count // 2) // count << 5) | (b + count // 2) // count
+            result[pos] = pixel >> 8
+            result[pos + 1] = pixel & 0xFF
+            pos += 2
+    return bytes(result)
+
+def _downscale_rgb565_np(rgb565_bytes, width, height, factor):
+    out_width, out_height = width // factor, height // factor
+    count = factor * factor
+    pixels = np.frombuffer(rgb565_bytes, dtype=">u2").reshape(height, width)
+    pixels = pixels[:out_height * factor, :out_width * factor].astype(np.uint32)
+
+    def box(channel):
+        total = channel.reshape(out_height, factor, out_width, factor).sum(axis=(1, 3))
+        return (total + count // 2) // count
+
+    out = (box(pixels >> 11) << 11) | (box((pixels >> 5) & 0x3F) << 5) | box(pixels & 0x1F)
+    return out.astype(">u2").tobytes()
+
+def _rgb565_difference_py(a, b, step):
+    total = count = 0
+    for i in range(0, len(a) - 1, step * 2):
+        pa = (a[i] << 8) | a[i + 1]
+        pb = (b[i] << 8) | b[i + 1]
+        total += (abs((pa >> 11) - (pb >> 11)) + abs(((pa >> 5) & 0x3F) - ((pb >> 5) & 0x3F))
+                  + abs((pa & 0x1F) - (pb & 0x1F)))
+        count += 1
+    return total / (count * (31 + 63 + 31)) if count else 0.0
+
+def _rgb565_difference_np(a, b, step):
+    pa = np.frombuffer(a, dtype=">u2")[::step].astype(np.int32)
+    pb = np.frombuffer(b, dtype=">u2")[::step].astype(np.int32)
+    if not len(pa):
+        return 0.0
+    total = (np.abs((pa >> 11) - (pb >> 11)).sum() + np.abs(((pa >> 5) & 0x3F) - ((pb >> 5) & 0x3F)).sum()
+             + np.abs((pa & 0x1F) - (pb & 0x1F)).sum())
+    return float(total) / (len(pa) * (31 + 63 + 31))
+
+def rgb565_difference(a, b, step=4):
+    # Diferencia media por canal entre dos imágenes RGB565 del mismo tamaño,
+    # de 0.0 (iguales) a 1.0, mirando uno de cada step píxeles.
+    if np is None:
+        return _rgb565_difference_py(a, b, step)
+    return _rgb565_difference_np(a, b, step)
+
+def downscale_rgb565(rgb565_bytes, width, height, factor):
+    # Devuelve (ancho, alto, bytes RGB565) de la imagen reducida 1/factor.
+    out_width, out_height = width // factor, height // factor
+    if not (out_width and out_height):
+        raise ValueError("Escala demasiado pequeña para la imagen.")
+    if np is None:
+        return out_width, out_height, _downscale_rgb565_py(rgb565_bytes, width, height, factor)
+    return out_width, out_height, _downscale_rgb565_np(rgb565_bytes, width, height, factor)
+
+# --- BMP ---
+# Cabecera BITMAPFILEHEADER (14 bytes) + BITMAPINFOHEADER (40 bytes).
+_BMP_HEADER = struct.Struct("<2sIHHIIiiHHIIiiII")
+BMP_HEADER_SIZE = _BMP_HEADER.size
+
+def bmp_row_size(width):
+    return (width * 3 + 3) & ~3
+
+@functools.lru_cache(maxsize=16)
+def bmp_header(width, height):
+    # Altura negativa: las filas van de arriba hacia abajo, que es el orden
+    # en que llegan de la cámara, así no hay que invertirlas.
+    image_size = bmp_row_size(width) * height
+    return _BMP_HEADER.pack(
+        b"BM", BMP_HEADER_SIZE + image_size, 0, 0, BMP_HEADER_SIZE,
+        40, width, -height, 1, 24, 0, image_size, 0x0B13, 0x0B13, 0, 0,
+    )
+
+def write_bmp(f, width, height, bgr888_data):
+    f.write(bmp_header(width, height))
+    row_bytes = width * 3
+    padding = bmp_row_size(width) - row_bytes
+    if not padding:
+        f.write(bgr888_data)
+        return
+    view = memoryview(bgr888_data)
+    pad = bytes(padding)
+    for start in range(0, row_bytes * height, row_bytes):
+        f.write(view[start:start + row_bytes])
+        f.write(pad)
+
+def encode_bmp(width, height, bgr888_data):
+    # BMP completo en memoria. join reserva el resultado una sola vez y copia
+    # las filas directamente desde la memoryview.
+    header = bmp_header(width, height)
+    row_bytes = width * 3
+    padding = bmp_row_size(width) - row_bytes
+    if not padding:
+        return b"".join((header, bgr888_data))
+    view = memoryview(bgr888_data)
+    pad = bytes(padding)
+    parts = [header]
+    for start in range(0, row_bytes * height, row_bytes):
+        parts.append(view[start:start + row_bytes])
+        parts.append(pad)
+    return b"".join(parts)
+
+class BmpStreamEncoder:
+    # Arma el BMP de un frame RGB565 que llega por partes. Los bytes se
+    # escriben directo en raw (readinto sobre buffer()) y cada llamada a
+    # convert() pasa a bmp las filas completas que ya llegaron. Fuera de raw
+    # y bmp solo se usa memoria del tamaño de un bloque.
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.raw = bytearray(width * height * 2)
+        self.bmp = bytearray(BMP_HEADER_SIZE + bmp_row_size(width) * height)
+        self.bmp[:BMP_HEADER_SIZE] = bmp_header(width, height)
+        self.received = 0
+        self.rows = 0
+
+    @property
+    def done(self):
+        return self.received == len(self.raw)
+
+    def buffer(self, size):
+        # Próximo tramo libre de raw, para readinto.
+        return memoryview(self.raw)[self.received:self.received + size]
+
+    def advance(self, nbytes):
+        self.received += nbytes
+
+    def write(self, data):
+        if self.received + len(data) > len(self.raw):
+            raise ValueError("Tamaño incorrecto de imagen.")
+        self.raw[self.received:self.received + len(data)] = data
+        self.received += len(data)
+
+    def convert(self):
+        ready = self.received // (self.width * 2)
+        if ready == self.rows:
+            return
+        bgr = rgb565_to_bgr888_buffer(memoryview(self.raw)[self.rows * self.width * 2:ready * self.width * 2])
+        row_bytes = self.width * 3
+        row_size = bmp_row_size(self.width)
+        start = BMP_HEADER_SIZE + self.rows * row_size
+        if row_size == row_bytes:
+            self.bmp[start:start + len(bgr)] = bgr
+        else:
+            for offset in range(0, len(bgr), row_bytes):
+                self.bmp[start:start + row_bytes] = bgr[offset:offset + row_bytes]
+                start += row_size
+        self.rows = ready
+
+def save_bmp(width, height, rgb888_data, filename):
+    with open(filename, "wb") as f:
+        write_bmp(f, width, height, rgb888_data)
+
+def bmp_pixels(bmp):
+    # Vista de los píxeles de un BMP generado por encode_bmp (sin copiar).
+    return memoryview(bmp)[BMP_HEADER_SIZE:]
+
+# --- Formatos comprimidos (requieren Pillow) ---
+IMAGE_MIMETYPES = {
+    "bmp": "image/bmp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+def available_formats():
+    formats = ["bmp"]
+    if Image is not None:
+        from PIL import features
+        formats += ["jpeg", "png"]
+        if features.check("webp"):
+            formats.append("webp")
+    return formats
+
+def encode_image(width, height, bmp, fmt, quality=75):
+    # Comprime un BMP de encode_bmp. Pillow lee las filas BGR directamente
+    # del búfer del BMP.
+    if fmt == "bmp":
+        return bmp
+    image = Image.frombuffer("RGB", (width, height), bmp_pixels(bmp), "raw", "BGR", bmp_row_size(width), 1)
+    out = io.BytesIO()
+    if fmt == "png":
+        image.save(out, format="PNG", compress_level=1)
+    else:
+        image.save(out, format=fmt.upper(), quality=quality)
+    return out.getvalue()
+
+def negotiate_format(accept, formats):
+    # Formato a partir de la cabecera Accept. Solo cuentan los tipos de
+    # imagen pedidos explícitamente (no los comodines), para que los
+    # clientes que aceptan */* sigan recibiendo BMP.
+    accepted = {}
+    for item in (accept or "").split(","):
+        mime, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[mime.strip().lower()] = q
+    best, best_q = "bmp", 0.0
+    for fmt in ("webp", "jpeg", "png"):
+        q = accepted.get(IMAGE_MIMETYPES[fmt], 0.0)
+        if fmt in formats and q > best_q:
+            best, best_q = fmt, q
+    return best
@@ -0,0 +1,119 @@
+import collections
+import struct
+import threading
+import time
+
+# --- Telemetría de las cámaras ---
+# Cada Config.TELEMETRY_INTERVAL ms la cámara (Telemetry en
+# RASPBERRY_CAMARA/main.py) manda POST /telemetry con X-Device-ID y un cuerpo
+# binario de tamaño fijo:
+#   REPORT_HEADER: "VT", versión, cantidad de histogramas, secuencia del
+#                  reporte, milisegundos que cubre
+#   REPORT_COUNTERS: los valores de COUNTERS (acumulados desde el arranque,
+#                    salvo la memoria libre)
+#   un HISTOGRAM por cada nombre de HISTOGRAMS: cuenta, suma, máximo y los
+#   BUCKETS conteos, todo en microsegundos
+# Los histogramas se reinician después de cada reporte. Los buckets van en
+# potencias de dos: el 0 cuenta valores menores a 64 µs, el i los de
+# [32·2^i, 64·2^i) y el último todo lo que no entra en los anteriores.
+#
+# encode_report es la referencia de Telemetry.pack en la cámara.
+
+MAGIC = b"VT"
+VERSION = 1
+HISTOGRAMS = ("capture", "send", "gc", "jitter")   # jitter: atraso del inicio de cada frame sobre el intervalo
+COUNTERS = ("frames", "sent", "network_errors", "dropped", "capture_errors", "free_memory")
+BUCKETS = 16
+
+REPORT_HEADER = struct.Struct(">2sBBII")
+REPORT_COUNTERS = struct.Struct(">" + "I" * len(COUNTERS))
+HISTOGRAM = struct.Struct(">III" + "H" * BUCKETS)
+REPORT_SIZE = REPORT_HEADER.size + REPORT_COUNTERS.size + HISTOGRAM.size * len(HISTOGRAMS)
+
+def bucket_index(us):
+    i = 0
+    us >>= 6
+    while us and i < BUCKETS - 1:
+        us >>= 1
+        i += 1
+    return i
+
+def bucket_bound(i):
+    # Límite superior (exclusivo) del bucket i en µs; None para el último.
+    return 64 << i if i < BUCKETS - 1 else None
+
+def encode_report(seq, period_ms, counters, histograms):
+    # counters: valores en el orden de COUNTERS. histograms: por cada nombre
+    # de HISTOGRAMS, (cuenta, suma µs, máximo µs, conteos por bucket).
+    body = bytearray(REPORT_SIZE)
+    REPORT_HEADER.pack_into(body, 0, MAGIC, VERSION, len(HISTOGRAMS), seq, period_ms)
+    REPORT_COUNTERS.pack_into(body, REPORT_HEADER.size, *counters)
+    offset = REPORT_HEADER.size + REPORT_COUNTERS.size
+    for count, total, peak, buckets in histograms:
+        HISTOGRAM.pack_into(body, offset, min(count, 0xFFFFFFFF), min(total, 0xFFFFFFFF), min(peak, 0xFFFFFFFF),
+                            *[min(b, 0xFFFF) for b in buckets])
+        offset += HISTOGRAM.size
+    return bytes(body)
+
+def _percentile_ms(buckets, count, peak, q):
+    # Límite superior del bucket donde cae el percentil q, sin pasar del máximo.
+    target = q * count
+    cumulative = 0
+    for i, n in enumerate(buckets):
+        cumulative += n
+        if cumulative >= target:
+            bound = bucket_bound(i)
+            return round((peak if bound is None else min(bound, peak)) / 1000, 3)
+    return round(peak / 1000, 3)
+
+def decode_report(body):
+    # Devuelve el reporte como dict listo para JSON. ValueError si el cuerpo
+    # no es un reporte de esta versión.
+    if len(body) != REPORT_SIZE:
+        raise ValueError("Reporte de telemetría con tamaño incorrecto.")
+    magic, version, histograms, seq, period_ms = REPORT_HEADER.unpack_from(body)
+    if magic != MAGIC or version != VERSION or histograms != len(HISTOGRAMS):
+        raise ValueError("Reporte de telemetría inválido.")
+    report = {"seq": seq, "period_ms": period_ms,
+              "counters": dict(zip(COUNTERS, REPORT_COUNTERS.unpack_from(body, REPORT_HEADER.size)))}
+    offset = REPORT_HEADER.size + REPORT_COUNTERS.size
+    for name in HISTOGRAMS:
+        count, total, peak, *buckets = HISTOGRAM.unpack_from(body, offset)
+        offset += HISTOGRAM.size
+        report[name] = {
+            "count": count,
+            "mean_ms": round(total / count / 1000, 3) if count else None,
+            "p50_ms": _percentile_ms(buckets, count, peak, 0.5) if count else None,
+            "p95_ms": _percentile_ms(buckets, count, peak, 0.95) if count else None,
+            "max_ms": round(peak / 1000, 3) if count else None,
+            "buckets": buckets,
+        }
+    return report
+
+class TelemetryStore:
+    # Serie de tiempo por cámara: los últimos capacity reportes, cada uno con
+    # la hora de llegada en "time".
+    def __init__(self, capacity=360):
+        self.capacity = capacity
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def add(self, device_id, report, now=None):
+        report["time"] = time.time() if now is None else now
+        with self.lock:
+            series = self.series.get(device_id)
+            if series is None:
+                series = self.series[device_id] = collections.deque(maxlen=self.capacity)
+            series.append(report)
+
+    def get(self, device_id, since=None):
+        # Reportes llegados después de since, o None si la cámara nunca mandó.
+        with self.lock:
+            series = self.series.get(device_id)
+            if series is None:
+                return None
+            return [r for r in series if since is None or r["time"] > since]
+
+    def latest(self):
+        with self.lock:
+            return {device_id: series[-1] for device_id, series in self.series.items() if series}
@@ -0,0 +1,48 @@
+import http.client
+import os
+import threading
+import time
+
+import pytest
+from werkzeug.serving import make_server
+
+@pytest.fixture(scope="module")
+def servidor(tmp_path_factory):
+    # SERVERUNIDO crea sus carpetas al importarse: se importa dentro de un
+    # directorio temporal.
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("servidor"))
+    try:
+        import SERVERUNIDO
+        yield SERVERUNIDO
+    finally:
+        os.chdir(cwd)
+
+def frame_rgb565(width, height):
+    return width.to_bytes(2, "big") + height.to_bytes(2, "big") + bytes(range(256)) * (width * height * 2 // 256)
+
+def test_streamed_upload_publishes_bytes(servidor):
+    encoder = servidor.stream_encoder(frame_rgb565(16, 8)[:4], 4 + 16 * 8 * 2)
+    encoder.write(frame_rgb565(16, 8)[4:])
+    frame = servidor.finish_stream(encoder, 4 + 16 * 8 * 2, received=time.time())
+    assert type(frame.bmp) is bytes
+
+def test_bmp_served_through_wsgi_server(servidor):
+    # El cliente de pruebas de Flask acepta cuerpos bytearray; un servidor
+    # WSGI real no.
+    server = make_server("127.0.0.1", 0, servidor.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+        conn.request("POST", "/upload_raw_image_flash/", body=frame_rgb565(16, 8))
+        res = conn.getresponse()
+        body = res.read()
+        assert res.status == 200, body
+        filename = servidor.frame_ring.latest().filename
+        conn.request("GET", f"/image/{filename}?format=bmp")
+        res = conn.getresponse()
+        body = res.read()
+        assert res.status == 200
+        assert body[:2] == b"BM" and len(body) == int(res.getheader("Content-Length"))
+    finally:
+        server.shutdown()